@@ -0,0 +1,129 @@
+"""Cache em memória da biblioteca serializada, invalidado pela versão da biblioteca"""
+import threading
+import time
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def sort_key(item: dict) -> Tuple[str, int]:
+    """Mesma ordenação das listas no banco: (título, id)"""
+    return (item["title"] or "", item["id"])
+
+
+class LibrarySnapshot:
+    """Biblioteca inteira já serializada (URLs resolvidas) em uma versão"""
+
+    def __init__(self, version: int, items: List[dict]):
+        self.version = version
+        self.items = sorted(items, key=sort_key)
+        self.by_id: Dict[int, dict] = {item["id"]: item for item in self.items}
+        self._views: Dict[str, Tuple[List[dict], List[Tuple[str, int]]]] = {}
+        self._lock = threading.Lock()
+
+    def view(self, name: str, predicate: Optional[Callable[[dict], bool]] = None):
+        """Itens (e chaves de ordenação) de uma visão filtrada, calculada uma vez por versão"""
+        cached = self._views.get(name)
+        if cached is None:
+            with self._lock:
+                cached = self._views.get(name)
+                if cached is None:
+                    items = self.items if predicate is None else [i for i in self.items if predicate(i)]
+                    cached = (items, [sort_key(i) for i in items])
+                    self._views[name] = cached
+        return cached
+
+    def page(self, name: str, predicate, after: Optional[Tuple[str, int]], limit: Optional[int]):
+        """Página da visão após a chave dada; retorna (itens, há_mais)"""
+        items, keys = self.view(name, predicate)
+        start = bisect_right(keys, after) if after is not None else 0
+        if not limit:
+            return items[start:], False
+        return items[start:start + limit], start + limit < len(items)
+
+
+class LibraryCache:
+    """
+    Guarda um LibrarySnapshot por processo.
+
+    A versão local (monotônica) é incrementada a cada escrita feita neste
+    processo, descartando o snapshot na hora. Escritas de outros processos
+    são percebidas relendo a versão do banco no máximo a cada
+    check_interval segundos.
+    """
+
+    def __init__(self, check_interval: float = 1.0, max_rows: int = 50000):
+        self.check_interval = check_interval
+        self.max_rows = max_rows
+        self.local_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._snapshot: Optional[LibrarySnapshot] = None
+        self._db_version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    def invalidate(self):
+        """Chamado após o commit de qualquer escrita na biblioteca"""
+        with self._lock:
+            self.local_version += 1
+            self._snapshot = None
+            self._db_version = None
+
+    def library_version(self, db, read_version: Callable) -> int:
+        """Versão da biblioteca no banco, relida no máximo a cada check_interval"""
+        now = time.monotonic()
+        with self._lock:
+            if self._db_version is not None and now - self._checked_at < self.check_interval:
+                return self._db_version
+            local_version = self.local_version
+        version = read_version(db)
+        with self._lock:
+            # Ignorar a leitura se houve invalidação enquanto o banco era consultado
+            if local_version == self.local_version:
+                if self._snapshot is not None and self._snapshot.version != version:
+                    self._snapshot = None
+                self._db_version = version
+                self._checked_at = now
+        return version
+
+    def snapshot(self, db, read_version: Callable, loader: Callable) -> Optional[LibrarySnapshot]:
+        """Snapshot atual, carregado com loader(db) se necessário (None se desativado)"""
+        if not self.enabled:
+            return None
+        version = self.library_version(db, read_version)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            return snapshot
+        with self._load_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            local_version = self.local_version
+            items = loader(db, self.max_rows)
+            if items is None:
+                # Biblioteca maior que o limite configurado: consultar o banco
+                return None
+            snapshot = LibrarySnapshot(version, items)
+            with self._lock:
+                if local_version == self.local_version:
+                    self._snapshot = snapshot
+        return snapshot
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "enabled": self.enabled,
+            "local_version": self.local_version,
+            "library_version": snapshot.version if snapshot else None,
+            "rows": len(snapshot.items) if snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,120 @@
+"""
+Formato NDJSON de exportação/importação do catálogo.
+
+Uma linha JSON por registro, cada uma com "kind": primeiro o cabeçalho,
+depois media, playlist, playlist_media e history, nessa ordem (assim a
+importação já conhece o id novo de tudo que uma linha referencia).
+"""
+import gzip
+import json
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from app.serialization import dumps
+
+FORMAT = "media-player-catalog"
+FORMAT_VERSION = 1
+KINDS = ("media", "playlist", "playlist_media", "history")
+# Campos de data convertidos de volta de ISO 8601 na importação
+DATETIME_FIELDS = ("created_at", "updated_at", "played_at")
+# Linhas acumuladas por bloco enviado na exportação
+LINES_PER_CHUNK = 500
+
+
+def header() -> dict:
+    return {"kind": "header", "format": FORMAT, "version": FORMAT_VERSION,
+            "exported_at": datetime.now().astimezone().isoformat()}
+
+
+def encode_lines(records: Iterable[dict]) -> Iterator[bytes]:
+    """Agrupa registros em blocos de NDJSON (menos chamadas de envio por linha)"""
+    chunk: List[bytes] = []
+    for record in records:
+        chunk.append(dumps(record))
+        if len(chunk) >= LINES_PER_CHUNK:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+def decode_record(line: bytes) -> Optional[dict]:
+    """Registro de uma linha (None para linhas em branco); datas voltam a ser datetime"""
+    line = line.strip()
+    if not line:
+        return None
+    record = json.loads(line)
+    if not isinstance(record, dict) or "kind" not in record:
+        raise ValueError("linha sem o campo 'kind'")
+    for name in DATETIME_FIELDS:
+        value = record.get(name)
+        if isinstance(value, str):
+            record[name] = datetime.fromisoformat(value)
+    return record
+
+
+def open_file(path: str, mode: str) -> BinaryIO:
+    """Arquivo binário para ler/gravar ('rb'/'wb'); .gz usa gzip e '-' a entrada/saída padrão"""
+    if path == "-":
+        stream = sys.stdin if mode.startswith("r") else sys.stdout
+        return stream.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class LineSplitter:
+    """Divide um corpo recebido em blocos arbitrários em linhas completas"""
+
+    def __init__(self, max_line: int = 16 * 1024 * 1024):
+        self.max_line = max_line
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        data = self._pending + chunk
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        if len(self._pending) > self.max_line:
+            raise ValueError("linha maior que o limite")
+        return lines
+
+    def finish(self) -> List[bytes]:
+        rest, self._pending = self._pending, b""
+        return [rest] if rest.strip() else []
+
+
+class IdMap:
+    """
+    id de origem -> id novo. Como a exportação sai em ordem de id, os pares
+    ficam em dois arrays de inteiros (16 bytes por linha, busca binária);
+    ids fora de ordem (arquivo editado à mão) vão para um dict.
+    """
+
+    def __init__(self):
+        self._source = array("q")
+        self._target = array("q")
+        self._unordered: Dict[int, int] = {}
+
+    def add(self, source: int, target: int):
+        if not self._source or source > self._source[-1]:
+            self._source.append(source)
+            self._target.append(target)
+        else:
+            self._unordered[source] = target
+
+    def get(self, source) -> Optional[int]:
+        if source is None:
+            return None
+        target = self._unordered.get(source)
+        if target is not None:
+            return target
+        index = bisect_left(self._source, source)
+        if index < len(self._source) and self._source[index] == source:
+            return self._target[index]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._source) + len(self._unordered)
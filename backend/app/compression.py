@@ -0,0 +1,150 @@
+"""Compressão negociada (brotli/gzip) de respostas JSON e texto acima de um tamanho mínimo"""
+import zlib
+from typing import Optional
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, apenas gzip
+    brotli = None
+
+# Só estes tipos são comprimidos; mídia e imagens (já comprimidas) nunca passam por aqui
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Blocos maiores que isto são comprimidos em thread para não travar o event loop
+THREAD_MIN_SIZE = 128 * 1024
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.partition(";")[0].strip().lower()
+    return content_type.endswith("+json") or content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def select_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Melhor codificação aceita pelo cliente ('br', 'gzip' ou None), respeitando q=0"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    for encoding in candidates:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            # Qualidade baixa/média: bem mais rápida e ainda menor que o gzip para JSON
+            self._br = brotli.Compressor(quality=min(level, 11), mode=brotli.MODE_TEXT)
+        else:
+            self._gzip = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gzip.compress(data)
+        # Em streaming, liberar o que já foi comprimido a cada bloco (ex.: NDJSON)
+        return out + self._gzip.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """
+    Comprime respostas de tipos textuais (JSON, NDJSON, texto) quando o cliente
+    aceita br/gzip e o corpo passa de minimum_size bytes. Respostas parciais
+    (206), já codificadas ou de outros tipos passam intactas.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding"))
+
+        start_message: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                eligible = (
+                    message["status"] not in (204, 206, 304)
+                    and "content-encoding" not in headers
+                    and is_compressible(headers.get("content-type", ""))
+                )
+                if not eligible:
+                    passthrough = True
+                    await send(message)
+                    return
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Adiar o início até saber o tamanho do primeiro bloco
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                level = self.brotli_quality if encoding == "br" else self.gzip_level
+                compressor = _Compressor(encoding, level)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["content-encoding"] = encoding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    compressed = await self._compress(compressor, body, final=True)
+                    headers["content-length"] = str(len(compressed))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                await send(start_message)
+            await send({
+                "type": "http.response.body",
+                "body": await self._compress(compressor, body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _compress(compressor: _Compressor, body: bytes, final: bool) -> bytes:
+        if len(body) >= THREAD_MIN_SIZE:
+            return await anyio.to_thread.run_sync(compressor.compress, body, final)
+        return compressor.compress(body, final)
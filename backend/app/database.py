@@ -0,0 +1,71 @@
+"""Engine, sessões e ajustes de conexão (SQLite com WAL ou PostgreSQL com pool)"""
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+
+def database_url() -> str:
+    """DATABASE_URL normalizada (o Render/Heroku ainda fornecem o prefixo postgres://)"""
+    url = os.getenv("DATABASE_URL", "sqlite:///./media_player.db")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+# Pragmas aplicados em cada nova conexão SQLite
+SQLITE_PRAGMAS = {
+    # Leitores não bloqueiam o escritor (e vice-versa)
+    "journal_mode": "WAL",
+    # Com WAL, NORMAL só perde as últimas transações numa queda de energia
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    # Esperar o lock em vez de falhar com "database is locked"
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    # Valor negativo = KiB de cache de páginas por conexão
+    "cache_size": str(-int(os.getenv("SQLITE_CACHE_KB", "20000"))),
+    "temp_store": "MEMORY",
+    "mmap_size": os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)),
+}
+
+
+def _pool_options() -> dict:
+    # Rotas rodam no pool de threads: até DB_POOL_SIZE + DB_MAX_OVERFLOW sessões simultâneas
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        options = {"connect_args": {"check_same_thread": False}}
+        if ":memory:" not in url and url not in ("sqlite://", "sqlite:///"):
+            options.update(_pool_options())
+        return options
+    return {
+        **_pool_options(),
+        # Reciclar antes que o servidor/proxy feche conexões ociosas
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
+def make_engine(url: str):
+    engine = create_engine(url, **_engine_options(url))
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+    return engine
+
+
+SQLALCHEMY_DATABASE_URL = database_url()
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
@@ -0,0 +1,164 @@
+"""
+Controle de admissão e de banda das transmissões de /media/file.
+
+- Limite de transmissões simultâneas, global e por cliente (IP): acima dele
+  a requisição recebe 429 com Retry-After na hora, sem esperar em fila.
+- Limite opcional de bytes/s por transmissão, depois de um trecho inicial
+  livre (o player enche o buffer rápido e depois segue no ritmo).
+- Prioridade para a API: as leituras de arquivo usam threads próprias (não
+  disputam o pool das rotas que acessam o banco) e, enquanto há rotas da API
+  ocupando esse pool, cada transmissão cede alguns milissegundos entre blocos.
+
+Os limites valem por processo: com WEB_CONCURRENCY=N o total é N vezes maior.
+Atrás de um proxy, o IP do cliente só é o real com FORWARDED_ALLOW_IPS no uvicorn.
+"""
+import os
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import anyio
+from anyio import to_thread
+from starlette.responses import JSONResponse
+
+from app import metrics
+
+# 0 desativa cada limite
+MAX_STREAMS = int(os.getenv("STREAM_MAX_ACTIVE", "64"))
+MAX_STREAMS_PER_CLIENT = int(os.getenv("STREAM_MAX_PER_CLIENT", "8"))
+RATE_LIMIT = int(os.getenv("STREAM_RATE_LIMIT", "0"))  # bytes/s por transmissão
+RATE_BURST = int(os.getenv("STREAM_RATE_BURST", str(2 * 1024 * 1024)))
+RETRY_AFTER = int(os.getenv("STREAM_RETRY_AFTER", "5"))
+IO_THREADS = int(os.getenv("STREAM_IO_THREADS", "16"))
+API_YIELD_MS = float(os.getenv("STREAM_API_YIELD_MS", "2"))
+
+
+class StreamRejected(Exception):
+    """Sem vaga para mais uma transmissão (global ou do cliente)"""
+
+    def __init__(self, reason: str, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def response(self) -> JSONResponse:
+        return JSONResponse(
+            {"detail": self.detail}, status_code=429,
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+class StreamTicket:
+    """Vaga ocupada por uma transmissão (devolvida em StreamGovernor.release)"""
+
+    __slots__ = ("client", "started", "sent")
+
+    def __init__(self, client: str):
+        self.client = client
+        self.started = time.monotonic()
+        self.sent = 0
+
+
+class StreamGovernor:
+    """
+    Vagas e ritmo das transmissões. Tudo roda no event loop (sem locks):
+    check() na rota, acquire/release/pace na resposta.
+    """
+
+    def __init__(self, max_streams: int = MAX_STREAMS, max_per_client: int = MAX_STREAMS_PER_CLIENT,
+                 rate_limit: int = RATE_LIMIT, rate_burst: int = RATE_BURST,
+                 retry_after: int = RETRY_AFTER, io_threads: int = IO_THREADS,
+                 api_yield_ms: float = API_YIELD_MS):
+        self.max_streams = max_streams
+        self.max_per_client = max_per_client
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.retry_after = retry_after
+        self.io_threads = io_threads
+        self.api_yield = api_yield_ms / 1000
+        self.active = 0
+        self._clients: Dict[str, int] = {}
+        self._io_limiter: Optional[anyio.CapacityLimiter] = None
+        self.admitted = 0
+        self.rejected = Counter()
+        self.delayed = Counter()  # segundos de pausa: "rate" (limite de banda) ou "api" (prioridade)
+
+    def check(self, client: str):
+        """Recusa logo (antes de consultar o banco) quando já não há vaga"""
+        if self.max_streams and self.active >= self.max_streams:
+            self._reject("global", "Limite de transmissões simultâneas atingido; tente novamente em instantes")
+        if self.max_per_client and self._clients.get(client, 0) >= self.max_per_client:
+            self._reject("client", "Limite de transmissões simultâneas deste cliente atingido")
+
+    def _reject(self, reason: str, detail: str):
+        self.rejected[reason] += 1
+        metrics.media_stream_rejections.labels(reason).inc()
+        raise StreamRejected(reason, detail, self.retry_after)
+
+    def acquire(self, client: str) -> StreamTicket:
+        self.check(client)
+        self.active += 1
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self.admitted += 1
+        return StreamTicket(client)
+
+    def release(self, ticket: StreamTicket):
+        self.active -= 1
+        remaining = self._clients[ticket.client] - 1
+        if remaining:
+            self._clients[ticket.client] = remaining
+        else:
+            del self._clients[ticket.client]
+
+    @property
+    def io_limiter(self) -> anyio.CapacityLimiter:
+        # Criado no primeiro uso, já dentro do event loop
+        if self._io_limiter is None:
+            self._io_limiter = anyio.CapacityLimiter(max(1, self.io_threads))
+        return self._io_limiter
+
+    async def read(self, file, size: int) -> bytes:
+        """Lê do arquivo nas threads de streaming (não nas das rotas da API)"""
+        return await to_thread.run_sync(file.read, size, limiter=self.io_limiter)
+
+    @staticmethod
+    def api_busy() -> bool:
+        return to_thread.current_default_thread_limiter().borrowed_tokens > 0
+
+    async def pace(self, ticket: StreamTicket, sent: int):
+        """Depois de cada bloco: respeita o limite de banda e cede a vez às rotas da API"""
+        ticket.sent += sent
+        delay, reason = 0.0, None
+        if self.rate_limit > 0 and ticket.sent > self.rate_burst:
+            delay = ticket.started + (ticket.sent - self.rate_burst) / self.rate_limit - time.monotonic()
+            reason = "rate"
+        if delay <= 0 and self.api_yield > 0 and self.api_busy():
+            delay, reason = self.api_yield, "api"
+        if delay > 0:
+            self.delayed[reason] += delay
+            metrics.media_stream_delay.labels(reason).inc(delay)
+            await anyio.sleep(delay)
+
+    def status(self, top: int = 20) -> dict:
+        clients = sorted(self._clients.items(), key=lambda item: (-item[1], item[0]))
+        io = self._io_limiter
+        return {
+            "limits": {
+                "max_streams": self.max_streams,
+                "max_streams_per_client": self.max_per_client,
+                "rate_limit": self.rate_limit,
+                "rate_burst": self.rate_burst,
+                "retry_after": self.retry_after,
+                "io_threads": self.io_threads,
+                "api_yield_ms": self.api_yield * 1000,
+            },
+            "active": self.active,
+            "clients": len(clients),
+            "top_clients": [{"client": c, "streams": n} for c, n in clients[:top]],
+            "io_threads_busy": io.borrowed_tokens if io is not None else 0,
+            "io_reads_waiting": io.statistics().tasks_waiting if io is not None else 0,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "delay_seconds": {reason: round(seconds, 3) for reason, seconds in self.delayed.items()},
+        }
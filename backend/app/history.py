@@ -0,0 +1,161 @@
+"""Buffer em memória para eventos de reprodução, gravados em lote"""
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app import metrics
+
+# (media_id, posição, horário)
+HistoryEvent = Tuple[int, float, object]
+
+
+class HistoryBuffer:
+    """
+    Acumula eventos de reprodução e chama flush_fn(eventos) em uma thread
+    própria a cada `interval` segundos ou quando `max_events` é atingido.
+
+    Um lote que falha volta ao buffer; depois de `max_retries` falhas
+    seguidas os eventos são gravados um a um e os que ainda falham são
+    descartados (um evento inválido não trava os demais). Com mais de
+    `max_pending` eventos (banco fora do ar), os mais antigos são descartados.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[HistoryEvent]], None],
+        interval: float = 2.0,
+        max_events: int = 500,
+        max_retries: int = 5,
+        max_pending: int = 50000,
+    ):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_events = max_events
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self._failures = 0
+        self._events: List[HistoryEvent] = []
+        self._latest: Dict[int, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = Counter()  # "overflow" (buffer cheio) ou "failed" (gravação falhando)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def add(self, media_id: int, position: float, played_at):
+        """Registra um evento (não bloqueia nem acessa o banco)"""
+        self.start()
+        with self._lock:
+            self._events.append((media_id, position, played_at))
+            self._latest[media_id] = (position, played_at)
+            self._trim()
+            full = len(self._events) >= self.max_events
+        if full:
+            self._wakeup.set()
+
+    def latest(self, media_id: int) -> Optional[Tuple[float, object]]:
+        """Última posição ainda não gravada para a mídia, se houver"""
+        with self._lock:
+            return self._latest.get(media_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Grava imediatamente os eventos pendentes"""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+            if not events:
+                return
+            try:
+                self.flush_fn(events)
+            except Exception as e:
+                self._failures += 1
+                print(f"Erro ao gravar histórico ({len(events)} eventos, tentativa {self._failures}): {e}")
+                if self._failures < self.max_retries:
+                    with self._lock:
+                        # Devolver ao buffer para a próxima tentativa
+                        self._events[:0] = events
+                        self._trim()
+                    return
+                self._failures = 0
+                failed = self._flush_each(events)
+                self._done(events, len(events) - len(failed))
+                if failed:
+                    print(f"Histórico: {len(failed)} eventos descartados após {self.max_retries} falhas")
+                self._drop("failed", failed)
+                return
+            self._failures = 0
+            self._done(events, len(events))
+
+    def _flush_each(self, events: List[HistoryEvent]) -> List[HistoryEvent]:
+        """Última tentativa, evento a evento; retorna os que falharam"""
+        failed = []
+        for event in events:
+            try:
+                self.flush_fn([event])
+            except Exception:
+                failed.append(event)
+        return failed
+
+    def _done(self, events: List[HistoryEvent], written: int):
+        with self._lock:
+            for media_id, position, played_at in events:
+                if self._latest.get(media_id) == (position, played_at):
+                    del self._latest[media_id]
+            self.flushed += written
+            self.flushes += 1
+
+    def _trim(self):
+        """Descarta os eventos mais antigos acima de max_pending (chamar com _lock)"""
+        overflow = len(self._events) - self.max_pending
+        if self.max_pending > 0 and overflow > 0:
+            dropped = self._events[:overflow]
+            del self._events[:overflow]
+            for media_id, position, played_at in dropped:
+                if self._latest.get(media_id) == (position, played_at):
+                    del self._latest[media_id]
+            self._drop("overflow", dropped)
+
+    def _drop(self, reason: str, events: List[HistoryEvent]):
+        if not events:
+            return
+        self.dropped[reason] += len(events)
+        metrics.history_events_dropped.labels(reason).inc(len(events))
+
+    def stop(self):
+        """Encerra a thread gravando o que restou"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "dropped": dict(self.dropped),
+        }
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
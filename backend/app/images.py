@@ -0,0 +1,266 @@
+"""Variantes redimensionadas (WebP/JPEG) de capas e thumbnails com cache LRU em disco e em memória"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Hashable, Optional
+
+from app import metrics
+from app.storage import UPLOAD_DIR, is_content_addressed
+
+DERIVED_DIR = UPLOAD_DIR / "derived"
+# Larguras geradas; pedidos intermediários usam a menor variante que os atende
+VARIANT_SIZES = (64, 256, 512)
+# Variantes geradas na ingestão da capa (as usadas nas listas do app)
+WARM_SIZES = (256,)
+MAX_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Imagens pequenas (capas, variantes) mantidas em memória, prontas para enviar
+MEMORY_CACHE_BYTES = int(os.getenv("IMAGE_MEMORY_CACHE_BYTES", str(32 * 1024 * 1024)))
+MEMORY_CACHE_MAX_ITEM = int(os.getenv("IMAGE_MEMORY_CACHE_MAX_ITEM", str(512 * 1024)))
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def select_size(requested: Optional[int]) -> Optional[int]:
+    """Menor variante que atende ao tamanho pedido (None = imagem original)"""
+    if not requested:
+        return None
+    for size in VARIANT_SIZES:
+        if requested <= size:
+            return size
+    return VARIANT_SIZES[-1]
+
+
+def select_format(accept: Optional[str]) -> str:
+    """WebP se o cliente aceitar, senão JPEG"""
+    if accept and "image/webp" in accept.lower():
+        return "webp"
+    return "jpeg"
+
+
+class DerivativeCache:
+    """Índice LRU dos arquivos derivados, limitado pelo total de bytes em disco"""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Reconstruir o índice a partir do disco (mais antigos primeiro)
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.directory.exists():
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+
+    def touch(self, name: str) -> bool:
+        """Marca o arquivo como usado; retorna False se não estiver em cache"""
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                return False
+            self._entries.move_to_end(name)
+            return True
+
+    def add(self, name: str, size: int):
+        """Registra um novo arquivo e remove os menos usados acima do limite"""
+        evicted = []
+        with self._lock:
+            self._load()
+            self._total += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            (self.directory / old_name).unlink(missing_ok=True)
+
+    def discard(self, name: str):
+        """Remove o arquivo do cache e do disco"""
+        with self._lock:
+            self._load()
+            self._total -= self._entries.pop(name, 0)
+        (self.directory / name).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"files": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+cache = DerivativeCache(DERIVED_DIR, MAX_CACHE_BYTES)
+
+
+class ImageAsset:
+    """Imagem pronta para servir; body só é carregado se couber no cache em memória"""
+    __slots__ = ("path", "media_type", "body", "etag")
+
+    def __init__(self, path: Path, media_type: str, body: Optional[bytes], etag: str):
+        self.path = path
+        self.media_type = media_type
+        self.body = body
+        self.etag = etag
+
+
+class MemoryCache:
+    """
+    LRU de ImageAsset em memória, limitado pelo total de bytes dos corpos.
+    Chaves: (diretório, nome do arquivo, tamanho da variante, formato, versão).
+    """
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries: "OrderedDict[Hashable, ImageAsset]" = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[ImageAsset]:
+        with self._lock:
+            asset = self._entries.get(key)
+            if asset is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.image_cache_requests.labels("miss" if asset is None else "hit").inc()
+        return asset
+
+    def put(self, key: Hashable, asset: ImageAsset):
+        if asset.body is None or len(asset.body) > self.max_item_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total -= len(previous.body)
+            self._entries[key] = asset
+            self._total += len(asset.body)
+            while self._total > self.max_bytes and self._entries:
+                _, old = self._entries.popitem(last=False)
+                self._total -= len(old.body)
+
+    def discard_file(self, name: str):
+        """Remove todas as entradas (original e variantes) de um arquivo"""
+        with self._lock:
+            for key in [key for key, asset in self._entries.items() if key[1] == name]:
+                self._total -= len(self._entries.pop(key).body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+memory_cache = MemoryCache(MEMORY_CACHE_BYTES, MEMORY_CACHE_MAX_ITEM)
+
+
+def asset_version(path: Path) -> Optional[str]:
+    """
+    Versão da imagem usada nas URLs (?v=): o próprio hash para nomes endereçados
+    por conteúdo, senão a data de modificação. None se o arquivo não existe.
+    """
+    if is_content_addressed(path.name):
+        return path.stem[:16]
+    try:
+        return format(path.stat().st_mtime_ns, "x")
+    except OSError:
+        return None
+
+
+def load_asset(source: Path, media_type: str) -> ImageAsset:
+    """Lê a imagem (se pequena) e calcula o ETag uma única vez; executar em thread"""
+    stat = source.stat()
+    if stat.st_size <= MEMORY_CACHE_MAX_ITEM:
+        body = source.read_bytes()
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        return ImageAsset(source, media_type, body, etag)
+    return ImageAsset(source, media_type, None, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"')
+
+
+def _variant_name(source: Path, size: int, fmt: str) -> str:
+    if is_content_addressed(source.name):
+        key = source.stem
+    else:
+        # Nome legado: incluir a data de modificação para não servir versões antigas
+        stat = source.stat()
+        key = hashlib.sha1(f"{source.as_posix()}:{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+    return f"{key}-{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def _render(source: Path, destination: Path, size: int, fmt: str) -> int:
+    from PIL import Image
+
+    pil_format, _, options = FORMATS[fmt]
+    with Image.open(source) as image:
+        image.draft("RGB", (size, size))
+        image = image.convert("RGBA" if fmt == "webp" and image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.thumbnail((size, size), Image.LANCZOS)
+        tmp_path = destination.parent / f".{uuid.uuid4().hex}.tmp"
+        try:
+            image.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, destination)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return destination.stat().st_size
+
+
+def get_variant(source: Path, size: int, fmt: str) -> Path:
+    """Caminho da variante (gerada na hora se não estiver em cache); executar em thread"""
+    name = _variant_name(source, size, fmt)
+    destination = DERIVED_DIR / name
+    if cache.touch(name) and destination.exists():
+        return destination
+    DERIVED_DIR.mkdir(parents=True, exist_ok=True)
+    cache.add(name, _render(source, destination, size, fmt))
+    return destination
+
+
+def media_type_for(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def warm_variants(source: Path):
+    """Gera antecipadamente as variantes mais usadas de uma imagem recém-ingerida"""
+    for size in WARM_SIZES:
+        for fmt in FORMATS:
+            try:
+                get_variant(source, size, fmt)
+            except Exception as e:
+                print(f"Erro ao gerar variante {size}px/{fmt} de {source}: {e}")
+                return
+
+
+def remove_variants(source_path: str):
+    """Apaga as variantes de uma imagem removida do armazenamento"""
+    source = Path(source_path)
+    memory_cache.discard_file(source.name)
+    if not is_content_addressed(source.name) or not DERIVED_DIR.exists():
+        return
+    for size in VARIANT_SIZES:
+        for fmt in FORMATS:
+            cache.discard(f"{source.stem}-{size}.{'jpg' if fmt == 'jpeg' else fmt}")
@@ -0,0 +1,111 @@
+"""Fila de tarefas em segundo plano com número limitado de workers"""
+import queue
+import threading
+from typing import Callable, List, Optional
+
+
+class JobQueue:
+    """
+    Pool de threads com fila limitada.
+
+    submit() nunca bloqueia: retorna False quando a fila está cheia,
+    deixando a decisão (rejeitar, tentar depois) para quem chamou.
+    """
+
+    def __init__(self, name: str, workers: int = 2, max_pending: int = 100):
+        self.name = name
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max(1, max_pending))
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def start(self):
+        """Inicia os workers (chamado automaticamente no primeiro submit)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> bool:
+        """Enfileira uma tarefa; retorna False se a fila estiver cheia"""
+        self.start()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            return False
+        return True
+
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize(),
+            "active": self._active,
+            "capacity": self._queue.maxsize,
+        }
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Processa o que já está na fila e encerra os workers"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            fn, args, kwargs = job
+            with self._lock:
+                self._active += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Erro na tarefa {getattr(fn, '__name__', fn)} ({self.name}): {e}")
+            finally:
+                with self._lock:
+                    self._active -= 1
+                self._queue.task_done()
+
+
+class PeriodicTask:
+    """Roda fn() em uma thread própria a cada `interval` segundos (o primeiro após `delay`)"""
+
+    def __init__(self, name: str, fn: Callable[[], None], interval: float, delay: float = 0.0):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.delay = delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        wait = self.delay
+        while not self._stop.wait(wait):
+            try:
+                self.fn()
+            except Exception as e:
+                print(f"Erro na tarefa {self.name}: {e}")
+            wait = self.interval
@@ -1,20 +1,41 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Query, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, event, insert, select, update, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Index, exists, func, literal_column, tuple_
+from sqlalchemy.orm import Session, aliased
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from collections import Counter
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
+from starlette.concurrency import run_in_threadpool
+from anyio import to_thread
 import os
-import shutil
+import time
 from pathlib import Path
-from mutagen import File as MutagenFile
-from PIL import Image
-import io
-import base64
 import urllib.parse
+from email.utils import formatdate
+
+from app import catalog, governor, images, metrics, play_stats, resumable, storage
+from app.cache import LibraryCache
+from app.compression import CompressionMiddleware
+from app.database import Base, SessionLocal, engine
+from app.history import HistoryBuffer
+from app.jobs import JobQueue, PeriodicTask
+from app.migrations import run_migrations
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    etag_matches,
+    library_etag,
+    parse_fields,
+)
+from app.search import detect_search_index, init_search_index, search_backend, search_media_ids
+from app.serialization import FAST_SERIALIZATION, FastJSONResponse
+from app.streaming import MediaFileResponse, guess_media_type
 
 # Fuso horário de Moçambique (UTC+2)
 MOZAMBIQUE_TZ = timezone(timedelta(hours=2))
@@ -23,12 +44,6 @@ def get_mozambique_time():
     """Retorna o horário atual de Moçambique (UTC+2)"""
     return datetime.now(MOZAMBIQUE_TZ)
 
-# Configuração do banco de dados
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./media_player.db")
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
 # Configuração da URL base da API
 # Remove barra final se existir para evitar duplo slash
 _api_url = os.getenv("API_BASE_URL", "http://localhost:8000")
@@ -45,10 +60,13 @@ class Media(Base):
     type = Column(String, nullable=False)  # 'video' ou 'audio'
     duration = Column(Float)
     size = Column(Integer)
-    path = Column(String, nullable=False)
+    path = Column(String, nullable=False, index=True)
     thumbnail_path = Column(String)
     cover = Column(String)  # URL da capa da música
     is_favorite = Column(Boolean, default=False)
+    status = Column(String, nullable=False, default="ready", server_default="ready")  # 'processing', 'ready' ou 'failed'
+    content_hash = Column(String)  # SHA-256 do arquivo
+    source_mtime = Column(Float)  # mtime do arquivo de origem (importação em lote)
     created_at = Column(DateTime, default=lambda: get_mozambique_time())
     updated_at = Column(DateTime, default=lambda: get_mozambique_time())
 
@@ -64,20 +82,198 @@ class PlaylistMedia(Base):
     __tablename__ = "playlist_media"
     
     id = Column(Integer, primary_key=True, index=True)
-    playlist_id = Column(Integer, nullable=False)
-    media_id = Column(Integer, nullable=False)
-    position = Column(Integer, default=0)
+    playlist_id = Column(Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False)
+    media_id = Column(Integer, ForeignKey("media.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Posições esparsas/fracionárias: mover um item só altera a linha dele
+    position = Column(Float, default=0)
+    
+    __table_args__ = (
+        Index("ix_playlist_media_playlist_position", "playlist_id", "position", "id"),
+    )
 
 class PlaybackHistory(Base):
     __tablename__ = "playback_history"
     
     id = Column(Integer, primary_key=True, index=True)
-    media_id = Column(Integer, nullable=False)
+    media_id = Column(Integer, nullable=False, index=True)
     position = Column(Float)
-    played_at = Column(DateTime, default=lambda: get_mozambique_time())
+    played_at = Column(DateTime, default=lambda: get_mozambique_time(), index=True)
+
+class ResumePosition(Base):
+    """Última posição de reprodução de cada mídia"""
+    __tablename__ = "resume_position"
+    
+    media_id = Column(Integer, primary_key=True)
+    position = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=lambda: get_mozambique_time())
+
+class MediaPlayStats(Base):
+    """Reproduções, tempo ouvido e última reprodução de cada mídia (ver app.play_stats)"""
+    __tablename__ = "media_play_stats"
+    
+    media_id = Column(Integer, primary_key=True)
+    play_count = Column(Integer, nullable=False, default=0)
+    listened_seconds = Column(Float, nullable=False, default=0)
+    last_played_at = Column(DateTime)
+    
+    __table_args__ = (
+        # Rankings "mais tocadas" e "tocadas recentemente" lidos direto do índice
+        Index("ix_media_play_stats_top", "play_count", "last_played_at"),
+        Index("ix_media_play_stats_recent", "last_played_at"),
+    )
+
+class TypePlayStats(Base):
+    """Totais de reprodução por tipo de mídia (audio/video)"""
+    __tablename__ = "type_play_stats"
+    
+    type = Column(String, primary_key=True)
+    play_count = Column(Integer, nullable=False, default=0)
+    listened_seconds = Column(Float, nullable=False, default=0)
+    last_played_at = Column(DateTime)
+
+class Blob(Base):
+    """Arquivo endereçado por conteúdo e quantas referências ele possui"""
+    __tablename__ = "blobs"
+    
+    path = Column(String, primary_key=True)
+    hash = Column(String, nullable=False, index=True)
+    size = Column(Integer)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=lambda: get_mozambique_time())
+
+class LibraryState(Base):
+    """Linha única com a versão da biblioteca (incrementada a cada escrita)"""
+    __tablename__ = "library_state"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Alterações com seq <= changes_floor já foram compactadas (cursores anteriores expiram)
+    changes_floor = Column(Integer, nullable=False, default=0, server_default="0")
+
+class MediaChange(Base):
+    """Registro de alterações das mídias, preenchido por gatilhos no banco (ver migrations.py)"""
+    __tablename__ = "media_changes"
+    
+    seq = Column(Integer, primary_key=True)
+    media_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # 'upsert' ou 'delete'
+    changed_at = Column(DateTime)  # UTC
+    
+    __table_args__ = (
+        Index("ix_media_changes_media_seq", "media_id", "seq"),
+        # Sem reaproveitar seq de linhas apagadas (senão clientes perderiam alterações)
+        {"sqlite_autoincrement": True},
+    )
+
+metrics.instrument_engine(engine)
+
+def dialect_insert(model):
+    """INSERT com suporte a ON CONFLICT (upsert) no SQLite e no PostgreSQL"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def acquire_blob(db: Session, path: str, digest: str, size: int, count: int = 1):
+    """Registra mais referências ao arquivo (cria o registro se for novo)"""
+    stmt = dialect_insert(Blob).values(
+        path=path, hash=digest, size=size, ref_count=count, created_at=get_mozambique_time()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.path], set_={"ref_count": Blob.ref_count + count}
+    )
+    db.execute(stmt)
 
-# Criar tabelas
-Base.metadata.create_all(bind=engine)
+def release_blob(db: Session, path: str) -> Optional[bool]:
+    """
+    Remove uma referência ao arquivo.
+    
+    Retorna True se não restou nenhuma (o arquivo deve ser apagado após o
+    commit), False se ainda é usado e None se o arquivo não é rastreado.
+    """
+    blob = db.get(Blob, path)
+    if not blob:
+        return None
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        return False
+    db.delete(blob)
+    return True
+
+def release_blobs(db: Session, counts: Counter) -> Tuple[List[str], List[str]]:
+    """
+    Remove várias referências de uma vez (caminho -> quantidade).
+    
+    Retorna (arquivos sem nenhuma referência restante, caminhos não rastreados).
+    """
+    blobs = {blob.path: blob for blob in db.query(Blob).filter(Blob.path.in_(list(counts)))}
+    orphaned = []
+    for path, count in counts.items():
+        blob = blobs.get(path)
+        if blob is None:
+            continue
+        blob.ref_count -= count
+        if blob.ref_count <= 0:
+            db.delete(blob)
+            orphaned.append(path)
+    return orphaned, [path for path in counts if path not in blobs]
+
+# Colunas da mídia que apontam para arquivos (possivelmente compartilhados)
+MEDIA_FILE_FIELDS = ("path", "cover", "thumbnail_path")
+
+def file_refs(*values) -> Counter:
+    """Referências a arquivos (caminho -> quantidade), ignorando valores vazios"""
+    return Counter(value for value in values if value)
+
+def adjust_blob_refs(db: Session, released: Counter, acquired: Counter) -> List[str]:
+    """
+    Troca referências quando o cliente grava path/cover/thumbnail_path
+    (caminho -> quantidade). Só arquivos rastreados na tabela blobs contam
+    (URLs externas e arquivos antigos ficam como estão); o saldo de cada
+    caminho é aplicado de uma vez, então trocar A por B e B por A não apaga
+    nada. Chamar sob storage.blob_lock até o commit; retorna os arquivos sem
+    referência restante (apagar depois com remove_stored_files).
+    """
+    net = Counter(acquired)
+    net.subtract(released)
+    changed = [path for path, delta in net.items() if delta]
+    if not changed:
+        return []
+    orphaned = []
+    for blob in db.query(Blob).filter(Blob.path.in_(changed)):
+        blob.ref_count += net[blob.path]
+        if blob.ref_count <= 0:
+            db.delete(blob)
+            orphaned.append(blob.path)
+    return orphaned
+
+def get_library_version(db: Session) -> int:
+    """Versão atual da biblioteca"""
+    return db.query(LibraryState.version).filter(LibraryState.id == 1).scalar() or 0
+
+def bump_library_version(db: Session):
+    """Incrementa a versão da biblioteca na transação corrente"""
+    db.query(LibraryState).filter(LibraryState.id == 1).update(
+        {LibraryState.version: LibraryState.version + 1}, synchronize_session=False
+    )
+    # O cache em memória é invalidado quando a transação for confirmada
+    db.info["library_changed"] = True
+
+# Cache da biblioteca serializada (LIBRARY_CACHE_MAX_ROWS=0 desativa)
+library_cache = LibraryCache(
+    check_interval=float(os.getenv("LIBRARY_CACHE_CHECK_INTERVAL", "1")),
+    max_rows=int(os.getenv("LIBRARY_CACHE_MAX_ROWS", "50000")),
+)
+
+@event.listens_for(SessionLocal, "after_commit")
+def invalidate_library_cache(session):
+    if session.info.pop("library_changed", False):
+        library_cache.invalidate()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_library_change(session):
+    session.info.pop("library_changed", None)
 
 # Modelos Pydantic
 class MediaBase(BaseModel):
@@ -101,8 +297,27 @@ class MediaUpdate(BaseModel):
     cover: Optional[str] = None
     is_favorite: Optional[bool] = None
 
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+
+class MediaIds(BaseModel):
+    ids: List[int]
+
+class MediaBulkFavorite(BaseModel):
+    ids: List[int]
+    is_favorite: bool
+
+class MediaBulkUpdateItem(MediaUpdate):
+    id: int
+
+class MediaBulkUpdate(BaseModel):
+    items: List[MediaBulkUpdateItem]
+
 class MediaResponse(MediaBase):
     id: int
+    status: str = "ready"
     created_at: datetime
     updated_at: datetime
     
@@ -123,8 +338,228 @@ class PlaylistResponse(PlaylistBase):
     class Config:
         from_attributes = True
 
+class PlaylistMediaAdd(BaseModel):
+    media_ids: List[int]
+
+class PlaylistMediaRemove(BaseModel):
+    entry_ids: List[int]
+
+class PlaylistReorder(BaseModel):
+    entry_ids: List[int]  # itens movidos, na ordem desejada
+    after_entry_id: Optional[int] = None  # None = início da playlist
+
+# Fila de extração de metadados (mutagen + capa) fora do event loop
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "2"))
+METADATA_QUEUE_SIZE = int(os.getenv("METADATA_QUEUE_SIZE", "100"))
+metadata_jobs = JobQueue("metadata", workers=METADATA_WORKERS, max_pending=METADATA_QUEUE_SIZE)
+
+# Remoção de arquivos de exclusões em lote, fora da requisição
+file_cleanup_jobs = JobQueue("file-cleanup", workers=1, max_pending=1000)
+
+# Histórico de reprodução gravado em lote
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2"))
+HISTORY_FLUSH_SIZE = int(os.getenv("HISTORY_FLUSH_SIZE", "500"))
+HISTORY_MAX_RETRIES = int(os.getenv("HISTORY_MAX_RETRIES", "5"))
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "50000"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+
+def write_history_events(events):
+    """Grava um lote de eventos: linhas de histórico + upsert da posição de retomada"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            PlaybackHistory.__table__.insert(),
+            [{"media_id": m, "position": p, "played_at": t} for m, p, t in events],
+        )
+        # Apenas o evento mais recente de cada mídia vai para resume_position
+        latest = {}
+        for media_id, position, played_at in events:
+            latest[media_id] = (position, played_at)
+        # Evento anterior de cada mídia (lido antes da atualização) para as estatísticas
+        previous = {
+            row.media_id: (row.position, row.updated_at)
+            for row in db.query(ResumePosition).filter(ResumePosition.media_id.in_(list(latest)))
+        }
+        stmt = dialect_insert(ResumePosition)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ResumePosition.media_id],
+            set_={"position": stmt.excluded.position, "updated_at": stmt.excluded.updated_at},
+        )
+        db.execute(stmt, [
+            {"media_id": m, "position": p, "updated_at": t} for m, (p, t) in latest.items()
+        ])
+        record_play_stats(db, events, previous)
+        db.commit()
+    finally:
+        db.close()
+
+def upsert_play_stats(db: Session, model, key_column, rows: List[dict]):
+    """Soma reproduções/tempo às linhas existentes (ou cria) e mantém a última reprodução"""
+    stmt = dialect_insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key_column],
+        set_={
+            "play_count": model.play_count + stmt.excluded.play_count,
+            "listened_seconds": model.listened_seconds + stmt.excluded.listened_seconds,
+            "last_played_at": case(
+                (model.last_played_at.is_(None) | (stmt.excluded.last_played_at > model.last_played_at),
+                 stmt.excluded.last_played_at),
+                else_=model.last_played_at,
+            ),
+        },
+    )
+    db.execute(stmt, rows)
+
+def record_play_stats(db: Session, events, previous: dict):
+    """
+    Atualiza as estatísticas materializadas com um lote do histórico (mesma
+    transação). previous: último evento já gravado de cada mídia do lote.
+    """
+    media_ids = {media_id for media_id, _, _ in events}
+    types = dict(db.query(Media.id, Media.type).filter(Media.id.in_(list(media_ids))).all())
+    per_media, per_type = play_stats.aggregate(events, types, previous)
+    # Linhas em ordem fixa: lotes concorrentes travam na mesma ordem (sem deadlock no PostgreSQL)
+    if per_media:
+        upsert_play_stats(db, MediaPlayStats, MediaPlayStats.media_id, [
+            {"media_id": k, "play_count": c, "listened_seconds": s, "last_played_at": t}
+            for k, (c, s, t) in sorted(per_media.items())
+        ])
+    if per_type:
+        upsert_play_stats(db, TypePlayStats, TypePlayStats.type, [
+            {"type": k, "play_count": c, "listened_seconds": s, "last_played_at": t}
+            for k, (c, s, t) in sorted(per_type.items())
+        ])
+
+def compact_history():
+    """Apaga linhas de histórico mais antigas que HISTORY_RETENTION_DAYS (as posições de retomada ficam)"""
+    if HISTORY_RETENTION_DAYS <= 0:
+        return
+    cutoff = get_mozambique_time() - timedelta(days=HISTORY_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        deleted = db.query(PlaybackHistory).filter(PlaybackHistory.played_at < cutoff).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        if deleted:
+            print(f"Histórico compactado: {deleted} registros antigos removidos")
+    finally:
+        db.close()
+
+# Exclusões ficam no registro de alterações por este período (cursores mais antigos expiram)
+CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", "30"))
+
+def compact_media_changes():
+    """Mantém só a alteração mais recente de cada mídia e descarta exclusões antigas"""
+    db = SessionLocal()
+    try:
+        newer = aliased(MediaChange)
+        superseded = db.query(MediaChange).filter(
+            exists().where(newer.media_id == MediaChange.media_id, newer.seq > MediaChange.seq)
+        ).delete(synchronize_session=False)
+        expired = 0
+        if CHANGES_RETENTION_DAYS > 0:
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=CHANGES_RETENTION_DAYS)
+            old_deletes = db.query(MediaChange).filter(MediaChange.op == "delete", MediaChange.changed_at < cutoff)
+            floor = old_deletes.with_entities(func.max(MediaChange.seq)).scalar()
+            if floor:
+                expired = old_deletes.delete(synchronize_session=False)
+                db.query(LibraryState).filter(LibraryState.id == 1, LibraryState.changes_floor < floor).update(
+                    {LibraryState.changes_floor: floor}, synchronize_session=False
+                )
+        db.commit()
+        if superseded or expired:
+            print(f"Registro de alterações compactado: {superseded} substituídas, {expired} exclusões expiradas")
+    finally:
+        db.close()
+
+def run_maintenance():
+    compact_history()
+    compact_media_changes()
+    removed = resumable.collect_expired()
+    if removed:
+        print(f"Uploads retomáveis expirados removidos: {removed}")
+
+history_buffer = HistoryBuffer(
+    write_history_events,
+    interval=HISTORY_FLUSH_INTERVAL,
+    max_events=HISTORY_FLUSH_SIZE,
+    max_retries=HISTORY_MAX_RETRIES,
+    max_pending=HISTORY_MAX_PENDING,
+)
+
+# Manutenção periódica em todo worker, com ou sem tráfego (iniciada no lifespan)
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+maintenance_task = PeriodicTask(
+    "maintenance", run_maintenance,
+    interval=MAINTENANCE_INTERVAL, delay=min(60.0, MAINTENANCE_INTERVAL),
+)
+
+# Filas internas também expostas em /metrics
+metrics.registry.register(metrics.Gauge(
+    "metadata_jobs_pending", "Mídias aguardando extração de metadados",
+    function=lambda: metadata_jobs.stats()["pending"]))
+metrics.registry.register(metrics.Gauge(
+    "history_events_pending", "Eventos de reprodução ainda não gravados",
+    function=history_buffer.pending))
+metrics.registry.register(metrics.Gauge(
+    "image_memory_cache_bytes", "Bytes de imagens no cache em memória",
+    function=lambda: images.memory_cache.stats()["bytes"]))
+
+# Vagas e ritmo das transmissões de /media/file (limites em app.governor)
+stream_governor = governor.StreamGovernor()
+metrics.registry.register(metrics.Gauge(
+    "media_stream_clients", "Clientes com transmissões em andamento",
+    function=lambda: stream_governor.status(top=0)["clients"]))
+
+# Threads para as rotas síncronas (toda rota que usa o banco é `def` e roda fora do event loop)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Definida por run.py depois de chamar prepare(): os workers pulam esse passo
+PREPARED_ENV = "APP_PREPARED"
+
+def prepare():
+    """
+    Passo único de inicialização: diretórios de upload, esquema do banco
+    (migrações versionadas) e índice de busca. Com vários workers, roda uma
+    vez no processo principal antes de iniciá-los.
+    """
+    for directory in (UPLOAD_DIR, storage.BLOB_DIR, storage.COVERS_DIR, storage.THUMBNAILS_DIR, storage.TMP_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+    run_migrations(engine, Base.metadata)
+    init_search_index(engine)
+
+def requeue_pending_media() -> int:
+    """Reenfileira mídias que ficaram em processamento (ex.: reinício do servidor)"""
+    db = SessionLocal()
+    try:
+        pending = [row.id for row in db.query(Media.id).filter(Media.status == "processing")]
+    finally:
+        db.close()
+    for media_id in pending:
+        metadata_jobs.submit(process_media_metadata, media_id)
+    return len(pending)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if os.getenv(PREPARED_ENV) != "1":
+        # Processo único (ex.: uvicorn app.main:app direto)
+        await run_in_threadpool(prepare)
+        await run_in_threadpool(requeue_pending_media)
+    else:
+        # O processo principal já criou o índice: cada worker só precisa detectá-lo
+        await run_in_threadpool(detect_search_index, engine)
+    maintenance_task.start()
+    yield
+    maintenance_task.stop(timeout=30)
+    history_buffer.stop()
+    metadata_jobs.shutdown(timeout=30)
+    file_cleanup_jobs.shutdown(timeout=30)
+
 # Inicializar FastAPI
-app = FastAPI(title="Media Player API", version="1.0.0")
+app = FastAPI(title="Media Player API", version="1.0.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
 # Configurar CORS
 app.add_middleware(
@@ -133,9 +568,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Location", "Upload-Offset", "Upload-Length", "Upload-Ranges", "Upload-Expires"],
 )
+# Respostas JSON/texto comprimidas (br/gzip) acima de COMPRESSION_MIN_SIZE bytes; 0 desativa
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+if COMPRESSION_MIN_SIZE > 0:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "5")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Dependency para obter sessão do banco
+# Dependency para obter sessão do banco (uma por requisição, aberta e fechada
+# no pool de threads junto com a rota; nenhuma consulta roda no event loop)
 def get_db():
     db = SessionLocal()
     try:
@@ -145,7 +592,6 @@ def get_db():
 
 # Diretório para uploads
 UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 
 # Função auxiliar para converter path em URL da API
 def format_media_path(path: str, media_id: int = None) -> str:
@@ -156,6 +602,14 @@ def format_media_path(path: str, media_id: int = None) -> str:
             return f"{API_BASE_URL}/media/file/{media_id}"
     return path
 
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def image_url(base: str, image_path: Path, encoded_filename: str) -> str:
+    """URL da imagem com ?v=<versão>: muda junto com o conteúdo, então pode ficar em cache para sempre"""
+    version = images.asset_version(image_path)
+    url = f"{API_BASE_URL}/uploads/{base}/{encoded_filename}"
+    return f"{url}?v={version}" if version else url
+
 def format_cover_path(cover_path: str) -> str:
     """Converte path de capa em URL da API"""
     if not cover_path:
@@ -167,7 +621,7 @@ def format_cover_path(cover_path: str) -> str:
         # URL-encode o filename para lidar com caracteres especiais
         from urllib.parse import quote
         encoded_filename = quote(filename)
-        return f"{API_BASE_URL}/uploads/covers/{encoded_filename}"
+        return image_url("covers", storage.COVERS_DIR / filename, encoded_filename)
     return cover_path
 
 def format_thumbnail_path(thumbnail_path: str) -> str:
@@ -181,12 +635,18 @@ def format_thumbnail_path(thumbnail_path: str) -> str:
         # Codificar novamente para evitar que FastAPI decodifique
         from urllib.parse import quote
         encoded_filename = quote(filename, safe='')
-        return f"{API_BASE_URL}/uploads/thumbnails/{encoded_filename}"
+        return image_url("thumbnails", storage.THUMBNAILS_DIR / filename, encoded_filename)
     return thumbnail_path
 
 # Função para extrair metadados de arquivos de áudio
-def extract_audio_metadata(file_path: Path) -> dict:
-    """Extrai metadados (título, artista, duração, capa) de arquivo de áudio"""
+def extract_audio_metadata(file_path: Path, store_cover: bool = True) -> dict:
+    """
+    Extrai metadados (título, artista, duração, capa) de arquivo de áudio.
+    Com store_cover=False a capa não é gravada: vem em bytes em 'cover_data'
+    (para gravá-la sob storage.blob_lock junto com o commit da referência).
+    """
+    # Importado só no primeiro uso (acelera a inicialização dos workers)
+    from mutagen import File as MutagenFile
     try:
         audio_file = MutagenFile(str(file_path))
         
@@ -214,10 +674,13 @@ def extract_audio_metadata(file_path: Path) -> dict:
         # Extrair capa (album art)
         if 'APIC:' in audio_file:
             apic = audio_file['APIC:'].data
-            # Salvar capa como imagem
-            cover_path = save_cover_image(apic, file_path)
-            if cover_path:
-                metadata['cover'] = cover_path
+            if not store_cover:
+                metadata['cover_data'] = apic
+            else:
+                # Salvar capa como imagem
+                cover_path = save_cover_image(apic)
+                if cover_path:
+                    metadata['cover'] = cover_path
         
         return metadata
         
@@ -225,31 +688,237 @@ def extract_audio_metadata(file_path: Path) -> dict:
         print(f"Erro ao extrair metadados: {e}")
         return {}
 
-def save_cover_image(image_data: bytes, audio_file_path: Path) -> Optional[str]:
-    """Salva a capa extraída como arquivo imagem"""
+def save_cover_image(image_data: bytes) -> Optional[str]:
+    """Salva a capa extraída como arquivo imagem (nome = hash do conteúdo)"""
     try:
-        # Criar diretório de capas se não existir
-        covers_dir = Path("uploads/covers")
-        covers_dir.mkdir(exist_ok=True, parents=True)
-        
-        # Nome do arquivo baseado no nome do áudio (decodificar se URL-encoded)
-        base_name = audio_file_path.stem
-        # Decodificar se estiver URL-encoded
-        if '%' in base_name:
-            base_name = urllib.parse.unquote(base_name)
-        cover_path = covers_dir / f"{base_name}.jpg"
-        
-        # Salvar imagem
-        with open(cover_path, 'wb') as f:
-            f.write(image_data)
+        # Capas iguais (mesmo álbum) são gravadas uma única vez
+        cover_path, _ = storage.store_bytes(
+            image_data, storage.COVERS_DIR, storage.image_suffix(image_data)
+        )
         
         # Retornar URL relativa
-        return f"uploads/covers/{base_name}.jpg"
+        return cover_path.as_posix()
         
     except Exception as e:
         print(f"Erro ao salvar capa: {e}")
         return None
 
+def process_media_metadata(media_id: int):
+    """Tarefa em segundo plano: extrai metadados/capa e completa o registro da mídia"""
+    db = SessionLocal()
+    try:
+        db_media = db.query(Media).filter(Media.id == media_id).first()
+        if not db_media:
+            return
+        started = time.perf_counter()
+        cover_data = None
+        try:
+            metadata = extract_audio_metadata(Path(db_media.path), store_cover=False)
+            cover_data = metadata.pop('cover_data', None)
+            print(f"Metadados extraídos: {metadata}")
+            if metadata.get('title'):
+                db_media.title = metadata['title']
+            if metadata.get('artist'):
+                db_media.artist = metadata['artist']
+            if metadata.get('duration'):
+                db_media.duration = metadata['duration']
+            db_media.status = "ready"
+            metrics.metadata_latency.labels("ok").observe(time.perf_counter() - started)
+        except Exception as e:
+            metrics.metadata_latency.labels("failed").observe(time.perf_counter() - started)
+            print(f"Erro ao processar mídia {media_id}: {e}")
+            db.rollback()
+            db_media = db.query(Media).filter(Media.id == media_id).first()
+            if not db_media:
+                return
+            db_media.status = "failed"
+        db_media.updated_at = get_mozambique_time()
+        bump_library_version(db)
+        # Capa gravada e referenciada sem que uma exclusão a apague no meio
+        with storage.blob_lock():
+            cover = save_cover_image(cover_data) if cover_data else None
+            if cover and cover != db_media.cover:
+                acquire_blob(db, cover, Path(cover).stem, len(cover_data))
+                db_media.cover = cover
+            else:
+                cover = None
+            db.commit()
+        if cover:
+            images.warm_variants(Path(cover))
+    finally:
+        db.close()
+
+MEDIA_FIELDS = list(MediaResponse.model_fields)
+
+def jsonable(items):
+    """jsonable_encoder, dispensável no caminho rápido (o codificador aceita datas)"""
+    return items if FAST_SERIALIZATION else jsonable_encoder(items)
+
+def format_media_fields(row, fields: List[str]) -> dict:
+    """Serializa apenas os campos pedidos, convertendo paths em URLs"""
+    item = {}
+    for name in fields:
+        value = getattr(row, name)
+        if value:
+            if name == "path":
+                value = format_media_path(value, row.id)
+            elif name == "cover":
+                value = format_cover_path(value)
+            elif name == "thumbnail_path":
+                value = format_thumbnail_path(value)
+        item[name] = value
+    return item
+
+def serialize_media(m: Media) -> dict:
+    """Representação JSON de uma mídia com paths convertidos em URLs (sem alterar o objeto ORM)"""
+    if FAST_SERIALIZATION:
+        # Dados do próprio banco: copiar os atributos sem validar com Pydantic
+        item = {name: getattr(m, name) for name in MEDIA_FIELDS}
+    else:
+        item = MediaResponse.model_validate(m).model_dump(mode="json")
+    if item["path"]:
+        item["path"] = format_media_path(item["path"], item["id"])
+    if item["cover"]:
+        item["cover"] = format_cover_path(item["cover"])
+    if item["thumbnail_path"]:
+        item["thumbnail_path"] = format_thumbnail_path(item["thumbnail_path"])
+    return item
+
+def load_library_items(db: Session, max_rows: int) -> Optional[List[dict]]:
+    """Carrega a biblioteca inteira para o cache (None se exceder max_rows)"""
+    if db.query(func.count(Media.id)).scalar() > max_rows:
+        return None
+    return [serialize_media(m) for m in db.query(Media).all()]
+
+def get_library_snapshot(db: Session):
+    """Snapshot em memória da biblioteca (None se o cache estiver desativado)"""
+    return library_cache.snapshot(db, get_library_version, load_library_items)
+
+def list_media(request: Request, response: Response, db: Session, criteria: list,
+               limit: Optional[int], cursor: Optional[str], fields: Optional[str],
+               view: Optional[str] = None, predicate=None):
+    """
+    Lista mídias ordenadas por (título, id) com paginação por cursor,
+    projeção de campos e ETag baseado na versão da biblioteca.
+    
+    Com view= (e predicate equivalente aos critérios SQL), a lista é servida
+    do snapshot em memória sem consultar o banco.
+    """
+    etag = library_etag(library_cache.library_version(db, get_library_version))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    requested = parse_fields(fields, MEDIA_FIELDS)
+    snapshot = get_library_snapshot(db) if view else None
+    if snapshot:
+        headers["ETag"] = library_etag(snapshot.version)
+        after = None
+        if cursor:
+            last_title, last_id = decode_cursor(cursor, 2)
+            after = (last_title, last_id)
+            limit = limit or DEFAULT_PAGE_SIZE
+        items, has_more = snapshot.page(view, predicate, after, limit)
+        if has_more:
+            headers["X-Next-Cursor"] = encode_cursor([items[-1]["title"] or "", items[-1]["id"]])
+        if requested:
+            items = [{name: item[name] for name in requested} for item in items]
+        return FastJSONResponse(items, headers=headers)
+    
+    # Literal '' (e não parâmetro) para o banco usar os índices de (título, id)
+    sort_key = func.coalesce(Media.title, literal_column("''"))
+    if requested:
+        columns = dict.fromkeys(["id", "title"] + requested)
+        query = db.query(*[getattr(Media, name) for name in columns])
+    else:
+        query = db.query(Media)
+    query = query.filter(*criteria)
+    
+    if cursor:
+        last_title, last_id = decode_cursor(cursor, 2)
+        query = query.filter(tuple_(sort_key, Media.id) > tuple_(last_title, last_id))
+        limit = limit or DEFAULT_PAGE_SIZE
+    query = query.order_by(sort_key, Media.id)
+    
+    if limit:
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_cursor([rows[-1].title or "", rows[-1].id])
+    else:
+        rows = query.all()
+    
+    return media_list_response(rows, requested, response, headers)
+
+def media_list_response(rows, requested: Optional[List[str]], response: Response, headers: dict):
+    """Serializa uma lista de mídias (completa ou projetada) com os cabeçalhos dados"""
+    if requested:
+        items = [format_media_fields(row, requested) for row in rows]
+        return FastJSONResponse(jsonable(items), headers=headers)
+    if FAST_SERIALIZATION:
+        return FastJSONResponse([serialize_media(m) for m in rows], headers=headers)
+    
+    # Converter paths para URLs da API
+    for m in rows:
+        if m.path:
+            m.path = format_media_path(m.path, m.id)
+        if m.cover:
+            m.cover = format_cover_path(m.cover)
+        if m.thumbnail_path:
+            m.thumbnail_path = format_thumbnail_path(m.thumbnail_path)
+    response.headers.update(headers)
+    return rows
+
+def release_media_files(db: Session, db_media: Media) -> List[str]:
+    """Libera as referências da mídia e retorna os arquivos que podem ser apagados"""
+    files_to_remove = []
+    for stored, legacy_delete in (
+        (db_media.path, True),
+        (db_media.cover, True),
+        (db_media.thumbnail_path, False),
+    ):
+        if not stored:
+            continue
+        released = release_blob(db, stored)
+        if released:
+            files_to_remove.append(stored)
+        elif released is None and legacy_delete and Path(stored).as_posix().startswith("uploads/"):
+            # Arquivo anterior ao armazenamento por conteúdo (decodificar se URL-encoded).
+            # Arquivos fora de uploads/ (importação em lote) nunca são apagados.
+            files_to_remove.append(urllib.parse.unquote(stored) if '%' in stored else stored)
+    return files_to_remove
+
+def remove_stored_files(paths: List[str]):
+    """
+    Apaga arquivos (e variantes de imagem) que ficaram sem referências.
+    
+    Roda depois do commit da exclusão; sob storage.blob_lock confere de novo
+    que nenhum upload do mesmo conteúdo voltou a referenciar o arquivo.
+    """
+    db = SessionLocal()
+    try:
+        with storage.blob_lock():
+            referenced = set()
+            for start in range(0, len(paths), MAX_BULK_ITEMS):
+                chunk = paths[start:start + MAX_BULK_ITEMS]
+                referenced.update(path for (path,) in db.query(Blob.path).filter(Blob.path.in_(chunk)))
+            for path_str in paths:
+                if path_str in referenced:
+                    continue
+                storage.remove_file(path_str)
+                images.remove_variants(path_str)
+    finally:
+        db.close()
+
+# Limite de itens por operação em lote
+MAX_BULK_ITEMS = 5000
+
+def check_bulk_size(ids: List[int]):
+    if not ids:
+        raise HTTPException(status_code=400, detail="Lista de ids vazia")
+    if len(ids) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BULK_ITEMS} itens por requisição")
+
 # Rotas da API
 @app.get("/")
 async def root():
@@ -259,77 +928,115 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": get_mozambique_time()}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Métricas do processo no formato texto do Prometheus"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 # Rotas para mídia
 #
 
 @app.get("/media", response_model=List[MediaResponse])
-async def get_all_media(db: Session = Depends(get_db)):
-    # Buscar todas as mídias ordenadas por título (alfabético)
-    media = db.query(Media).order_by(Media.title).all()
-    # Converter paths para URLs da API
-    for m in media:
-        if m.path:
-            m.path = format_media_path(m.path, m.id)
-        if m.cover:
-            m.cover = format_cover_path(m.cover)
-        if m.thumbnail_path:
-            m.thumbnail_path = format_thumbnail_path(m.thumbnail_path)
-    return media
+def get_all_media(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    # Buscar mídias ordenadas por título (alfabético)
+    return list_media(request, response, db, [], limit, cursor, fields, view="all")
 
-@app.post("/media/upload")
-async def upload_media(file: UploadFile = File(...), thumbnail: UploadFile = File(None), db: Session = Depends(get_db)):
-    """Fazer upload de arquivo de mídia"""
-    # Criar diretório de uploads
-    upload_dir = Path("uploads")
-    upload_dir.mkdir(exist_ok=True)
-    
-    # Salvar arquivo
-    file_path = upload_dir / file.filename
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Salvar thumbnail se fornecido
+def upload_media_type(content_type: Optional[str]) -> str:
+    return 'video' if content_type and content_type.startswith('video') else 'audio'
+
+def check_metadata_capacity(media_type: str):
+    if media_type == 'audio' and metadata_jobs.is_full():
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado processando uploads, tente novamente",
+            headers={"Retry-After": "5"},
+        )
+
+def add_uploaded_media(
+    db: Session,
+    filename: str,
+    media_type: str,
+    tmp_path: Path,
+    digest: str,
+    file_size: int,
+    thumbnail: Optional[Tuple[Path, str, int]],
+) -> Media:
+    """Grava os arquivos e faz o commit das referências e da mídia (sob storage.blob_lock)"""
+    decoded_title = filename.rsplit('.', 1)[0]
+    file_path = storage.blob_path(digest, storage.safe_suffix(filename))
+    storage.commit_blob(tmp_path, file_path)
+    file_path_str = file_path.as_posix()
+    acquire_blob(db, file_path_str, digest, file_size)
+    metrics.upload_size.labels(media_type).observe(file_size)
+    
     thumbnail_path_str = None
     if thumbnail:
-        thumbnails_dir = upload_dir / "thumbnails"
-        thumbnails_dir.mkdir(exist_ok=True)
-        thumbnail_filename = f"{file_path.stem}.jpg"
-        thumbnail_path = thumbnails_dir / thumbnail_filename
-        with open(thumbnail_path, "wb") as buffer:
-            shutil.copyfileobj(thumbnail.file, buffer)
-        thumbnail_path_str = str(thumbnail_path)
+        tmp_thumb, thumb_digest, thumb_size = thumbnail
+        thumbnail_path = storage.THUMBNAILS_DIR / f"{thumb_digest}.jpg"
+        storage.commit_blob(tmp_thumb, thumbnail_path)
+        thumbnail_path_str = thumbnail_path.as_posix()
+        acquire_blob(db, thumbnail_path_str, thumb_digest, thumb_size)
         print(f"Thumbnail salva: {thumbnail_path_str}")
     
-    # Determinar tipo
-    media_type = 'video' if file.content_type.startswith('video') else 'audio'
-    
-    # Extrair metadados se for áudio
-    metadata = {}
+    # Mesmo conteúdo já enviado antes: reaproveitar os metadados extraídos
+    existing = None
     if media_type == 'audio':
-        metadata = extract_audio_metadata(file_path)
-        print(f"Metadados extraídos: {metadata}")
-    
-    # Decodificar nome do arquivo se estiver URL-encoded
-    decoded_filename = urllib.parse.unquote(file.filename)
-    decoded_title = metadata.get('title') or decoded_filename.rsplit('.', 1)[0]
+        existing = db.query(Media).filter(Media.path == file_path_str, Media.status == "ready").first()
     
-    # Criar registro no banco
+    # Criar registro no banco (metadados de áudio são preenchidos depois)
     db_media = Media(
-        filename=decoded_filename,
-        title=decoded_title,
-        artist=metadata.get('artist', None),
+        filename=filename,
+        title=existing.title if existing else decoded_title,
+        artist=existing.artist if existing else None,
         type=media_type,
-        duration=metadata.get('duration', 0),
-        size=file_path.stat().st_size,
-        path=str(file_path),
+        duration=existing.duration if existing else 0,
+        size=file_size,
+        path=file_path_str,
+        content_hash=digest,
         thumbnail_path=thumbnail_path_str,
-        cover=metadata.get('cover', None),
-        is_favorite=False
+        cover=existing.cover if existing else None,
+        is_favorite=False,
+        status="processing" if media_type == 'audio' and not existing else "ready"
     )
+    if db_media.cover:
+        cover_blob = db.get(Blob, db_media.cover)
+        if cover_blob:
+            cover_blob.ref_count += 1
     db.add(db_media)
+    bump_library_version(db)
     db.commit()
+    return db_media
+
+def create_uploaded_media(
+    db: Session,
+    filename: str,
+    media_type: str,
+    tmp_path: Path,
+    digest: str,
+    file_size: int,
+    thumbnail: Optional[Tuple[Path, str, int]] = None,
+) -> dict:
+    """
+    Move o arquivo recebido (e a thumbnail: temporário, hash, tamanho) para
+    o armazenamento e cria o registro da mídia (comum ao upload direto e ao
+    retomável). Para áudio, metadados e capa são extraídos em segundo plano.
+    """
+    with storage.blob_lock():
+        db_media = add_uploaded_media(db, filename, media_type, tmp_path, digest, file_size, thumbnail)
     db.refresh(db_media)
     
+    if db_media.status == "processing" and not metadata_jobs.submit(process_media_metadata, db_media.id):
+        # Fila encheu entre a verificação e o envio: processar quando houver vaga
+        process_media_metadata(db_media.id)
+        db.refresh(db_media)
+    
     # Converter path para URL da API
     api_path = format_media_path(db_media.path, db_media.id)
     
@@ -355,78 +1062,441 @@ async def upload_media(file: UploadFile = File(...), thumbnail: UploadFile = Fil
         "thumbnail_path": thumbnail_url,
         "cover": cover_url,
         "is_favorite": db_media.is_favorite,
+        "status": db_media.status,
         "created_at": db_media.created_at,
         "updated_at": db_media.updated_at
     }
 
+@app.post("/media/upload")
+def upload_media(file: UploadFile = File(...), thumbnail: UploadFile = File(None), db: Session = Depends(get_db)):
+    """
+    Fazer upload de arquivo de mídia.
+    
+    O arquivo é gravado em disco fora do event loop e o registro é criado
+    imediatamente; para áudio, metadados e capa são extraídos em segundo
+    plano (status 'processing' até concluir, ver /media/{id}/status).
+    """
+    # Determinar tipo
+    media_type = upload_media_type(file.content_type)
+    check_metadata_capacity(media_type)
+    
+    # Decodificar nome do arquivo se estiver URL-encoded
+    decoded_filename = urllib.parse.unquote(file.filename)
+    
+    # Salvar arquivo no armazenamento endereçado por conteúdo (hash calculado durante a cópia)
+    tmp_path, digest, file_size = storage.receive_stream(file.file)
+    
+    # Receber thumbnail se fornecida (gravada junto com a mídia)
+    thumbnail_upload = storage.receive_stream(thumbnail.file) if thumbnail else None
+    
+    return create_uploaded_media(db, decoded_filename, media_type, tmp_path, digest, file_size, thumbnail_upload)
+
+# Uploads retomáveis (estilo tus): criar sessão, enviar partes com PATCH em
+# qualquer ordem, consultar o offset com HEAD/GET e finalizar
+@app.exception_handler(resumable.UploadError)
+async def upload_error_handler(request: Request, exc: resumable.UploadError):
+    return FastJSONResponse({"detail": exc.detail}, status_code=exc.status)
+
+def upload_headers(current: dict) -> dict:
+    return {
+        "Upload-Offset": str(current["offset"]),
+        "Upload-Length": str(current["length"]),
+        "Upload-Ranges": resumable.format_ranges(current["ranges"]),
+        "Upload-Expires": formatdate(current["expires_at"], usegmt=True),
+        "Cache-Control": "no-store",
+    }
+
+@app.post("/media/uploads", status_code=201)
+def create_resumable_upload(body: ResumableUploadCreate):
+    """Abre uma sessão de upload; as partes são enviadas com PATCH /media/uploads/{id}"""
+    current = resumable.create(body.filename, body.size, body.content_type)
+    headers = upload_headers(current)
+    headers["Location"] = f"{API_BASE_URL}/media/uploads/{current['id']}"
+    return FastJSONResponse(current, status_code=201, headers=headers)
+
+@app.api_route("/media/uploads/{upload_id}", methods=["GET", "HEAD"])
+def get_resumable_upload(upload_id: str):
+    """Estado da sessão; Upload-Offset = bytes contíguos recebidos desde o início"""
+    current = resumable.status(upload_id)
+    return FastJSONResponse(current, headers=upload_headers(current))
+
+@app.patch("/media/uploads/{upload_id}", status_code=204)
+async def upload_chunk(upload_id: str, request: Request):
+    """
+    Grava o corpo da requisição a partir do byte Upload-Offset. Se a conexão
+    cair, o que chegou fica registrado e o cliente retoma do novo offset.
+    """
+    offset = request.headers.get("upload-offset", "")
+    if not offset.isdigit():
+        raise HTTPException(status_code=400, detail="Cabeçalho Upload-Offset ausente ou inválido")
+    writer = await run_in_threadpool(resumable.ChunkWriter, upload_id, int(offset))
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(writer.write, chunk)
+    finally:
+        await run_in_threadpool(writer.close)
+    current = await run_in_threadpool(resumable.status, upload_id)
+    return Response(status_code=204, headers=upload_headers(current))
+
+@app.post("/media/uploads/{upload_id}/finalize")
+def finalize_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    """Conclui um upload completo: cria a mídia como em /media/upload"""
+    info = resumable.load_info(upload_id)
+    media_type = upload_media_type(info["content_type"])
+    check_metadata_capacity(media_type)
+    info, tmp_path, digest = resumable.claim(upload_id)
+    return create_uploaded_media(db, info["filename"], media_type, tmp_path, digest, info["length"])
+
+@app.delete("/media/uploads/{upload_id}", status_code=204)
+def abort_resumable_upload(upload_id: str):
+    """Cancela a sessão e apaga as partes recebidas"""
+    resumable.abort(upload_id)
+    return Response(status_code=204)
+
 @app.post("/media", response_model=MediaResponse)
-async def create_media(media: MediaCreate, db: Session = Depends(get_db)):
+def create_media(media: MediaCreate, db: Session = Depends(get_db)):
     """Criar mídia via URL externa"""
     db_media = Media(**media.dict())
-    db.add(db_media)
-    db.commit()
+    with storage.blob_lock():
+        # Arquivo já enviado (ex.: capa de outra mídia) ganha mais uma referência
+        adjust_blob_refs(db, Counter(), file_refs(*(getattr(db_media, field) for field in MEDIA_FILE_FIELDS)))
+        db.add(db_media)
+        bump_library_version(db)
+        db.commit()
     db.refresh(db_media)
     return db_media
 
 @app.get("/media/favorites", response_model=List[MediaResponse])
-async def get_favorite_media(db: Session = Depends(get_db)):
-    media = db.query(Media).filter(Media.is_favorite == True).order_by(Media.title).all()
-    for m in media:
-        if m.path:
-            m.path = format_media_path(m.path, m.id)
-        if m.cover:
-            m.cover = format_cover_path(m.cover)
-        if m.thumbnail_path:
-            m.thumbnail_path = format_thumbnail_path(m.thumbnail_path)
-    return media
+def get_favorite_media(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    return list_media(request, response, db, [Media.is_favorite == True], limit, cursor, fields,
+                      view="favorites", predicate=lambda item: item["is_favorite"])
 
 @app.get("/media/search/{query}", response_model=List[MediaResponse])
-async def search_media(query: str, db: Session = Depends(get_db)):
-    media = db.query(Media).filter(
-        Media.title.contains(query) | Media.filename.contains(query)
-    ).order_by(Media.title).all()
-    for m in media:
-        if m.path:
-            m.path = format_media_path(m.path, m.id)
-        if m.cover:
-            m.cover = format_cover_path(m.cover)
-        if m.thumbnail_path:
-            m.thumbnail_path = format_thumbnail_path(m.thumbnail_path)
-    return media
+def search_media(
+    query: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Busca por título, artista e nome do arquivo, ordenada por relevância"""
+    if not search_backend():
+        # Sem índice textual: busca por substring ordenada por título
+        criteria = [
+            Media.title.contains(query) | Media.artist.contains(query) | Media.filename.contains(query)
+        ]
+        return list_media(request, response, db, criteria, limit, cursor, fields)
+    
+    etag = library_etag(library_cache.library_version(db, get_library_version))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    requested = parse_fields(fields, MEDIA_FIELDS)
+    offset = 0
+    if cursor:
+        offset = decode_cursor(cursor, 1)[0]
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        limit = limit or DEFAULT_PAGE_SIZE
+    
+    ids = search_media_ids(db, query, limit + 1 if limit else None, offset)
+    if limit and len(ids) > limit:
+        ids = ids[:limit]
+        headers["X-Next-Cursor"] = encode_cursor([offset + limit])
+    
+    snapshot = get_library_snapshot(db)
+    if snapshot:
+        # Montar o resultado a partir do snapshot em memória
+        items = [snapshot.by_id[media_id] for media_id in ids if media_id in snapshot.by_id]
+        if requested:
+            items = [{name: item[name] for name in requested} for item in items]
+        return FastJSONResponse(items, headers=headers)
+    
+    if requested:
+        columns = dict.fromkeys(["id"] + requested)
+        query_rows = db.query(*[getattr(Media, name) for name in columns])
+    else:
+        query_rows = db.query(Media)
+    rows = query_rows.filter(Media.id.in_(ids)).all() if ids else []
+    # Manter a ordem de relevância
+    rank = {media_id: i for i, media_id in enumerate(ids)}
+    rows.sort(key=lambda row: rank[row.id])
+    return media_list_response(rows, requested, response, headers)
 
 @app.get("/media/type/{media_type}", response_model=List[MediaResponse])
-async def get_media_by_type(media_type: str, db: Session = Depends(get_db)):
+def get_media_by_type(
+    media_type: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
     if media_type not in ['video', 'audio']:
         raise HTTPException(status_code=400, detail="Tipo deve ser 'video' ou 'audio'")
     
-    media = db.query(Media).filter(Media.type == media_type).order_by(Media.title).all()
-    for m in media:
-        if m.path:
-            m.path = format_media_path(m.path, m.id)
-        if m.cover:
-            m.cover = format_cover_path(m.cover)
-        if m.thumbnail_path:
-            m.thumbnail_path = format_thumbnail_path(m.thumbnail_path)
-    return media
+    return list_media(request, response, db, [Media.type == media_type], limit, cursor, fields,
+                      view=f"type:{media_type}", predicate=lambda item: item["type"] == media_type)
 
-@app.get("/media/file/{media_id}")
-async def get_media_file(media_id: int, db: Session = Depends(get_db)):
-    """Servir arquivo de mídia"""
-    from fastapi.responses import FileResponse
+@app.get("/media/changes")
+def get_media_changes(
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Sincronização incremental: mídias criadas/alteradas e ids removidos desde o cursor.
     
-    db_media = db.query(Media).filter(Media.id == media_id).first()
+    Sem since=, retorna apenas o cursor atual (obtenha-o antes de baixar a lista
+    completa). Repita com o cursor retornado enquanto has_more for verdadeiro.
+    Cursor expirado (anterior à compactação do registro) retorna 410: o cliente
+    deve baixar a lista completa novamente.
+    """
+    requested = parse_fields(fields, MEDIA_FIELDS)
+    if since is None:
+        latest = db.query(func.max(MediaChange.seq)).scalar() or 0
+        return {"changes": [], "deleted": [], "cursor": encode_cursor([latest]), "has_more": False}
+    
+    since_seq = decode_cursor(since, 1)[0]
+    if not isinstance(since_seq, int):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    floor = db.query(LibraryState.changes_floor).filter(LibraryState.id == 1).scalar() or 0
+    if since_seq < floor:
+        raise HTTPException(status_code=410, detail="Cursor expirado, sincronize a lista completa")
+    
+    entries = db.query(MediaChange.seq, MediaChange.media_id, MediaChange.op).filter(
+        MediaChange.seq > since_seq
+    ).order_by(MediaChange.seq).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    cursor = encode_cursor([entries[-1].seq if entries else since_seq])
+    if not entries:
+        return {"changes": [], "deleted": [], "cursor": cursor, "has_more": False}
+    
+    # Apenas a operação mais recente de cada mídia nesta página
+    latest_op = {}
+    for entry in entries:
+        latest_op[entry.media_id] = entry.op
+    upserted = [media_id for media_id, op in latest_op.items() if op == "upsert"]
+    deleted = [media_id for media_id, op in latest_op.items() if op == "delete"]
+    
+    changes = []
+    if upserted:
+        if requested:
+            columns = dict.fromkeys(["id"] + requested)
+            rows = db.query(*[getattr(Media, name) for name in columns]).filter(Media.id.in_(upserted)).all()
+            changes = jsonable([format_media_fields(row, requested) for row in rows])
+        else:
+            # Linhas removidas depois do cursor desta página aparecem como exclusão adiante
+            changes = [serialize_media(m) for m in db.query(Media).filter(Media.id.in_(upserted))]
+    return FastJSONResponse({"changes": changes, "deleted": deleted, "cursor": cursor, "has_more": has_more})
+
+# Operações em lote: uma transação por requisição e resultado por item (na ordem pedida)
+
+@app.post("/media/batch/get")
+def get_media_batch(body: MediaIds, fields: Optional[str] = None, db: Session = Depends(get_db)):
+    """Várias mídias por id em uma chamada"""
+    check_bulk_size(body.ids)
+    requested = parse_fields(fields, MEDIA_FIELDS)
+    snapshot = get_library_snapshot(db)
+    if snapshot:
+        found = {media_id: snapshot.by_id[media_id] for media_id in set(body.ids) if media_id in snapshot.by_id}
+        if requested:
+            found = {media_id: {name: item[name] for name in requested} for media_id, item in found.items()}
+    elif requested:
+        columns = dict.fromkeys(["id"] + requested)
+        rows = db.query(*[getattr(Media, name) for name in columns]).filter(Media.id.in_(set(body.ids)))
+        found = {row.id: jsonable(format_media_fields(row, requested)) for row in rows}
+    else:
+        found = {m.id: serialize_media(m) for m in db.query(Media).filter(Media.id.in_(set(body.ids)))}
+    results = [
+        {"id": media_id, "status": "ok", "media": found[media_id]} if media_id in found
+        else {"id": media_id, "status": "not_found"}
+        for media_id in body.ids
+    ]
+    return FastJSONResponse({"results": results})
+
+@app.post("/media/batch/favorite")
+def set_favorite_batch(body: MediaBulkFavorite, db: Session = Depends(get_db)):
+    """Marca/desmarca várias mídias como favoritas"""
+    check_bulk_size(body.ids)
+    current = dict(db.query(Media.id, Media.is_favorite).filter(Media.id.in_(set(body.ids))).all())
+    to_change = [media_id for media_id, favorite in current.items() if bool(favorite) != body.is_favorite]
+    if to_change:
+        db.query(Media).filter(Media.id.in_(to_change)).update(
+            {Media.is_favorite: body.is_favorite, Media.updated_at: get_mozambique_time()},
+            synchronize_session=False,
+        )
+        bump_library_version(db)
+        db.commit()
+    changed = set(to_change)
+    results = [
+        {"id": media_id, "status": "not_found" if media_id not in current
+         else "updated" if media_id in changed else "unchanged"}
+        for media_id in body.ids
+    ]
+    return {"updated": len(changed), "results": results}
+
+@app.post("/media/batch/update")
+def update_media_batch(body: MediaBulkUpdate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Atualiza metadados (título, artista, capa, favorito) de várias mídias"""
+    check_bulk_size([item.id for item in body.items])
+    ids = {item.id for item in body.items}
+    current = {
+        row.id: row for row in
+        db.query(Media.id, Media.path, Media.cover, Media.thumbnail_path).filter(Media.id.in_(ids))
+    }
+    found = set(current)
+    now = get_mozambique_time()
+    changes, results = {}, []
+    for item in body.items:
+        values = item.dict(exclude_unset=True, exclude={"id"})
+        if item.id not in found:
+            results.append({"id": item.id, "status": "not_found"})
+        elif not values:
+            results.append({"id": item.id, "status": "unchanged"})
+        else:
+            # Id repetido: as alterações são combinadas, a última vence
+            changes.setdefault(item.id, {"id": item.id, "updated_at": now}).update(values)
+            results.append({"id": item.id, "status": "updated"})
+    files_to_remove = []
+    if changes:
+        # Referências dos arquivos trocados (ex.: capa), como em update_media
+        released, acquired = Counter(), Counter()
+        for media_id, values in changes.items():
+            for field in MEDIA_FILE_FIELDS:
+                old = getattr(current[media_id], field)
+                if field in values and values[field] != old:
+                    released.update(file_refs(old))
+                    acquired.update(file_refs(values[field]))
+        with storage.blob_lock():
+            files_to_remove = adjust_blob_refs(db, released, acquired)
+            # UPDATE ... WHERE id = ? em lote (executemany agrupado pelas colunas alteradas)
+            db.execute(update(Media), list(changes.values()))
+            bump_library_version(db)
+            db.commit()
+    
+    if files_to_remove and not file_cleanup_jobs.submit(remove_stored_files, files_to_remove):
+        background_tasks.add_task(remove_stored_files, files_to_remove)
+    return {"updated": len(changes), "results": results}
+
+@app.post("/media/batch/delete")
+def delete_media_batch(body: MediaIds, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Exclui várias mídias; os arquivos sem outras referências são apagados em segundo plano"""
+    check_bulk_size(body.ids)
+    rows = db.query(Media.id, Media.path, Media.cover, Media.thumbnail_path).filter(
+        Media.id.in_(set(body.ids))
+    ).all()
+    found = {row.id for row in rows}
+    
+    files_to_remove = []
+    if rows:
+        counts = Counter()
+        legacy = set()
+        for row in rows:
+            for stored, legacy_delete in ((row.path, True), (row.cover, True), (row.thumbnail_path, False)):
+                if stored:
+                    counts[stored] += 1
+                    if legacy_delete:
+                        legacy.add(stored)
+        orphaned, untracked = release_blobs(db, counts)
+        files_to_remove.extend(orphaned)
+        for stored in untracked:
+            # Mesma regra de release_media_files para arquivos anteriores ao armazenamento por conteúdo
+            if stored in legacy and Path(stored).as_posix().startswith("uploads/"):
+                files_to_remove.append(urllib.parse.unquote(stored) if '%' in stored else stored)
+        db.query(PlaylistMedia).filter(PlaylistMedia.media_id.in_(found)).delete(synchronize_session=False)
+        db.query(Media).filter(Media.id.in_(found)).delete(synchronize_session=False)
+        bump_library_version(db)
+        db.commit()
+    
+    if files_to_remove and not file_cleanup_jobs.submit(remove_stored_files, files_to_remove):
+        background_tasks.add_task(remove_stored_files, files_to_remove)
+    results = [
+        {"id": media_id, "status": "deleted" if media_id in found else "not_found"}
+        for media_id in body.ids
+    ]
+    return {"deleted": len(found), "results": results}
+
+@app.exception_handler(governor.StreamRejected)
+async def stream_rejected_handler(request: Request, exc: governor.StreamRejected):
+    return exc.response()
+
+def client_key(request: Request) -> str:
+    """Cliente para os limites por cliente (IP; atrás de proxy, ver FORWARDED_ALLOW_IPS)"""
+    return request.client.host if request.client else "desconhecido"
+
+def media_file_response(media_id: int, request: Request, client: str) -> MediaFileResponse:
+    """Busca a mídia e monta a resposta do arquivo (roda no pool de threads)"""
+    db = SessionLocal()
+    try:
+        db_media = db.query(Media).filter(Media.id == media_id).first()
+    finally:
+        db.close()
     if not db_media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
     file_path = Path(db_media.path)
-    if not file_path.exists():
+    try:
+        stat_result = file_path.stat()
+    except OSError:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    return FileResponse(file_path, media_type='application/octet-stream')
+    # Conteúdo endereçado por hash nunca muda para o mesmo id
+    cache_control = "public, max-age=0, must-revalidate"
+    if storage.is_content_addressed(db_media.path):
+        cache_control = "public, max-age=31536000, immutable"
+    
+    return MediaFileResponse(
+        file_path,
+        request.headers,
+        method=request.method,
+        filename=db_media.filename,
+        stat_result=stat_result,
+        cache_control=cache_control,
+        governor=stream_governor,
+        client=client,
+    )
+
+@app.api_route("/media/file/{media_id}", methods=["GET", "HEAD"])
+async def get_media_file(media_id: int, request: Request):
+    """Servir arquivo de mídia (suporta Range, If-Range e revalidação condicional)"""
+    client = client_key(request)
+    if request.method == "GET" and not ("if-none-match" in request.headers or "if-modified-since" in request.headers):
+        # Sem vaga: 429 no event loop, sem ocupar uma thread nem consultar o banco
+        # (a vaga em si é ocupada ao enviar o corpo)
+        stream_governor.check(client)
+    return await run_in_threadpool(media_file_response, media_id, request, client)
+
+@app.get("/streams/status")
+def get_stream_status():
+    """Estado do controle de transmissões deste processo: limites, vagas ocupadas, recusas e pausas"""
+    return stream_governor.status()
+
+@app.get("/media/{media_id}/status")
+def get_media_status(media_id: int, db: Session = Depends(get_db)):
+    """Estado do processamento de uma mídia enviada ('processing', 'ready' ou 'failed')"""
+    row = db.query(Media.id, Media.status).filter(Media.id == media_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Mídia não encontrada")
+    return {"id": row.id, "status": row.status, "queue": metadata_jobs.stats()}
 
 # Rotas com parâmetros genéricos DEVEM vir DEPOIS das rotas específicas
 @app.get("/media/{media_id}", response_model=MediaResponse)
-async def get_media(media_id: int, db: Session = Depends(get_db)):
+def get_media(media_id: int, db: Session = Depends(get_db)):
     media = db.query(Media).filter(Media.id == media_id).first()
     if not media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
@@ -440,64 +1510,57 @@ async def get_media(media_id: int, db: Session = Depends(get_db)):
     return media
 
 @app.put("/media/{media_id}", response_model=MediaResponse)
-async def update_media(media_id: int, media_update: MediaUpdate, db: Session = Depends(get_db)):
+def update_media(media_id: int, media_update: MediaUpdate, db: Session = Depends(get_db)):
     db_media = db.query(Media).filter(Media.id == media_id).first()
     if not db_media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
-    for field, value in media_update.dict(exclude_unset=True).items():
-        setattr(db_media, field, value)
-    
-    db_media.updated_at = get_mozambique_time()
-    db.commit()
+    values = media_update.dict(exclude_unset=True)
+    with storage.blob_lock():
+        changed = [field for field in MEDIA_FILE_FIELDS
+                   if field in values and values[field] != getattr(db_media, field)]
+        files_to_remove = adjust_blob_refs(
+            db,
+            file_refs(*(getattr(db_media, field) for field in changed)),
+            file_refs(*(values[field] for field in changed)),
+        )
+        for field, value in values.items():
+            setattr(db_media, field, value)
+        
+        db_media.updated_at = get_mozambique_time()
+        bump_library_version(db)
+        db.commit()
+    if files_to_remove:
+        remove_stored_files(files_to_remove)
     db.refresh(db_media)
     return db_media
 
 @app.delete("/media/{media_id}")
-async def delete_media(media_id: int, db: Session = Depends(get_db)):
+def delete_media(media_id: int, db: Session = Depends(get_db)):
     db_media = db.query(Media).filter(Media.id == media_id).first()
     if not db_media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
-    # Deletar arquivo físico da mídia
-    media_path_str = db_media.path
-    # Decodificar se estiver URL-encoded
-    if '%' in media_path_str:
-        media_path_str = urllib.parse.unquote(media_path_str)
-    media_path = Path(media_path_str)
-    if media_path.exists():
-        try:
-            media_path.unlink()
-            print(f"Arquivo de mídia deletado: {media_path}")
-        except Exception as e:
-            print(f"Erro ao deletar arquivo de mídia {media_path}: {e}")
-    
-    # Deletar capa se existir
-    if db_media.cover:
-        cover_path_str = db_media.cover
-        # Decodificar se estiver URL-encoded
-        if '%' in cover_path_str:
-            cover_path_str = urllib.parse.unquote(cover_path_str)
-        cover_path = Path(cover_path_str)
-        if cover_path.exists():
-            try:
-                cover_path.unlink()
-                print(f"Capa deletada: {cover_path}")
-            except Exception as e:
-                print(f"Erro ao deletar capa {cover_path}: {e}")
-    
+    files_to_remove = release_media_files(db, db_media)
+    db.query(PlaylistMedia).filter(PlaylistMedia.media_id == media_id).delete(synchronize_session=False)
     db.delete(db_media)
+    bump_library_version(db)
     db.commit()
+    
+    # Só apagar arquivos físicos sem outras referências, depois do commit
+    if files_to_remove:
+        remove_stored_files(files_to_remove)
     return {"message": "Mídia deletada com sucesso"}
 
 @app.post("/media/{media_id}/toggle-favorite", response_model=MediaResponse)
-async def toggle_favorite(media_id: int, db: Session = Depends(get_db)):
+def toggle_favorite(media_id: int, db: Session = Depends(get_db)):
     db_media = db.query(Media).filter(Media.id == media_id).first()
     if not db_media:
         raise HTTPException(status_code=404, detail="Mídia não encontrada")
     
     db_media.is_favorite = not db_media.is_favorite
     db_media.updated_at = get_mozambique_time()
+    bump_library_version(db)
     db.commit()
     db.refresh(db_media)
     if db_media.path:
@@ -508,79 +1571,560 @@ async def toggle_favorite(media_id: int, db: Session = Depends(get_db)):
         db_media.thumbnail_path = format_thumbnail_path(db_media.thumbnail_path)
     return db_media
 
-@app.get("/uploads/covers/{filename}")
-async def get_cover_image(filename: str):
-    """Servir imagem de capa"""
-    from fastapi.responses import FileResponse
+def resolve_image_path(directory: Path, filename: str) -> Optional[Path]:
+    """Caminho da imagem dentro do diretório (recusa nomes que escapem dele)"""
+    if not filename or "/" in filename or "\\" in filename or filename.startswith("."):
+        return None
+    return directory / filename
+
+def load_image_asset(image_path: Path, variant: Optional[int], fmt: Optional[str]) -> Optional[images.ImageAsset]:
+    """Original ou variante redimensionada, lida do disco (executar em thread)"""
+    if not image_path.is_file():
+        return None
+    if variant is not None:
+        try:
+            variant_path = images.get_variant(image_path, variant, fmt)
+            return images.load_asset(variant_path, images.media_type_for(fmt))
+        except Exception as e:
+            # Imagem que o Pillow não consegue abrir: servir a original
+            print(f"Erro ao gerar variante de {image_path}: {e}")
+    return images.load_asset(image_path, guess_media_type(image_path.name))
+
+async def serve_image(directory: Path, filename: str, request: Request, size: Optional[int], version: Optional[str]):
+    """
+    Serve a imagem original ou, com size=, a variante redimensionada no formato
+    aceito pelo cliente. Imagens pequenas saem do cache em memória com ETag
+    pré-calculado; URLs versionadas (?v=) recebem Cache-Control immutable.
+    """
+    image_path = resolve_image_path(directory, filename)
+    if image_path is None:
+        return None
+    variant = images.select_size(size)
+    fmt = images.select_format(request.headers.get("accept")) if variant is not None else None
+    
+    if storage.is_content_addressed(filename):
+        # Nome = hash do conteúdo: nunca muda, e um acerto no cache nem toca o disco
+        current_version = None
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        current_version = images.asset_version(image_path)
+        if current_version is None:
+            return None
+        cache_control = IMMUTABLE_CACHE_CONTROL if version == current_version else "no-cache"
+    
+    key = (directory.name, filename, variant, fmt, current_version)
+    asset = images.memory_cache.get(key)
+    if asset is None:
+        asset = await run_in_threadpool(load_image_asset, image_path, variant, fmt)
+        if asset is None:
+            return None
+        images.memory_cache.put(key, asset)
     
+    headers = {"ETag": asset.etag, "Cache-Control": cache_control}
+    if variant is not None:
+        headers["Vary"] = "Accept"
+    if etag_matches(request.headers.get("if-none-match"), asset.etag):
+        return Response(status_code=304, headers=headers)
+    if asset.body is not None:
+        return Response(asset.body, media_type=asset.media_type, headers=headers)
+    from fastapi.responses import FileResponse
+    return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+
+@app.get("/uploads/covers/{filename}")
+async def get_cover_image(
+    filename: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1, le=4096),
+    v: Optional[str] = None,
+):
+    """Servir imagem de capa (size= devolve uma variante redimensionada)"""
     # Decodificar filename se estiver URL-encoded
     decoded_filename = urllib.parse.unquote(filename)
-    cover_path = Path("uploads/covers") / decoded_filename
-    
-    if not cover_path.exists():
+    response = await serve_image(storage.COVERS_DIR, decoded_filename, request, size, v)
+    if response is None:
         raise HTTPException(status_code=404, detail=f"Capa não encontrada: {decoded_filename}")
-    
-    return FileResponse(cover_path, media_type='image/jpeg')
+    return response
 
 @app.get("/uploads/thumbnails/{filename}")
-async def get_thumbnail_image(filename: str):
-    """Servir imagem de thumbnail"""
-    from fastapi.responses import FileResponse
-    
+async def get_thumbnail_image(
+    filename: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1, le=4096),
+    v: Optional[str] = None,
+):
+    """Servir imagem de thumbnail (size= devolve uma variante redimensionada)"""
     # FastAPI já decodifica o filename, então usamos como vem
-    thumbnail_path = Path("uploads/thumbnails") / filename
-    
-    if not thumbnail_path.exists():
+    response = await serve_image(storage.THUMBNAILS_DIR, filename, request, size, v)
+    if response is None:
         raise HTTPException(status_code=404, detail=f"Thumbnail não encontrada: {filename}")
-    
-    return FileResponse(thumbnail_path, media_type='image/jpeg')
+    return response
 
 # Rotas para playlists
 @app.get("/playlists", response_model=List[PlaylistResponse])
-async def get_playlists(db: Session = Depends(get_db)):
+def get_playlists(db: Session = Depends(get_db)):
     playlists = db.query(Playlist).all()
     return playlists
 
 @app.post("/playlists", response_model=PlaylistResponse)
-async def create_playlist(playlist: PlaylistCreate, db: Session = Depends(get_db)):
+def create_playlist(playlist: PlaylistCreate, db: Session = Depends(get_db)):
     db_playlist = Playlist(**playlist.dict())
     db.add(db_playlist)
     db.commit()
     db.refresh(db_playlist)
     return db_playlist
 
-@app.post("/playlists/{playlist_id}/media/{media_id}")
-async def add_media_to_playlist(playlist_id: int, media_id: int, db: Session = Depends(get_db)):
-    # Verificar se playlist existe
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
-    if not playlist:
+# Espaçamento entre posições novas
+PLAYLIST_POSITION_STEP = 1024.0
+
+def require_playlist(db: Session, playlist_id: int):
+    if not db.query(Playlist.id).filter(Playlist.id == playlist_id).first():
         raise HTTPException(status_code=404, detail="Playlist não encontrada")
+
+def append_to_playlist(db: Session, playlist_id: int, media_ids: List[int]) -> List[int]:
+    """Adiciona as mídias no fim da playlist; retorna os ids das novas entradas"""
+    found = {row.id for row in db.query(Media.id).filter(Media.id.in_(set(media_ids)))}
+    missing = [media_id for media_id in media_ids if media_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Mídias não encontradas: {missing}")
     
-    # Verificar se mídia existe
-    media = db.query(Media).filter(Media.id == media_id).first()
-    if not media:
-        raise HTTPException(status_code=404, detail="Mídia não encontrada")
+    last = db.query(func.max(PlaylistMedia.position)).filter(
+        PlaylistMedia.playlist_id == playlist_id
+    ).scalar() or 0
+    entries = [
+        PlaylistMedia(playlist_id=playlist_id, media_id=media_id,
+                      position=last + PLAYLIST_POSITION_STEP * (i + 1))
+        for i, media_id in enumerate(media_ids)
+    ]
+    db.add_all(entries)
+    db.flush()
+    return [entry.id for entry in entries]
+
+def strictly_between(positions: List[float], lower: Optional[float], upper: Optional[float]) -> bool:
+    """
+    As posições calculadas ficam em ordem estrita entre si e entre os vizinhos.
+    Com posições grandes, lower + gap pode arredondar para um vizinho: uma
+    margem absoluta não basta, então cada valor é conferido.
+    """
+    bounds = [p for p in (lower, *positions, upper) if p is not None]
+    return all(a < b for a, b in zip(bounds, bounds[1:]))
+
+def renumber_playlist(db: Session, playlist_id: int, ordered_ids: List[int]):
+    """Reescreve todas as posições (só quando não há mais espaço entre duas posições)"""
+    db.bulk_update_mappings(PlaylistMedia, [
+        {"id": entry_id, "position": PLAYLIST_POSITION_STEP * (i + 1)}
+        for i, entry_id in enumerate(ordered_ids)
+    ])
+
+@app.get("/playlists/{playlist_id}/media")
+def get_playlist_media(
+    playlist_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Mídias da playlist em ordem, paginadas por cursor (X-Next-Cursor)"""
+    query = db.query(PlaylistMedia.id, PlaylistMedia.position, Media).join(
+        Media, Media.id == PlaylistMedia.media_id
+    ).filter(PlaylistMedia.playlist_id == playlist_id)
+    if cursor:
+        last_position, last_id = decode_cursor(cursor, 2)
+        query = query.filter(
+            tuple_(PlaylistMedia.position, PlaylistMedia.id) > tuple_(last_position, last_id)
+        )
+        limit = limit or DEFAULT_PAGE_SIZE
+    query = query.order_by(PlaylistMedia.position, PlaylistMedia.id)
+    
+    headers = {"Cache-Control": "no-cache"}
+    if limit:
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers["X-Next-Cursor"] = encode_cursor([rows[-1].position, rows[-1].id])
+    else:
+        rows = query.all()
+    
+    if not rows and not cursor:
+        require_playlist(db, playlist_id)
+    items = [
+        {"entry_id": entry_id, "position": position, "media": serialize_media(media)}
+        for entry_id, position, media in rows
+    ]
+    return FastJSONResponse(items, headers=headers)
+
+@app.post("/playlists/{playlist_id}/media")
+def add_media_bulk_to_playlist(playlist_id: int, body: PlaylistMediaAdd, db: Session = Depends(get_db)):
+    """Adiciona várias mídias no fim da playlist em uma única transação"""
+    check_bulk_size(body.media_ids)
+    require_playlist(db, playlist_id)
+    entry_ids = append_to_playlist(db, playlist_id, body.media_ids)
+    db.commit()
+    return {"message": f"{len(entry_ids)} mídias adicionadas à playlist", "entry_ids": entry_ids}
+
+@app.post("/playlists/{playlist_id}/media/remove")
+def remove_media_from_playlist(playlist_id: int, body: PlaylistMediaRemove, db: Session = Depends(get_db)):
+    """Remove entradas da playlist (por entry_id) em uma única transação"""
+    check_bulk_size(body.entry_ids)
+    deleted = db.query(PlaylistMedia).filter(
+        PlaylistMedia.playlist_id == playlist_id, PlaylistMedia.id.in_(set(body.entry_ids))
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {"message": f"{deleted} itens removidos da playlist", "removed": deleted}
+
+@app.post("/playlists/{playlist_id}/media/reorder")
+def reorder_playlist(playlist_id: int, body: PlaylistReorder, db: Session = Depends(get_db)):
+    """
+    Move as entradas dadas (na ordem da lista) para depois de after_entry_id.
+    
+    Apenas as linhas movidas são alteradas: recebem posições fracionárias
+    entre os vizinhos. A playlist inteira só é renumerada se o espaço
+    entre dois vizinhos se esgotar.
+    """
+    check_bulk_size(body.entry_ids)
+    moved = list(dict.fromkeys(body.entry_ids))
+    if body.after_entry_id in moved:
+        raise HTTPException(status_code=400, detail="after_entry_id não pode estar entre os itens movidos")
+    
+    in_playlist = PlaylistMedia.playlist_id == playlist_id
+    found = db.query(func.count(PlaylistMedia.id)).filter(in_playlist, PlaylistMedia.id.in_(moved)).scalar()
+    if found != len(moved):
+        raise HTTPException(status_code=404, detail="Item não encontrado na playlist")
+    
+    # Vizinhos: a entrada de referência e a primeira entrada (não movida) depois dela
+    lower = None
+    remaining = db.query(PlaylistMedia.position, PlaylistMedia.id).filter(
+        in_playlist, PlaylistMedia.id.notin_(moved)
+    )
+    if body.after_entry_id is not None:
+        anchor = db.query(PlaylistMedia.position, PlaylistMedia.id).filter(
+            in_playlist, PlaylistMedia.id == body.after_entry_id
+        ).first()
+        if not anchor:
+            raise HTTPException(status_code=404, detail="after_entry_id não encontrado na playlist")
+        lower = anchor.position
+        remaining = remaining.filter(
+            tuple_(PlaylistMedia.position, PlaylistMedia.id) > tuple_(anchor.position, anchor.id)
+        )
+    upper_row = remaining.order_by(PlaylistMedia.position, PlaylistMedia.id).first()
+    upper = upper_row.position if upper_row else None
     
-    # Adicionar à playlist
-    playlist_media = PlaylistMedia(playlist_id=playlist_id, media_id=media_id)
-    db.add(playlist_media)
+    count = len(moved)
+    if lower is None and upper is None:
+        positions = [PLAYLIST_POSITION_STEP * (i + 1) for i in range(count)]
+    elif upper is None:
+        positions = [lower + PLAYLIST_POSITION_STEP * (i + 1) for i in range(count)]
+    elif lower is None:
+        positions = [upper - PLAYLIST_POSITION_STEP * (count - i) for i in range(count)]
+    else:
+        gap = (upper - lower) / (count + 1)
+        positions = [lower + gap * (i + 1) for i in range(count)]
+    if not strictly_between(positions, lower, upper):
+        positions = None
+    
+    if positions is None:
+        # Sem espaço entre os vizinhos: renumerar a playlist com a nova ordem
+        ordered = [row.id for row in db.query(PlaylistMedia.id).filter(
+            in_playlist, PlaylistMedia.id.notin_(moved)
+        ).order_by(PlaylistMedia.position, PlaylistMedia.id)]
+        index = ordered.index(body.after_entry_id) + 1 if body.after_entry_id is not None else 0
+        ordered[index:index] = moved
+        renumber_playlist(db, playlist_id, ordered)
+    else:
+        db.bulk_update_mappings(PlaylistMedia, [
+            {"id": entry_id, "position": position} for entry_id, position in zip(moved, positions)
+        ])
+    db.commit()
+    return {"message": "Playlist reordenada com sucesso", "renumbered": positions is None}
+
+# Rota com {media_id} depois de /media/remove e /media/reorder
+@app.post("/playlists/{playlist_id}/media/{media_id}")
+def add_media_to_playlist(playlist_id: int, media_id: int, db: Session = Depends(get_db)):
+    # Verificar se playlist existe
+    require_playlist(db, playlist_id)
+    
+    # Adicionar no fim da playlist (verifica se a mídia existe)
+    append_to_playlist(db, playlist_id, [media_id])
     db.commit()
     
     return {"message": "Mídia adicionada à playlist com sucesso"}
 
 # Rotas para histórico
 @app.post("/history/{media_id}")
-async def add_playback_history(media_id: int, position: float, db: Session = Depends(get_db)):
-    history = PlaybackHistory(media_id=media_id, position=position)
-    db.add(history)
-    db.commit()
+async def add_playback_history(media_id: int, position: float):
+    # Gravado em lote pela thread do histórico (sem acessar o banco aqui)
+    history_buffer.add(media_id, position, get_mozambique_time())
     return {"message": "Histórico adicionado com sucesso"}
 
 @app.get("/history")
-async def get_playback_history(db: Session = Depends(get_db)):
+def get_playback_history(db: Session = Depends(get_db)):
+    # Incluir os eventos que ainda estão no buffer
+    history_buffer.flush()
     history = db.query(PlaybackHistory).order_by(PlaybackHistory.played_at.desc()).limit(50).all()
     return history
 
+@app.get("/history/{media_id}/resume")
+def get_resume_position(media_id: int, db: Session = Depends(get_db)):
+    """Onde a reprodução da mídia parou (position = null se nunca foi tocada)"""
+    pending = history_buffer.latest(media_id)
+    if pending:
+        position, updated_at = pending
+    else:
+        resume = db.get(ResumePosition, media_id)
+        position, updated_at = (resume.position, resume.updated_at) if resume else (None, None)
+    return {"media_id": media_id, "position": position, "updated_at": updated_at}
+
+# Estatísticas de reprodução (tabelas materializadas, ver app.play_stats)
+STATS_DEFAULT_LIMIT = 20
+
+def ranked_media(db: Session, order: list, media_type: Optional[str], limit: int):
+    """Mídias com estatísticas na ordem dada, já com play_count/listened_seconds/last_played_at"""
+    query = db.query(Media, MediaPlayStats).join(MediaPlayStats, MediaPlayStats.media_id == Media.id)
+    if media_type:
+        query = query.filter(Media.type == media_type)
+    items = []
+    for media, stats in query.order_by(*order).limit(limit):
+        item = serialize_media(media)
+        item["play_count"] = stats.play_count
+        item["listened_seconds"] = stats.listened_seconds
+        item["last_played_at"] = stats.last_played_at
+        items.append(item)
+    return FastJSONResponse(jsonable(items))
+
+@app.get("/stats/top")
+def get_most_played(
+    media_type: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(STATS_DEFAULT_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Mídias mais tocadas (empate: a tocada mais recentemente primeiro)"""
+    order = [MediaPlayStats.play_count.desc(), MediaPlayStats.last_played_at.desc(), MediaPlayStats.media_id]
+    return ranked_media(db, order, media_type, limit)
+
+@app.get("/stats/recent")
+def get_recently_played(
+    media_type: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(STATS_DEFAULT_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    """Mídias tocadas recentemente (uma vez cada, da mais recente para a mais antiga)"""
+    order = [MediaPlayStats.last_played_at.desc(), MediaPlayStats.media_id]
+    return ranked_media(db, order, media_type, limit)
+
+@app.get("/stats/types")
+def get_type_stats(db: Session = Depends(get_db)):
+    """Totais de reprodução por tipo de mídia"""
+    rows = db.query(TypePlayStats).order_by(TypePlayStats.play_count.desc(), TypePlayStats.type).all()
+    return [
+        {
+            "type": row.type,
+            "play_count": row.play_count,
+            "listened_seconds": row.listened_seconds,
+            "last_played_at": row.last_played_at,
+        }
+        for row in rows
+    ]
+
+# Exportação/importação do catálogo em NDJSON (formato em app.catalog)
+CATALOG_BATCH_SIZE = int(os.getenv("CATALOG_BATCH_SIZE", "1000"))
+CATALOG_TABLES = (
+    ("media", Media),
+    ("playlist", Playlist),
+    ("playlist_media", PlaylistMedia),
+    ("history", PlaybackHistory),
+)
+
+def catalog_records(db: Session):
+    """Cabeçalho e todas as linhas do catálogo, lidas do cursor em lotes (memória constante)"""
+    yield catalog.header()
+    for kind, model in CATALOG_TABLES:
+        table = model.__table__
+        result = db.execute(
+            select(table).order_by(table.c.id).execution_options(yield_per=CATALOG_BATCH_SIZE)
+        )
+        for row in result.mappings():
+            record = {"kind": kind}
+            record.update(row)
+            yield record
+
+def export_catalog_stream():
+    """Blocos de NDJSON de uma única transação de leitura (retrato consistente do catálogo)"""
+    db = SessionLocal()
+    try:
+        yield from catalog.encode_lines(catalog_records(db))
+    finally:
+        db.close()
+
+class CatalogImporter:
+    """
+    Importa um catálogo NDJSON em lotes de batch_size linhas, um commit por lote.
+    
+    Mídias e playlists recebem ids novos; playlist_media e history são
+    remapeados para eles (linhas que apontam para ids ausentes são ignoradas
+    e contadas em "skipped"). O histórico passa por write_history_events,
+    então posições de retomada e estatísticas também são atualizadas.
+    """
+    
+    def __init__(self, batch_size: int = CATALOG_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.media_ids = catalog.IdMap()
+        self.playlist_ids = catalog.IdMap()
+        self.imported = Counter()
+        self.skipped = Counter()
+        self.line = 0
+        self._kind = None
+        self._batch: List[dict] = []
+    
+    def feed_lines(self, lines: List[bytes]):
+        """Processa linhas já separadas; ValueError indica a linha inválida"""
+        for line in lines:
+            self.line += 1
+            try:
+                record = catalog.decode_record(line)
+            except ValueError as e:
+                raise ValueError(f"linha {self.line}: {e}")
+            if record is None:
+                continue
+            kind = record.pop("kind")
+            if kind == "header":
+                if record.get("format") != catalog.FORMAT or record.get("version") != catalog.FORMAT_VERSION:
+                    raise ValueError(f"linha {self.line}: formato não suportado")
+                continue
+            if kind not in catalog.KINDS:
+                raise ValueError(f"linha {self.line}: tipo de registro desconhecido '{kind}'")
+            if kind != self._kind:
+                self.flush()
+                self._kind = kind
+            self._batch.append(record)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+    
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        getattr(self, f"_import_{self._kind}")(batch)
+    
+    def finish(self) -> dict:
+        self.flush()
+        return {"imported": dict(self.imported), "skipped": dict(self.skipped)}
+    
+    @staticmethod
+    def _rows(model, batch: List[dict]) -> List[dict]:
+        # Mesmas chaves em todas as linhas (executemany); o id de origem fica de fora
+        columns = [c.name for c in model.__table__.columns if c.name != "id"]
+        return [{name: record.get(name) for name in columns} for record in batch]
+    
+    def _insert_mapped(self, db: Session, model, batch: List[dict], rows: List[dict], ids: catalog.IdMap):
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        new_ids = db.execute(stmt, rows).scalars().all()
+        for record, new_id in zip(batch, new_ids):
+            if record.get("id") is not None:
+                ids.add(record["id"], new_id)
+    
+    def _import_media(self, batch: List[dict]):
+        rows = self._rows(Media, batch)
+        blobs = {}
+        for row in rows:
+            if not row["filename"] or not row["path"] or not row["type"]:
+                raise ValueError(f"linha {self.line}: mídia sem filename, path ou type")
+            row["status"] = row["status"] or "ready"
+            # Arquivos endereçados por conteúdo ganham mais uma referência cada
+            references = [(row["path"], row["content_hash"], row["size"])]
+            for image in (row["cover"], row["thumbnail_path"]):
+                if image:
+                    image_path = Path(image)
+                    references.append((image, None, image_path.stat().st_size if image_path.exists() else None))
+            for path, digest, size in references:
+                if not storage.is_content_addressed(path):
+                    continue
+                entry = blobs.setdefault(path, [digest or Path(path).stem, size, 0])
+                entry[2] += 1
+        db = SessionLocal()
+        try:
+            self._insert_mapped(db, Media, batch, rows, self.media_ids)
+            bump_library_version(db)
+            # Referências confirmadas antes que uma exclusão confira e apague os arquivos
+            with storage.blob_lock():
+                for path, (digest, size, count) in sorted(blobs.items()):
+                    acquire_blob(db, path, digest, size, count)
+                db.commit()
+        finally:
+            db.close()
+        self.imported["media"] += len(rows)
+    
+    def _import_playlist(self, batch: List[dict]):
+        rows = self._rows(Playlist, batch)
+        db = SessionLocal()
+        try:
+            self._insert_mapped(db, Playlist, batch, rows, self.playlist_ids)
+            db.commit()
+        finally:
+            db.close()
+        self.imported["playlist"] += len(rows)
+    
+    def _import_playlist_media(self, batch: List[dict]):
+        rows = []
+        for row in self._rows(PlaylistMedia, batch):
+            row["playlist_id"] = self.playlist_ids.get(row["playlist_id"])
+            row["media_id"] = self.media_ids.get(row["media_id"])
+            if row["playlist_id"] is None or row["media_id"] is None:
+                self.skipped["playlist_media"] += 1
+                continue
+            rows.append(row)
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(insert(PlaylistMedia), rows)
+            db.commit()
+        finally:
+            db.close()
+        self.imported["playlist_media"] += len(rows)
+    
+    def _import_history(self, batch: List[dict]):
+        events = []
+        for record in batch:
+            media_id = self.media_ids.get(record.get("media_id"))
+            if media_id is None or record.get("played_at") is None:
+                self.skipped["history"] += 1
+                continue
+            events.append((media_id, record.get("position"), record["played_at"]))
+        if events:
+            write_history_events(events)
+            self.imported["history"] += len(events)
+
+@app.get("/catalog/export")
+def export_catalog():
+    """Catálogo completo (mídias, playlists, itens e histórico) em NDJSON, transmitido aos poucos"""
+    # Incluir os eventos que ainda estão no buffer
+    history_buffer.flush()
+    return StreamingResponse(
+        export_catalog_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="catalogo.ndjson"'},
+    )
+
+@app.post("/catalog/import")
+async def import_catalog(request: Request):
+    """Importa um catálogo NDJSON enviado no corpo (sem carregá-lo inteiro na memória)"""
+    importer = CatalogImporter()
+    splitter = catalog.LineSplitter()
+    pending: List[bytes] = []
+    try:
+        async for chunk in request.stream():
+            pending.extend(splitter.feed(chunk))
+            if len(pending) >= importer.batch_size:
+                lines, pending = pending, []
+                await run_in_threadpool(importer.feed_lines, lines)
+        pending.extend(splitter.finish())
+        await run_in_threadpool(importer.feed_lines, pending)
+        return await run_in_threadpool(importer.finish)
+    except ValueError as e:
+        # Os lotes anteriores já foram confirmados: informar o que entrou
+        raise HTTPException(
+            status_code=400,
+            detail=f"Catálogo inválido ({e}); já importados: {dict(importer.imported)}",
+        )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,309 @@
+"""
+Métricas no formato texto do Prometheus (contadores, gauges e histogramas).
+
+Implementação mínima e sem dependências: cada métrica guarda seus valores
+por combinação de labels em memória do processo. Com vários workers, cada
+processo expõe as próprias métricas (o Prometheus soma por instância).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Limites em segundos para latências HTTP e consultas ao banco
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = tuple(1024 * 2 ** i for i in range(0, 20, 2))  # 1 KiB .. 256 MiB
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Atalho pelos valores originais (evita converter labels a cada uso)
+        self._by_values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._child(())
+
+    def labels(self, *values):
+        """Série da combinação de labels (criada no primeiro uso)"""
+        child = self._by_values.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados labels {self.labelnames}")
+            child = self._by_values[values] = self._child(tuple(str(v) for v in values))
+        return child
+
+    def _child(self, key):
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, key, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{self._label_str(key)} {_format_value(child.get())}"]
+
+
+class _Value:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = value
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Gauge; com function=, o valor é lido na hora da coleta"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        value = child.get()
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+        return [f"{self.name}{self._label_str(key)} {_format_value(value)}"]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            label = self._label_str(key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{label} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+http_requests = registry.register(Counter(
+    "http_requests_total", "Requisições HTTP concluídas", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requisições HTTP em andamento"))
+
+# Banco de dados
+db_queries = registry.register(Counter(
+    "db_queries_total", "Consultas SQL executadas"))
+db_query_latency = registry.register(Histogram(
+    "db_query_duration_seconds", "Duração das consultas SQL", buckets=DB_BUCKETS))
+db_queries_per_request = registry.register(Histogram(
+    "http_request_db_queries", "Consultas SQL por requisição", ("route",), buckets=COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    "http_request_db_seconds", "Tempo total no banco por requisição", ("route",), buckets=DB_BUCKETS))
+
+# Streaming e uploads
+media_bytes_sent = registry.register(Counter(
+    "media_stream_bytes_total", "Bytes de mídia enviados por /media/file"))
+media_active_streams = registry.register(Gauge(
+    "media_active_streams", "Respostas de /media/file sendo transmitidas"))
+media_stream_rejections = registry.register(Counter(
+    "media_stream_rejections_total", "Transmissões recusadas com 429 por falta de vaga", ("reason",)))
+media_stream_delay = registry.register(Counter(
+    "media_stream_delay_seconds_total", "Pausas entre blocos (limite de banda ou prioridade da API)", ("reason",)))
+upload_size = registry.register(Histogram(
+    "media_upload_bytes", "Tamanho dos arquivos enviados", ("type",), buckets=SIZE_BUCKETS))
+metadata_latency = registry.register(Histogram(
+    "metadata_extraction_seconds", "Duração da extração de metadados/capa", ("result",)))
+
+# Histórico de reprodução
+history_events_dropped = registry.register(Counter(
+    "history_events_dropped_total",
+    "Eventos de reprodução descartados (buffer cheio ou gravação falhando)", ("reason",)))
+
+# Imagens
+image_cache_requests = registry.register(Counter(
+    "image_memory_cache_requests_total", "Capas/thumbnails servidas do cache em memória", ("result",)))
+
+# Estatísticas da requisição corrente: [consultas, segundos no banco]
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(engine):
+    """Conta e cronometra as consultas do engine (globais e por requisição)"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_queries.inc()
+        db_query_latency.observe(elapsed)
+        stats = _request_db.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # Consulta que falhou: descartar o horário de início
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latência por rota, requisições em andamento e consultas por requisição"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_db.set(stats)
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_db.reset(token)
+            # Template da rota (ex.: /media/{media_id}) para não explodir a cardinalidade
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            http_latency.labels(method, route).observe(elapsed)
+            http_requests.labels(method, route, status[0]).inc()
+            db_queries_per_request.labels(route).observe(stats[0])
+            db_time_per_request.labels(route).observe(stats[1])
@@ -0,0 +1,299 @@
+"""
+Migrações versionadas do esquema.
+
+Cada migração roda uma única vez, em ordem, dentro de uma transação, e é
+registrada na tabela schema_migrations. Para alterar o esquema, acrescente
+uma nova função ao final de MIGRATIONS (nunca edite uma já publicada).
+
+As tabelas criadas por cada migração estão congeladas aqui (_V1, _V3, _V4),
+e não vêm dos modelos de app.main: mudar um modelo exige uma migração nova,
+e um banco novo passa pelos mesmos passos que um banco antigo atualizado.
+"""
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    inspect, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from app import play_stats
+
+# Chave de ordenação das listas; deve ser idêntica à usada nas consultas
+# (literal '' e não parâmetro, para o índice de expressão ser aproveitado)
+TITLE_SORT_SQL = "coalesce(title, '')"
+
+
+def column_exists(conn: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ADD COLUMN se a coluna ainda não existir"""
+    if not column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_index_if_missing(conn: Connection, name: str, table: str, columns: str):
+    """CREATE INDEX IF NOT EXISTS (colunas/expressões em SQL)"""
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# Esquema de antes das migrações (criado por create_all até então)
+_V1 = MetaData()
+
+Table(
+    "media", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("filename", String, nullable=False),
+    Column("title", String),
+    Column("artist", String),
+    Column("type", String, nullable=False),
+    Column("duration", Float),
+    Column("size", Integer),
+    Column("path", String, nullable=False, index=True),
+    Column("thumbnail_path", String),
+    Column("cover", String),
+    Column("is_favorite", Boolean),
+    Column("status", String, nullable=False, server_default="ready"),
+    Column("content_hash", String),
+    Column("source_mtime", Float),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+Table(
+    "playlists", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False),
+    Column("description", Text),
+    Column("created_at", DateTime),
+)
+
+Table(
+    "playlist_media", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("playlist_id", Integer, ForeignKey("playlists.id", ondelete="CASCADE"), nullable=False),
+    Column("media_id", Integer, ForeignKey("media.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("position", Float),
+    Index("ix_playlist_media_playlist_position", "playlist_id", "position", "id"),
+)
+
+Table(
+    "playback_history", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("media_id", Integer, nullable=False, index=True),
+    Column("position", Float),
+    Column("played_at", DateTime, index=True),
+)
+
+Table(
+    "resume_position", _V1,
+    Column("media_id", Integer, primary_key=True),
+    Column("position", Float, nullable=False),
+    Column("updated_at", DateTime),
+)
+
+Table(
+    "blobs", _V1,
+    Column("path", String, primary_key=True),
+    Column("hash", String, nullable=False, index=True),
+    Column("size", Integer),
+    Column("ref_count", Integer, nullable=False),
+    Column("created_at", DateTime),
+)
+
+Table(
+    "library_state", _V1,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+# Migração 3
+_V3 = MetaData()
+
+Table(
+    "media_changes", _V3,
+    Column("seq", Integer, primary_key=True),
+    Column("media_id", Integer, nullable=False),
+    Column("op", String, nullable=False),
+    Column("changed_at", DateTime),
+    Index("ix_media_changes_media_seq", "media_id", "seq"),
+    sqlite_autoincrement=True,
+)
+
+# Migração 4
+_V4 = MetaData()
+
+Table(
+    "media_play_stats", _V4,
+    Column("media_id", Integer, primary_key=True),
+    Column("play_count", Integer, nullable=False),
+    Column("listened_seconds", Float, nullable=False),
+    Column("last_played_at", DateTime),
+    Index("ix_media_play_stats_top", "play_count", "last_played_at"),
+    Index("ix_media_play_stats_recent", "last_played_at"),
+)
+
+Table(
+    "type_play_stats", _V4,
+    Column("type", String, primary_key=True),
+    Column("play_count", Integer, nullable=False),
+    Column("listened_seconds", Float, nullable=False),
+    Column("last_played_at", DateTime),
+)
+
+
+def _baseline(conn: Connection, metadata: MetaData):
+    """Tabelas de _V1, colunas/índices que bancos ainda mais antigos não têm e a linha de versão"""
+    _V1.create_all(bind=conn)
+    inspector = inspect(conn)
+    for table in _V1.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            default = ""
+            if column.server_default is not None:
+                default = f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    default += " NOT NULL"
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}"))
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+    if conn.execute(text("SELECT 1 FROM library_state WHERE id = 1")).first() is None:
+        conn.execute(text("INSERT INTO library_state (id, version) VALUES (1, 0)"))
+
+
+def _list_indexes(conn: Connection, metadata: MetaData):
+    """Índices que cobrem filtro + ordenação (título, id) das listas e o histórico por mídia"""
+    create_index_if_missing(conn, "ix_media_title_sort", "media", f"{TITLE_SORT_SQL}, id")
+    create_index_if_missing(conn, "ix_media_type_title_sort", "media", f"type, {TITLE_SORT_SQL}, id")
+    create_index_if_missing(conn, "ix_media_favorite_title_sort", "media", f"is_favorite, {TITLE_SORT_SQL}, id")
+    create_index_if_missing(conn, "ix_media_status", "media", "status")
+    create_index_if_missing(conn, "ix_playback_history_media_played", "playback_history", "media_id, played_at")
+    if conn.dialect.name == "postgresql":
+        # Bancos criados antes das posições fracionárias têm a coluna como INTEGER
+        conn.execute(text("ALTER TABLE playlist_media ALTER COLUMN position TYPE DOUBLE PRECISION"))
+        conn.execute(text("ANALYZE media"))
+    else:
+        conn.execute(text("ANALYZE"))
+
+
+# Colunas visíveis aos clientes: atualizações só de outras colunas (ex.: source_mtime) não geram alteração
+_CHANGE_COLUMNS = (
+    "filename, title, artist, type, duration, size, path, thumbnail_path, cover, "
+    "is_favorite, status, created_at, updated_at"
+)
+
+_SQLITE_CHANGE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS media_changes_ai AFTER INSERT ON media BEGIN
+        INSERT INTO media_changes (media_id, op, changed_at) VALUES (new.id, 'upsert', CURRENT_TIMESTAMP);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS media_changes_au AFTER UPDATE OF {_CHANGE_COLUMNS} ON media BEGIN
+        INSERT INTO media_changes (media_id, op, changed_at) VALUES (new.id, 'upsert', CURRENT_TIMESTAMP);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS media_changes_ad AFTER DELETE ON media BEGIN
+        INSERT INTO media_changes (media_id, op, changed_at) VALUES (old.id, 'delete', CURRENT_TIMESTAMP);
+    END
+    """,
+]
+
+_PG_CHANGE_TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION record_media_change() RETURNS trigger AS $$
+    BEGIN
+        -- Serializa os escritores de mídia: a ordem de seq passa a ser a ordem de commit,
+        -- e um cliente nunca vê seq maior antes de um menor ainda não confirmado
+        LOCK TABLE media_changes IN SHARE ROW EXCLUSIVE MODE;
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO media_changes (media_id, op, changed_at) VALUES (OLD.id, 'delete', now() AT TIME ZONE 'utc');
+            RETURN OLD;
+        END IF;
+        INSERT INTO media_changes (media_id, op, changed_at) VALUES (NEW.id, 'upsert', now() AT TIME ZONE 'utc');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS media_changes_aid ON media",
+    """
+    CREATE TRIGGER media_changes_aid AFTER INSERT OR DELETE ON media
+    FOR EACH ROW EXECUTE FUNCTION record_media_change()
+    """,
+    "DROP TRIGGER IF EXISTS media_changes_au ON media",
+    f"""
+    CREATE TRIGGER media_changes_au AFTER UPDATE OF {_CHANGE_COLUMNS} ON media
+    FOR EACH ROW EXECUTE FUNCTION record_media_change()
+    """,
+]
+
+
+def _media_changes(conn: Connection, metadata: MetaData):
+    """Registro de alterações (seq crescente) mantido por gatilhos em todo INSERT/UPDATE/DELETE de media"""
+    _V3.tables["media_changes"].create(bind=conn, checkfirst=True)
+    add_column_if_missing(conn, "library_state", "changes_floor", "INTEGER NOT NULL DEFAULT 0")
+    statements = _PG_CHANGE_TRIGGERS if conn.dialect.name == "postgresql" else _SQLITE_CHANGE_TRIGGERS
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def _play_stats(conn: Connection, metadata: MetaData):
+    """Estatísticas de reprodução por mídia e por tipo, preenchidas com o histórico existente"""
+    _V4.create_all(bind=conn)
+    play_stats.rebuild(conn)
+
+
+def _play_stats_sessions(conn: Connection, metadata: MetaData):
+    """Recalcula as estatísticas: uma reprodução por sessão e tempo ouvido pelo avanço da posição"""
+    play_stats.rebuild(conn)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection, MetaData], None]]] = [
+    (1, "esquema inicial", _baseline),
+    (2, "índices das listas e do histórico", _list_indexes),
+    (3, "registro de alterações das mídias", _media_changes),
+    (4, "estatísticas de reprodução", _play_stats),
+    (5, "estatísticas contadas por sessão de reprodução", _play_stats_sessions),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine: Engine, metadata: MetaData) -> List[int]:
+    """Aplica as migrações pendentes; retorna as versões aplicadas agora"""
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                migrate(conn, metadata)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                    {"v": version, "d": description},
+                )
+        except (IntegrityError, OperationalError, ProgrammingError) as e:
+            # Outro processo pode ter aplicado a mesma migração ao mesmo tempo
+            with engine.begin() as conn:
+                if version in applied_versions(conn):
+                    continue
+            raise RuntimeError(f"Falha na migração {version} ({description}): {e}") from e
+        print(f"Migração {version} aplicada: {description}")
+        applied.append(version)
+    return applied
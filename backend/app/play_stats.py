@@ -0,0 +1,134 @@
+"""
+Estatísticas de reprodução materializadas (por mídia e por tipo).
+
+Os clientes enviam o progresso periodicamente (também usado para retomar),
+então uma reprodução é uma sessão de eventos, não um evento:
+
+- começa uma reprodução quando não há evento anterior da mídia, quando a
+  posição voltou (recomeço) ou quando o evento anterior tem mais de
+  PLAY_SESSION_GAP segundos;
+- o tempo ouvido soma o avanço desde o evento anterior; depois de um
+  recomeço (ou sem evento anterior) conta a posição inteira, a partir do 0.
+
+As tabelas são atualizadas de forma incremental no mesmo lote que grava o
+histórico (o evento anterior vem de resume_position); rebuild() aplica a
+mesma regra sobre playback_history (só as linhas ainda retidas, ver
+HISTORY_RETENTION_DAYS).
+"""
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Pausa máxima dentro de uma mesma reprodução
+SESSION_GAP = int(os.getenv("PLAY_SESSION_GAP", "1800"))
+
+# Posições negativas/nulas valem 0 (mesma regra no SQL de rebuild)
+POSITION_SQL = "CASE WHEN h.position > 0 THEN h.position ELSE 0 END"
+
+# Segundos entre o evento e o anterior da mesma mídia, por dialeto
+_GAP_SQL = {
+    "sqlite": "(julianday(played_at) - julianday(prev_played_at)) * 86400",
+    "postgresql": "EXTRACT(EPOCH FROM played_at - prev_played_at)",
+}
+
+_SESSIONS_SQL = """
+WITH ordered AS (
+    SELECT h.media_id, m.type, h.played_at, {position} AS position,
+           LAG({position}) OVER (PARTITION BY h.media_id ORDER BY h.played_at, h.id) AS prev_position,
+           LAG(h.played_at) OVER (PARTITION BY h.media_id ORDER BY h.played_at, h.id) AS prev_played_at
+    FROM playback_history h JOIN media m ON m.id = h.media_id
+), scored AS (
+    SELECT media_id, type, played_at,
+           CASE WHEN prev_position IS NULL OR position < prev_position OR {gap} > :gap
+                THEN 1 ELSE 0 END AS starts,
+           CASE WHEN prev_position IS NOT NULL AND position >= prev_position
+                THEN position - prev_position ELSE position END AS listened
+    FROM ordered
+)
+"""
+
+_REBUILD_STATEMENTS = (
+    "DELETE FROM media_play_stats",
+    "INSERT INTO media_play_stats (media_id, play_count, listened_seconds, last_played_at) "
+    "{sessions} SELECT media_id, SUM(starts), SUM(listened), MAX(played_at) FROM scored GROUP BY media_id",
+    "DELETE FROM type_play_stats",
+    "INSERT INTO type_play_stats (type, play_count, listened_seconds, last_played_at) "
+    "{sessions} SELECT type, SUM(starts), SUM(listened), MAX(played_at) FROM scored GROUP BY type",
+)
+
+Previous = Tuple[float, object]  # (posição, horário) do último evento da mídia
+
+
+def listened_seconds(position) -> float:
+    return position if position and position > 0 else 0.0
+
+
+def as_stored(moment):
+    """
+    Horário como as colunas DateTime o devolvem: sem fuso, na hora local em
+    que foi gravado. Os eventos novos vêm com fuso (get_mozambique_time) e o
+    evento anterior vem do banco sem; comparar os dois falharia.
+    """
+    if moment is not None and moment.tzinfo is not None:
+        return moment.replace(tzinfo=None)
+    return moment
+
+
+def score_event(position, played_at, previous: Optional[Previous]) -> Tuple[int, float]:
+    """(reproduções iniciadas, segundos ouvidos) de um evento, dado o anterior da mesma mídia"""
+    position = listened_seconds(position)
+    played_at = as_stored(played_at)
+    if previous is None:
+        return 1, position
+    prev_position, prev_played_at = previous
+    prev_position = listened_seconds(prev_position)
+    prev_played_at = as_stored(prev_played_at)
+    if position < prev_position:
+        return 1, position
+    starts = 0
+    if prev_played_at is None or (played_at - prev_played_at).total_seconds() > SESSION_GAP:
+        starts = 1
+    return starts, position - prev_position
+
+
+def aggregate(events: Iterable[tuple], types: Dict[int, str],
+              previous: Dict[int, Previous]) -> Tuple[Dict[int, list], Dict[str, list]]:
+    """
+    Soma um lote de eventos (media_id, posição, horário) em
+    {media_id: [reproduções, segundos, última]} e {tipo: [...]}.
+    previous tem o último evento já gravado de cada mídia (atualizado aqui).
+    Eventos de mídias inexistentes (sem tipo) são ignorados, como no rebuild.
+    """
+    per_media: Dict[int, list] = {}
+    per_type: Dict[str, list] = {}
+    for media_id, position, played_at in sorted(events, key=lambda e: (e[0], as_stored(e[2]))):
+        media_type = types.get(media_id)
+        if media_type is None:
+            continue
+        played_at = as_stored(played_at)
+        starts, seconds = score_event(position, played_at, previous.get(media_id))
+        previous[media_id] = (position, played_at)
+        for totals, key in ((per_media, media_id), (per_type, media_type)):
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [starts, seconds, played_at]
+            else:
+                entry[0] += starts
+                entry[1] += seconds
+                if played_at > entry[2]:
+                    entry[2] = played_at
+    return per_media, per_type
+
+
+def rebuild(conn: Connection) -> int:
+    """Recalcula as duas tabelas a partir do histórico bruto; retorna quantas mídias têm estatísticas"""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        # Lotes do histórico gravados durante o rebuild esperam e somam depois
+        conn.execute(text("LOCK TABLE media_play_stats, type_play_stats IN EXCLUSIVE MODE"))
+    sessions = _SESSIONS_SQL.format(position=POSITION_SQL, gap=_GAP_SQL.get(dialect, _GAP_SQL["sqlite"]))
+    for statement in _REBUILD_STATEMENTS:
+        conn.execute(text(statement.format(sessions=sessions)), {"gap": SESSION_GAP})
+    return conn.execute(text("SELECT COUNT(*) FROM media_play_stats")).scalar()
@@ -0,0 +1,297 @@
+"""
+Uploads retomáveis em partes (no estilo do protocolo tus).
+
+Cada sessão é um diretório em uploads/tmp/resumable/<id> com:
+  - info.json: nome, tipo e tamanho total declarados na criação
+  - data: arquivo do tamanho final; cada parte é gravada direto no seu offset
+  - parts/<início>-<fim>: marcador vazio de cada trecho recebido
+
+Os marcadores só são criados (nunca reescritos), então partes simultâneas ou
+vindas de outro worker não se atropelam. O hash SHA-256 é calculado enquanto
+as partes chegam em ordem; na finalização só o trecho ainda não visto é lido.
+O estado do hash é de cada processo: se a parte seguinte chega a outro worker,
+ele relê do disco o prefixo já recebido e continua dali.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app import storage
+
+SESSIONS_DIR = storage.TMP_DIR / "resumable"
+# Sessões sem nenhuma escrita há mais que isso são apagadas pela manutenção
+SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+MAX_UPLOAD_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(8 * 1024 ** 3)))
+
+Range = Tuple[int, int]  # [início, fim)
+
+
+class UploadError(Exception):
+    """Erro de protocolo; status é o código HTTP sugerido"""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class _Hasher:
+    """SHA-256 do prefixo contíguo [0, offset) já recebido por este processo"""
+
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.offset = 0
+        self.valid = True
+        self.lock = threading.Lock()
+
+
+_hashers: Dict[str, _Hasher] = {}
+_hashers_lock = threading.Lock()
+
+
+def _session_dir(upload_id: str) -> Path:
+    # O id vem da URL: aceitar só o formato gerado em create()
+    if len(upload_id) != 32 or any(c not in "0123456789abcdef" for c in upload_id):
+        raise UploadError(404, "Upload não encontrado")
+    return SESSIONS_DIR / upload_id
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def create(filename: str, length: int, content_type: Optional[str] = None) -> dict:
+    """Abre uma sessão para um arquivo de `length` bytes"""
+    if length < 1:
+        raise UploadError(400, "Tamanho do arquivo inválido")
+    if length > MAX_UPLOAD_SIZE:
+        raise UploadError(413, f"Arquivo maior que o limite de {MAX_UPLOAD_SIZE} bytes")
+    upload_id = uuid.uuid4().hex
+    directory = SESSIONS_DIR / upload_id
+    (directory / "parts").mkdir(parents=True)
+    info = {
+        "id": upload_id,
+        "filename": filename,
+        "content_type": content_type,
+        "length": length,
+        "created_at": time.time(),
+    }
+    with open(directory / "data", "wb") as f:
+        # Arquivo esparso: nada é escrito até as partes chegarem
+        f.truncate(length)
+    (directory / "info.json").write_text(json.dumps(info))
+    with _hashers_lock:
+        _hashers[upload_id] = _Hasher()
+    return status(upload_id)
+
+
+def load_info(upload_id: str) -> dict:
+    try:
+        return json.loads((_session_dir(upload_id) / "info.json").read_text())
+    except FileNotFoundError:
+        raise UploadError(404, "Upload não encontrado")
+
+
+def received_ranges(upload_id: str) -> List[Range]:
+    """Trechos já gravados, unidos e ordenados"""
+    ranges = []
+    try:
+        names = os.listdir(_session_dir(upload_id) / "parts")
+    except FileNotFoundError:
+        raise UploadError(404, "Upload não encontrado")
+    for name in names:
+        start, _, end = name.partition("-")
+        ranges.append((int(start), int(end)))
+    return merge_ranges(ranges)
+
+
+def status(upload_id: str) -> dict:
+    """Estado da sessão: offset = bytes contíguos desde o início"""
+    info = load_info(upload_id)
+    ranges = received_ranges(upload_id)
+    offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+    try:
+        last_write = os.path.getmtime(_session_dir(upload_id) / "data")
+    except FileNotFoundError:
+        raise UploadError(409, "Upload já finalizado")
+    return {
+        "id": upload_id,
+        "filename": info["filename"],
+        "length": info["length"],
+        "offset": offset,
+        "received": sum(end - start for start, end in ranges),
+        "ranges": [list(r) for r in ranges],
+        "complete": ranges == [(0, info["length"])],
+        "expires_at": max(last_write, info["created_at"]) + SESSION_TTL,
+    }
+
+
+def format_ranges(ranges: List[list]) -> str:
+    """Trechos recebidos no formato do cabeçalho Upload-Ranges (ex.: 0-1023,4096-8191)"""
+    return ",".join(f"{start}-{end - 1}" for start, end in ranges)
+
+
+class ChunkWriter:
+    """
+    Grava uma parte a partir de `offset`, pedaço por pedaço, sem ler nada do
+    que já está no arquivo. close() registra o trecho efetivamente gravado,
+    mesmo que a conexão tenha caído no meio (o cliente retoma dali).
+    """
+
+    def __init__(self, upload_id: str, offset: int):
+        info = load_info(upload_id)
+        if offset < 0 or offset >= info["length"]:
+            raise UploadError(400, "Upload-Offset fora do arquivo")
+        self.upload_id = upload_id
+        self.directory = _session_dir(upload_id)
+        self.length = info["length"]
+        self.start = offset
+        self.position = offset
+        try:
+            self._file = open(self.directory / "data", "r+b")
+        except FileNotFoundError:
+            raise UploadError(404, "Upload não encontrado")
+        self._file.seek(offset)
+        self._hasher = _hasher_at(upload_id, offset)
+
+    def write(self, chunk: bytes):
+        if self.position + len(chunk) > self.length:
+            raise UploadError(413, "Parte ultrapassa o tamanho declarado do arquivo")
+        self._file.write(chunk)
+        hasher = self._hasher
+        if hasher is not None and hasher.valid:
+            with hasher.lock:
+                if self.position == hasher.offset:
+                    hasher.sha.update(chunk)
+                    hasher.offset += len(chunk)
+                elif self.position < hasher.offset:
+                    # Reenvio sobre um trecho já calculado: refazer o hash na finalização
+                    hasher.valid = False
+        self.position += len(chunk)
+
+    def close(self):
+        self._file.close()
+        if self.position > self.start:
+            (self.directory / "parts" / f"{self.start}-{self.position}").touch()
+
+
+def _hasher_at(upload_id: str, offset: int) -> _Hasher:
+    """
+    Hasher da sessão pronto para receber bytes a partir de `offset`. Criado
+    se este processo ainda não tem um (sessão aberta ou continuada em outro
+    worker) e atualizado com o prefixo [hasher.offset, offset) lido do disco,
+    quando esse trecho já foi todo recebido.
+    """
+    with _hashers_lock:
+        hasher = _hashers.get(upload_id)
+        if hasher is None:
+            hasher = _hashers[upload_id] = _Hasher()
+    with hasher.lock:
+        if not hasher.valid or hasher.offset >= offset:
+            return hasher
+        ranges = received_ranges(upload_id)
+        if not ranges or ranges[0][0] != 0 or ranges[0][1] < offset:
+            return hasher
+        with open(_session_dir(upload_id) / "data", "rb") as f:
+            f.seek(hasher.offset)
+            remaining = offset - hasher.offset
+            while remaining > 0:
+                chunk = f.read(min(storage.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                hasher.sha.update(chunk)
+                remaining -= len(chunk)
+        hasher.offset = offset - remaining
+    return hasher
+
+
+def _digest(upload_id: str, path: Path) -> str:
+    """Hash do arquivo completo, lendo só o que não foi calculado durante o envio"""
+    with _hashers_lock:
+        hasher = _hashers.pop(upload_id, None)
+    if hasher is None or not hasher.valid:
+        hasher = _Hasher()
+    sha, offset = hasher.sha, hasher.offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(storage.CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def claim(upload_id: str) -> Tuple[dict, Path, str]:
+    """
+    Encerra uma sessão completa: move os dados para um temporário e calcula o
+    hash. Retorna (info, temporário, hash). Só uma finalização vence a corrida.
+    """
+    info = load_info(upload_id)
+    current = status(upload_id)
+    if not current["complete"]:
+        raise UploadError(409, f"Upload incompleto: {current['received']} de {info['length']} bytes recebidos")
+    directory = _session_dir(upload_id)
+    storage.TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = storage.TMP_DIR / uuid.uuid4().hex
+    try:
+        os.replace(directory / "data", tmp_path)
+    except FileNotFoundError:
+        raise UploadError(409, "Upload já finalizado")
+    try:
+        digest = _digest(upload_id, tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    shutil.rmtree(directory, ignore_errors=True)
+    return info, tmp_path, digest
+
+
+def abort(upload_id: str):
+    """Cancela a sessão e apaga o que foi recebido"""
+    directory = _session_dir(upload_id)
+    if not directory.exists():
+        raise UploadError(404, "Upload não encontrado")
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def collect_expired(now: Optional[float] = None) -> int:
+    """Apaga sessões sem escrita há mais de SESSION_TTL segundos; retorna quantas"""
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        entries = list(os.scandir(SESSIONS_DIR))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        directory = Path(entry.path)
+        try:
+            last_write = max(os.path.getmtime(p) for p in (directory / "data", directory / "info.json") if p.exists())
+        except ValueError:
+            # Sem data nem info: sessão sendo finalizada ou criada agora; usar o diretório
+            last_write = entry.stat().st_mtime
+        if now - last_write <= SESSION_TTL:
+            continue
+        with _hashers_lock:
+            _hashers.pop(entry.name, None)
+        shutil.rmtree(directory, ignore_errors=True)
+        removed += 1
+    # Sessões finalizadas, canceladas ou expiradas por outro worker
+    with _hashers_lock:
+        for upload_id in [u for u in _hashers if not (SESSIONS_DIR / u).exists()]:
+            del _hashers[upload_id]
+    return removed
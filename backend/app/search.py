@@ -0,0 +1,210 @@
+"""Índice de busca textual (SQLite FTS5 / PostgreSQL tsvector) sobre título, artista e nome do arquivo"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Pesos de relevância: título > artista > nome do arquivo
+TITLE_WEIGHT = 10.0
+ARTIST_WEIGHT = 5.0
+FILENAME_WEIGHT = 1.0
+
+# Tokens = sequências de letras/dígitos (o sublinhado também separa palavras)
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS media_fts USING fts5(
+        title, artist, filename,
+        content='media', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS media_fts_ai AFTER INSERT ON media BEGIN
+        INSERT INTO media_fts(rowid, title, artist, filename)
+        VALUES (new.id, new.title, new.artist, new.filename);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS media_fts_ad AFTER DELETE ON media BEGIN
+        INSERT INTO media_fts(media_fts, rowid, title, artist, filename)
+        VALUES ('delete', old.id, old.title, old.artist, old.filename);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS media_fts_au AFTER UPDATE OF title, artist, filename ON media BEGIN
+        INSERT INTO media_fts(media_fts, rowid, title, artist, filename)
+        VALUES ('delete', old.id, old.title, old.artist, old.filename);
+        INSERT INTO media_fts(rowid, title, artist, filename)
+        VALUES (new.id, new.title, new.artist, new.filename);
+    END
+    """,
+]
+
+# Documento ponderado usado tanto no índice GIN quanto na consulta (devem ser idênticos)
+_PG_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(artist, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(filename, '')), 'C')"
+)
+
+# Mesmo documento sem acentos (como o remove_diacritics do FTS5): "cancao" acha "Canção".
+# unaccent() não é IMMUTABLE (o dicionário vem do search_path) e não pode entrar
+# num índice; media_unaccent fixa o dicionário.
+_PG_UNACCENT_DOCUMENT = (
+    "setweight(to_tsvector('simple', media_unaccent(coalesce(title, ''))), 'A') || "
+    "setweight(to_tsvector('simple', media_unaccent(coalesce(artist, ''))), 'B') || "
+    "setweight(to_tsvector('simple', media_unaccent(coalesce(filename, ''))), 'C')"
+)
+
+_PG_UNACCENT_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION media_unaccent(text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """,
+    f"CREATE INDEX IF NOT EXISTS ix_media_search_unaccent ON media USING GIN (({_PG_UNACCENT_DOCUMENT}))",
+    "DROP INDEX IF EXISTS ix_media_search",
+]
+
+# Sem permissão para a extensão unaccent: índice que diferencia acentos
+_PG_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_media_search ON media USING GIN (({_PG_DOCUMENT}))",
+]
+
+# Índices do PostgreSQL em ordem de preferência: (documento, consulta)
+_PG_INDEXES = {
+    "ix_media_search_unaccent": (_PG_UNACCENT_DOCUMENT, "to_tsquery('simple', media_unaccent(:query))"),
+    "ix_media_search": (_PG_DOCUMENT, "to_tsquery('simple', :query)"),
+}
+
+# Dialeto com índice disponível ("sqlite", "postgresql") ou None (busca por LIKE)
+_backend: Optional[str] = None
+# Índice em uso no PostgreSQL (chave de _PG_INDEXES)
+_pg_index: Optional[str] = None
+
+
+def init_search_index(engine: Engine) -> Optional[str]:
+    """Cria o índice e os gatilhos de sincronização, reconstruindo o índice se for novo"""
+    global _backend, _pg_index
+    dialect = engine.dialect.name
+    try:
+        if dialect == "sqlite":
+            with engine.begin() as conn:
+                created = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'"
+                )).first() is None
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                if created:
+                    # Indexar as linhas já existentes
+                    conn.execute(text("INSERT INTO media_fts(media_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            _pg_index = _create_pg_index(engine)
+        else:
+            return None
+    except Exception as e:
+        # SQLite sem FTS5, permissões insuficientes etc.: manter a busca por LIKE
+        print(f"Índice de busca indisponível, usando LIKE: {e}")
+        return None
+    _backend = dialect
+    return _backend
+
+
+def _create_pg_index(engine: Engine) -> str:
+    """Índice sem acentos; sem a extensão unaccent, o que diferencia acentos"""
+    try:
+        with engine.begin() as conn:
+            for statement in _PG_UNACCENT_DDL:
+                conn.execute(text(statement))
+        return "ix_media_search_unaccent"
+    except Exception as e:
+        print(f"Extensão unaccent indisponível, a busca vai diferenciar acentos: {e}")
+    with engine.begin() as conn:
+        for statement in _PG_DDL:
+            conn.execute(text(statement))
+    return "ix_media_search"
+
+
+def detect_search_index(engine: Engine) -> Optional[str]:
+    """
+    Só verifica se o índice já existe (sem DDL): usado pelos workers, que
+    sobem depois de init_search_index ter rodado uma vez no processo principal.
+    """
+    global _backend, _pg_index
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'media_fts'"
+    elif dialect == "postgresql":
+        names = ", ".join(f"'{name}'" for name in _PG_INDEXES)
+        query = f"SELECT indexname FROM pg_indexes WHERE indexname IN ({names})"
+    else:
+        return None
+    try:
+        with engine.connect() as conn:
+            found = {row[0] for row in conn.execute(text(query))}
+    except Exception as e:
+        print(f"Índice de busca não verificado, usando LIKE: {e}")
+        found = set()
+    if dialect == "postgresql":
+        _pg_index = next((name for name in _PG_INDEXES if name in found), None)
+    _backend = dialect if found else None
+    return _backend
+
+
+def search_backend() -> Optional[str]:
+    """Dialeto do índice em uso, ou None se a busca deve usar LIKE"""
+    return _backend
+
+
+def tokenize(query: str) -> List[str]:
+    """Divide a consulta em termos normalizados"""
+    return [token.lower() for token in _TOKEN_RE.findall(query)]
+
+
+def _fts5_match(tokens: List[str]) -> str:
+    # Cada termo entre aspas (sem operadores do FTS5) e com busca por prefixo
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _tsquery(tokens: List[str]) -> str:
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def search_media_ids(db: Session, query: str, limit: Optional[int] = None, offset: int = 0) -> List[int]:
+    """Ids das mídias que casam com a consulta, em ordem de relevância"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    # LIMIT -1 (SQLite) e LIMIT NULL (PostgreSQL) significam "sem limite"
+    if limit is None:
+        limit = -1 if _backend == "sqlite" else None
+    if _backend == "sqlite":
+        rows = db.execute(text(
+            "SELECT rowid FROM media_fts WHERE media_fts MATCH :match "
+            "ORDER BY bm25(media_fts, :w_title, :w_artist, :w_filename), rowid "
+            "LIMIT :limit OFFSET :offset"
+        ), {
+            "match": _fts5_match(tokens),
+            "w_title": TITLE_WEIGHT,
+            "w_artist": ARTIST_WEIGHT,
+            "w_filename": FILENAME_WEIGHT,
+            "limit": limit,
+            "offset": offset,
+        })
+    elif _backend == "postgresql":
+        document, tsquery = _PG_INDEXES[_pg_index]
+        rows = db.execute(text(
+            f"SELECT id FROM media, {tsquery} AS q "
+            f"WHERE ({document}) @@ q "
+            f"ORDER BY ts_rank({document}, q) DESC, id "
+            f"LIMIT :limit OFFSET :offset"
+        ), {"query": _tsquery(tokens), "limit": limit, "offset": offset})
+    else:
+        raise RuntimeError("Índice de busca não inicializado")
+    return [row[0] for row in rows]
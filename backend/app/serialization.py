@@ -0,0 +1,44 @@
+"""
+Caminho rápido de serialização JSON (opcional, FAST_SERIALIZATION=1).
+
+Ativado, as listas de mídias são montadas direto dos objetos ORM (sem
+validar cada linha com Pydantic) e codificadas com orjson quando instalado.
+Desativado, as respostas usam o codificador padrão do Starlette.
+"""
+import json
+import os
+from datetime import date, datetime
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional: sem ele, json da biblioteca padrão
+    orjson = None
+
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "0") == "1"
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON compacto em UTF-8; datas em ISO 8601 (mesmo formato do Pydantic)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que aceita datas e usa orjson no caminho rápido"""
+
+    def render(self, content: Any) -> bytes:
+        if FAST_SERIALIZATION:
+            return dumps(content)
+        return super().render(content)
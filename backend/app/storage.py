@@ -0,0 +1,137 @@
+"""Armazenamento endereçado por conteúdo (SHA-256) para mídias, capas e thumbnails"""
+import hashlib
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: exclusão só entre as threads do processo
+    fcntl = None
+
+UPLOAD_DIR = Path("uploads")
+BLOB_DIR = UPLOAD_DIR / "blobs"
+COVERS_DIR = UPLOAD_DIR / "covers"
+THUMBNAILS_DIR = UPLOAD_DIR / "thumbnails"
+TMP_DIR = UPLOAD_DIR / "tmp"
+LOCK_PATH = UPLOAD_DIR / ".blobs.lock"
+
+CHUNK_SIZE = 1024 * 1024
+
+_SUFFIX_RE = re.compile(r"^\.[a-z0-9]{1,8}$")
+_HASH_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,8})?$")
+
+_thread_lock = threading.Lock()
+
+
+def safe_suffix(filename: Optional[str]) -> str:
+    """Extensão normalizada do arquivo original ('' se suspeita)"""
+    suffix = Path(filename or "").suffix.lower()
+    return suffix if _SUFFIX_RE.match(suffix) else ""
+
+
+def blob_path(digest: str, suffix: str = "") -> Path:
+    """Caminho fragmentado por hash: uploads/blobs/ab/cd/abcd...<ext>"""
+    return BLOB_DIR / digest[:2] / digest[2:4] / f"{digest}{suffix}"
+
+
+def is_content_addressed(path: Optional[str]) -> bool:
+    """Indica se o arquivo foi gravado por este módulo (nome = hash do conteúdo)"""
+    return bool(path) and bool(_HASH_NAME_RE.match(Path(path).name))
+
+
+@contextmanager
+def blob_lock():
+    """
+    Exclusão mútua entre threads e processos (workers, scripts) para:
+    gravar um arquivo e fazer o commit da sua referência (tabela blobs), e
+    conferir que o arquivo não tem referência e apagá-lo. Sem isso, um
+    upload do mesmo conteúdo entre o commit de uma exclusão e o unlink
+    ficaria apontando para um arquivo apagado.
+    """
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOCK_PATH, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def receive_stream(source, chunk_size: int = CHUNK_SIZE) -> Tuple[Path, str, int]:
+    """
+    Copia um arquivo (ex.: UploadFile.file) para um temporário calculando
+    o hash durante a cópia. Retorna (temporário, hash, tamanho).
+    """
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buffer.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def commit_blob(tmp_path: Path, destination: Path) -> bool:
+    """
+    Move o temporário para o destino definitivo.
+    Retorna False se o conteúdo já existia (o temporário é descartado).
+    Chamar sob blob_lock, até o commit da referência ao arquivo.
+    """
+    if destination.exists():
+        tmp_path.unlink(missing_ok=True)
+        return False
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, destination)
+    return True
+
+
+def store_bytes(data: bytes, directory: Path, suffix: str) -> Tuple[Path, str]:
+    """Grava bytes em directory/<hash><suffix> se ainda não existir (sob blob_lock, como commit_blob)"""
+    digest = hashlib.sha256(data).hexdigest()
+    destination = directory / f"{digest}{suffix}"
+    if not destination.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = directory / f".{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, destination)
+    return destination, digest
+
+
+def image_suffix(data: bytes) -> str:
+    """Extensão da imagem a partir dos primeiros bytes"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".jpg"
+
+
+def remove_file(path_str: str):
+    """Remove um arquivo armazenado, registrando o resultado"""
+    path = Path(path_str)
+    if path.exists():
+        try:
+            path.unlink()
+            print(f"Arquivo deletado: {path}")
+        except Exception as e:
+            print(f"Erro ao deletar arquivo {path}: {e}")
@@ -0,0 +1,333 @@
+"""Streaming de arquivos de mídia com suporte a HTTP Range (206 Partial Content)"""
+import mimetypes
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app import metrics
+from app.governor import StreamGovernor, StreamRejected, StreamTicket
+
+# Tipos que o módulo mimetypes não conhece em todas as plataformas
+mimetypes.add_type("audio/mp4", ".m4a")
+mimetypes.add_type("audio/aac", ".aac")
+mimetypes.add_type("audio/flac", ".flac")
+mimetypes.add_type("audio/ogg", ".ogg")
+mimetypes.add_type("audio/ogg", ".oga")
+mimetypes.add_type("audio/opus", ".opus")
+mimetypes.add_type("audio/wav", ".wav")
+mimetypes.add_type("audio/webm", ".weba")
+mimetypes.add_type("video/mp4", ".m4v")
+mimetypes.add_type("video/webm", ".webm")
+mimetypes.add_type("video/x-matroska", ".mkv")
+mimetypes.add_type("video/quicktime", ".mov")
+mimetypes.add_type("video/3gpp", ".3gp")
+mimetypes.add_type("image/webp", ".webp")
+
+CHUNK_SIZE = 64 * 1024
+# Limite de intervalos por requisição (evita abuso com milhares de ranges pequenos)
+MAX_RANGES = 16
+
+Range = Tuple[int, int]  # (início, fim) inclusivos
+
+
+def guess_media_type(*names: Optional[str]) -> str:
+    """Retorna o Content-Type a partir do primeiro nome com extensão conhecida"""
+    for name in names:
+        if not name:
+            continue
+        media_type, _ = mimetypes.guess_type(name)
+        if media_type:
+            return media_type
+    return "application/octet-stream"
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """ETag forte baseado em tamanho e data de modificação"""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[Range]]:
+    """
+    Interpreta o cabeçalho Range.
+
+    Retorna None se o cabeçalho for inválido (deve ser ignorado) e
+    uma lista vazia se nenhum intervalo for satisfazível (416).
+    """
+    unit, _, ranges_str = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges_str:
+        return None
+
+    specs = [spec.strip() for spec in ranges_str.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges: List[Range] = []
+    for spec in specs:
+        start_str, sep, end_str = spec.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                # Sufixo: últimos N bytes
+                suffix = int(end_str)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start = max(file_size - suffix, 0)
+                end = file_size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else None
+                if start < 0 or (end is not None and end < start):
+                    return None
+                end = file_size - 1 if end is None else min(end, file_size - 1)
+        except ValueError:
+            return None
+        if start < file_size:
+            ranges.append((start, end))
+
+    # Juntar intervalos sobrepostos ou adjacentes
+    ranges.sort()
+    merged: List[Range] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header_value: str, etag: str, weak: bool) -> bool:
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if weak:
+            if candidate.removeprefix("W/") == etag.removeprefix("W/"):
+                return True
+        elif not candidate.startswith("W/") and candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header_value: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header_value).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def _if_range_matches(header_value: str, etag: str, last_modified: str) -> bool:
+    header_value = header_value.strip()
+    if header_value.startswith('"') or header_value.startswith("W/"):
+        # If-Range exige comparação forte
+        return _etag_matches(header_value, etag, weak=False)
+    return header_value == last_modified
+
+
+class MediaFileResponse(Response):
+    """
+    Resposta de arquivo com Range (simples e múltiplo), If-Range,
+    If-None-Match e If-Modified-Since.
+
+    Quando o servidor ASGI oferece a extensão "http.response.pathsend",
+    o corpo completo é enviado sem cópia (sendfile); caso contrário o
+    arquivo é lido em blocos.
+
+    Com um governor, o corpo só é enviado se houver vaga para o cliente
+    (senão a resposta vira um 429) e os blocos seguem o ritmo definido por ele.
+    """
+
+    chunk_size = CHUNK_SIZE
+
+    def __init__(
+        self,
+        path: Path,
+        request_headers: Headers,
+        method: str = "GET",
+        media_type: Optional[str] = None,
+        filename: Optional[str] = None,
+        stat_result: Optional[os.stat_result] = None,
+        cache_control: str = "public, max-age=0, must-revalidate",
+        governor: Optional[StreamGovernor] = None,
+        client: str = "",
+    ) -> None:
+        self.path = Path(path)
+        self.governor = governor
+        self.client = client
+        self.ticket: Optional[StreamTicket] = None
+        self.stat_result = stat_result or os.stat(self.path)
+        self.send_body = method.upper() != "HEAD"
+        self.media_type = media_type or guess_media_type(filename, self.path.name)
+        self.background = None
+        self.ranges: List[Range] = []
+        self.boundary: Optional[str] = None
+
+        file_size = self.stat_result.st_size
+        etag = make_etag(self.stat_result)
+        last_modified = formatdate(self.stat_result.st_mtime, usegmt=True)
+        self.status_code = 200
+        self.raw_headers = []
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+        self.headers["cache-control"] = cache_control
+
+        # Revalidação condicional (If-None-Match tem precedência)
+        if_none_match = request_headers.get("if-none-match")
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_none_match is not None:
+            not_modified = _etag_matches(if_none_match, etag, weak=True)
+        elif if_modified_since is not None:
+            not_modified = _not_modified_since(if_modified_since, self.stat_result.st_mtime)
+        else:
+            not_modified = False
+        if not_modified:
+            self.status_code = 304
+            self.send_body = False
+            return
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and (if_range is None or _if_range_matches(if_range, etag, last_modified)):
+            ranges = parse_range_header(range_header, file_size)
+            if ranges == []:
+                self.status_code = 416
+                self.send_body = False
+                self.headers["content-range"] = f"bytes */{file_size}"
+                self.headers["content-length"] = "0"
+                return
+            if ranges:
+                self.ranges = ranges
+
+        if not self.ranges:
+            self.headers["content-type"] = self.media_type
+            self.headers["content-length"] = str(file_size)
+        elif len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            self.status_code = 206
+            self.headers["content-type"] = self.media_type
+            self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            self.status_code = 206
+            self.boundary = secrets.token_hex(16)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            self.headers["content-length"] = str(self._multipart_length())
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {self.media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{self.stat_result.st_size}\r\n\r\n"
+        ).encode("latin-1")
+
+    def _closing_boundary(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("latin-1")
+
+    def _multipart_length(self) -> int:
+        length = len(self._closing_boundary())
+        for start, end in self.ranges:
+            length += len(self._part_header(start, end)) + (end - start + 1) + 2
+        return length
+
+    async def _read(self, file, size: int) -> bytes:
+        if self.governor is not None:
+            return await self.governor.read(file, size)
+        return await anyio.to_thread.run_sync(file.read, size)
+
+    async def _send_range(self, send: Send, file, start: int, end: int, more_body: bool) -> None:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await self._read(file, min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            metrics.media_bytes_sent.inc(len(chunk))
+            await send({
+                "type": "http.response.body",
+                "body": chunk,
+                "more_body": more_body or remaining > 0,
+            })
+            if self.ticket is not None and (more_body or remaining > 0):
+                # Sem pausa depois do último bloco: a vaga é liberada logo
+                await self.governor.pace(self.ticket, len(chunk))
+        if remaining > 0 and not more_body:
+            # Arquivo truncado durante o envio: encerrar a resposta
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.send_body and self.governor is not None:
+            try:
+                self.ticket = self.governor.acquire(self.client)
+            except StreamRejected as e:
+                await e.response()(scope, receive, send)
+                return
+        try:
+            await self._respond(scope, send)
+        finally:
+            if self.ticket is not None:
+                self.governor.release(self.ticket)
+                self.ticket = None
+
+    async def _respond(self, scope: Scope, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        metrics.media_active_streams.inc()
+        try:
+            await self._send_body(scope, send)
+        finally:
+            metrics.media_active_streams.dec()
+
+    async def _send_body(self, scope: Scope, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        # Envio sem cópia não passa pelos blocos: só sem limite de banda
+        throttled = self.governor is not None and self.governor.rate_limit > 0
+        if not self.ranges and "http.response.pathsend" in extensions and not throttled:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            metrics.media_bytes_sent.inc(self.stat_result.st_size)
+            return
+
+        limiter = self.governor.io_limiter if self.governor is not None else None
+        file = await anyio.to_thread.run_sync(open, self.path, "rb", limiter=limiter)
+        try:
+            if not self.ranges:
+                await self._send_range(send, file, 0, self.stat_result.st_size - 1, more_body=False)
+                if self.stat_result.st_size == 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif len(self.ranges) == 1:
+                start, end = self.ranges[0]
+                await self._send_range(send, file, start, end, more_body=False)
+            else:
+                for start, end in self.ranges:
+                    await send({
+                        "type": "http.response.body",
+                        "body": self._part_header(start, end),
+                        "more_body": True,
+                    })
+                    await self._send_range(send, file, start, end, more_body=True)
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+                await send({
+                    "type": "http.response.body",
+                    "body": self._closing_boundary(),
+                    "more_body": False,
+                })
+        finally:
+            file.close()
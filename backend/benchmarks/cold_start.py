@@ -0,0 +1,97 @@
+"""
+Tempo de inicialização do servidor (run.py) até todos os workers atenderem.
+
+Mede separadamente a importação de app.main em um processo novo e o tempo
+total até todos os workers (1..N) estarem prontos, sobre uma biblioteca
+gerada por benchmarks.generate_library.
+
+Uso (a partir de backend/):
+    python -m benchmarks.cold_start --size 10k [--workers 1,2,4] [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.run_benchmarks import BACKEND_DIR, DATA_DIR, free_port
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def measure_import(data_dir: Path, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=data_dir, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_startup(data_dir: Path, env: dict, workers: int, timeout: float = 120) -> float:
+    """Segundos entre iniciar run.py e todos os workers concluírem a inicialização"""
+    import httpx
+
+    port = free_port()
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY=str(workers))
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, str(BACKEND_DIR / "run.py")], cwd=data_dir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    ready = threading.Event()
+
+    def watch():
+        # O uvicorn registra uma linha por worker ao fim do lifespan
+        count = 0
+        for line in server.stderr:
+            if "Application startup complete" in line:
+                count += 1
+                if count == workers:
+                    ready.set()
+
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        if not ready.wait(timeout):
+            raise RuntimeError("servidor não iniciou")
+        elapsed = time.perf_counter() - started
+        if httpx.get(f"http://127.0.0.1:{port}/health", timeout=5).status_code != 200:
+            raise RuntimeError("/health não respondeu")
+        return elapsed
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de inicialização da API")
+    parser.add_argument("--size", default="10k", help="Biblioteca gerada em benchmarks/data/<tamanho>")
+    parser.add_argument("--data", type=Path, help="Diretório da biblioteca (em vez de --size)")
+    parser.add_argument("--workers", default="1,2", help="Quantidades de workers separadas por vírgula")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    data_dir = (args.data or DATA_DIR / args.size).resolve()
+    if not (data_dir / "media_player.db").exists():
+        parser.error(f"Biblioteca não encontrada em {data_dir}; gere com benchmarks.generate_library")
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), DATABASE_URL="sqlite:///./media_player.db")
+
+    imports = [measure_import(data_dir, env) for _ in range(args.runs)]
+    print(f"import app.main: mediana {statistics.median(imports) * 1000:.0f}ms "
+          f"(min {min(imports) * 1000:.0f}ms)")
+    for workers in (int(w) for w in args.workers.split(",")):
+        times = [measure_startup(data_dir, env, workers) for _ in range(args.runs)]
+        print(f"run.py com {workers} worker(s) prontos: mediana {statistics.median(times):.2f}s "
+              f"(min {min(times):.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Compara dois resultados de benchmarks.run_benchmarks.
+
+Uso (a partir de backend/):
+    python -m benchmarks.compare antes.json depois.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps")
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "    -"
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+
+def compare(before: dict, after: dict):
+    print(f"antes:  {before['meta']['commit']} ({before['meta']['timestamp']}, {before['meta']['rows']} mídias)")
+    print(f"depois: {after['meta']['commit']} ({after['meta']['timestamp']}, {after['meta']['rows']} mídias)")
+    for mode, scenarios in after["results"].items():
+        previous = before["results"].get(mode, {})
+        print(f"\n[{mode}]")
+        print(f"{'cenário':16s} " + " ".join(f"{metric:>24s}" for metric in METRICS))
+        for name, result in scenarios.items():
+            old = previous.get(name)
+            cells = []
+            for metric in METRICS:
+                if old is None:
+                    cells.append(f"{result[metric]:>24.2f}")
+                else:
+                    cells.append(f"{old[metric]:>9.2f} → {result[metric]:>7.2f} {change(old[metric], result[metric])}")
+            print(f"{name:16s} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+    compare(json.loads(args.before.read_text()), json.loads(args.after.read_text()))
+
+
+if __name__ == "__main__":
+    main()
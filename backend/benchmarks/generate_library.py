@@ -0,0 +1,220 @@
+"""
+Gera uma biblioteca sintética e reprodutível para os benchmarks.
+
+Cria, em um diretório próprio (banco SQLite + uploads/), N mídias com
+títulos/artistas pesquisáveis, playlists e histórico de reprodução. Uma
+parte das mídias aponta para pequenos MP3 gerados de verdade, com tags
+ID3 e capa (APIC), para testar streaming com Range e imagens.
+
+Uso (a partir de backend/):
+    python -m benchmarks.generate_library --size 10k [--files 200] [--seed 42]
+
+O diretório (padrão: benchmarks/data/<tamanho>) é recriado do zero e recebe
+um manifest.json lido por benchmarks.run_benchmarks.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BACKEND_DIR / "benchmarks" / "data"
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+WORDS = [
+    "amor", "noite", "saudade", "sol", "mar", "vento", "cidade", "estrada", "fogo", "chuva",
+    "lua", "coração", "tempo", "caminho", "sonho", "rio", "terra", "céu", "dança", "festa",
+    "marrabenta", "kizomba", "semba", "batida", "ritmo", "voz", "canção", "memória", "luz", "sombra",
+    "maputo", "beira", "nampula", "lisboa", "luanda", "verão", "inverno", "manhã", "tarde", "horizonte",
+]
+ARTISTS = [
+    "Banda Azul", "Coro da Cidade", "Duo Marés", "Trio Savana", "Orquestra Índico",
+    "Lua Nova", "Os Ventos", "Grupo Raiz", "Ana Tembe", "Carlos Mucavele",
+    "Rita Sitoe", "João Macuácua", "Marta Nhantumbo", "Paulo Chissano", "Lina Cossa",
+]
+ALBUM_COLORS = [
+    (200, 40, 40), (40, 160, 60), (30, 80, 200), (220, 180, 20), (130, 50, 160),
+    (20, 150, 150), (240, 120, 30), (90, 90, 90), (250, 250, 250), (10, 10, 10),
+]
+
+# Quadro MPEG-1 Layer III, 128 kbps, 44,1 kHz (417 bytes), repetido para formar o áudio
+MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+def make_title(rng: random.Random) -> str:
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    return " ".join(words).capitalize() + f" {rng.randint(1, 9999):04d}"
+
+
+def make_cover(color, size: int = 300) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (size, size), color).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def make_mp3(title: str, artist: str, cover: bytes, frames: int, padding: bytes = b"") -> bytes:
+    """MP3 em memória com tags ID3 (título, artista e capa APIC)"""
+    from mutagen.id3 import APIC, ID3, TIT2, TPE1
+
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="", data=cover))
+    buffer = io.BytesIO(MP3_FRAME * frames + padding)
+    tags.save(buffer)
+    return buffer.getvalue()
+
+
+def generate(out: Path, rows: int, files: int, seed: int):
+    rng = random.Random(seed)
+    if out.exists():
+        shutil.rmtree(out)
+    library_dir = out / "library"
+    library_dir.mkdir(parents=True)
+
+    # O app usa caminhos relativos ao diretório de trabalho (banco e uploads/)
+    os.chdir(out)
+    sys.path.insert(0, str(BACKEND_DIR))
+    # Nunca gravar no banco configurado no ambiente (ex.: produção)
+    os.environ["DATABASE_URL"] = "sqlite:///./media_player.db"
+    from sqlalchemy import insert
+
+    from app.main import (
+        Media,
+        Playlist,
+        PlaylistMedia,
+        SessionLocal,
+        acquire_blob,
+        bump_library_version,
+        extract_audio_metadata,
+        get_mozambique_time,
+        prepare,
+        write_history_events,
+    )
+
+    prepare()
+    started = time.perf_counter()
+    covers = [make_cover(color) for color in ALBUM_COLORS]
+    audio = []
+    for index in range(min(files, rows)):
+        title, artist = make_title(rng), rng.choice(ARTISTS)
+        path = library_dir / f"track_{index:05d}.mp3"
+        path.write_bytes(make_mp3(title, artist, covers[index % len(covers)], rng.randint(100, 600)))
+        metadata = extract_audio_metadata(path)
+        audio.append({"path": str(path), "size": path.stat().st_size, "metadata": metadata})
+    print(f"{len(audio)} arquivos MP3 gerados em {time.perf_counter() - started:.1f}s")
+
+    now = get_mozambique_time()
+    db = SessionLocal()
+    try:
+        cover_refs = {}
+        batch = []
+        for index in range(rows):
+            if index < len(audio):
+                source = audio[index]
+                metadata = source["metadata"]
+                row = {
+                    "filename": Path(source["path"]).name,
+                    "title": metadata.get("title"),
+                    "artist": metadata.get("artist"),
+                    "type": "audio",
+                    "duration": metadata.get("duration", 0),
+                    "size": source["size"],
+                    "path": source["path"],
+                    "cover": metadata.get("cover"),
+                }
+            else:
+                # Linhas sem arquivo real: apontam para um dos MP3 gerados
+                source = audio[index % len(audio)] if audio else None
+                media_type = "video" if rng.random() < 0.2 else "audio"
+                row = {
+                    "filename": f"media_{index:06d}.{'mp4' if media_type == 'video' else 'mp3'}",
+                    "title": make_title(rng),
+                    "artist": rng.choice(ARTISTS),
+                    "type": media_type,
+                    "duration": round(rng.uniform(60, 420), 2),
+                    "size": source["size"] if source else 0,
+                    "path": source["path"] if source else "",
+                    "cover": source["metadata"].get("cover") if source and media_type == "audio" else None,
+                }
+            if row["cover"]:
+                cover_refs[row["cover"]] = cover_refs.get(row["cover"], 0) + 1
+            row.update({
+                "is_favorite": rng.random() < 0.05,
+                "status": "ready",
+                "created_at": now - timedelta(minutes=rows - index),
+                "updated_at": now,
+            })
+            batch.append(row)
+            if len(batch) >= 5000:
+                db.execute(insert(Media), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Media), batch)
+        for cover, count in cover_refs.items():
+            acquire_blob(db, cover, Path(cover).stem, Path(cover).stat().st_size, count)
+
+        playlist_count = max(1, rows // 200)
+        playlists = [Playlist(name=f"Playlist {i + 1}", description="Gerada para benchmark") for i in range(playlist_count)]
+        db.add_all(playlists)
+        db.flush()
+        playlist_ids = [p.id for p in playlists]
+        entries = []
+        for playlist_id in playlist_ids:
+            for position, media_id in enumerate(rng.sample(range(1, rows + 1), min(50, rows))):
+                entries.append({"playlist_id": playlist_id, "media_id": media_id, "position": float(position + 1)})
+        db.execute(insert(PlaylistMedia), entries)
+        bump_library_version(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"{rows} mídias e {len(playlist_ids)} playlists gravadas em {time.perf_counter() - started:.1f}s")
+
+    # Histórico: ~2 eventos por mídia nos últimos 60 dias
+    events = []
+    for _ in range(rows * 2):
+        played_at = now - timedelta(seconds=rng.randint(0, 60 * 86400))
+        events.append((rng.randint(1, rows), round(rng.uniform(0, 300), 1), played_at))
+        if len(events) >= 10000:
+            write_history_events(events)
+            events = []
+    if events:
+        write_history_events(events)
+
+    manifest = {
+        "rows": rows,
+        "files": len(audio),
+        "seed": seed,
+        "audio_ids": list(range(1, len(audio) + 1)),
+        "playlist_ids": playlist_ids,
+        "search_terms": WORDS,
+        "generated_in": round(time.perf_counter() - started, 2),
+    }
+    (out / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    print(f"Biblioteca gerada em {out} ({manifest['generated_in']}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera uma biblioteca sintética para benchmarks")
+    parser.add_argument("--size", default="10k", help="1k, 10k, 100k ou um número de mídias")
+    parser.add_argument("--files", type=int, default=200, help="MP3 reais gerados (padrão: 200)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, help="Diretório de saída (padrão: benchmarks/data/<tamanho>)")
+    args = parser.parse_args()
+
+    rows = SIZES.get(args.size) or int(args.size)
+    out = (args.out or DATA_DIR / args.size).resolve()
+    generate(out, rows, max(1, args.files), args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmarks da API sobre uma biblioteca gerada por benchmarks.generate_library.
+
+Executa cada cenário (listas, busca, streaming com Range, upload, histórico)
+no app em processo (TestClient, sem rede) e/ou em um uvicorn local, mede
+latência p50/p95/p99 e vazão e grava o resultado em JSON.
+
+Uso (a partir de backend/):
+    python -m benchmarks.run_benchmarks --size 10k [--mode both] [--requests 200]
+        [--concurrency 4] [--scenarios list_all,search] [--output resultado.json]
+
+Compare duas execuções com:
+    python -m benchmarks.compare antes.json depois.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BACKEND_DIR / "benchmarks" / "data"
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+RANGE_SIZE = 64 * 1024
+
+
+class Scenario:
+    """Cenário = função que monta (método, url, kwargs) a partir de um gerador aleatório"""
+
+    def __init__(self, name: str, build, expected=(200,), writes: bool = False):
+        self.name = name
+        self.build = build
+        self.expected = expected
+        self.writes = writes
+
+
+def make_scenarios(manifest: dict):
+    from benchmarks.generate_library import ALBUM_COLORS, make_cover, make_mp3
+
+    rows = manifest["rows"]
+    audio_ids = manifest["audio_ids"]
+    playlist_ids = manifest["playlist_ids"]
+    terms = manifest["search_terms"]
+    upload_cover = make_cover(ALBUM_COLORS[0])
+
+    def stream_range(rng):
+        start = rng.randint(0, 32 * 1024)
+        headers = {"Range": f"bytes={start}-{start + RANGE_SIZE - 1}"}
+        return "GET", f"/media/file/{rng.choice(audio_ids)}", {"headers": headers}
+
+    def upload(rng):
+        # Conteúdo único a cada envio (sem deduplicação pelo hash)
+        data = make_mp3(f"Upload {rng.random()}", "Benchmark", upload_cover, 100, os.urandom(16))
+        files = {"file": ("benchmark.mp3", data, "audio/mpeg")}
+        return "POST", "/media/upload", {"files": files}
+
+    scenarios = [
+        Scenario("list_all", lambda rng: ("GET", "/media?limit=100", {})),
+        Scenario("list_favorites", lambda rng: ("GET", "/media/favorites?limit=100", {})),
+        Scenario("list_type", lambda rng: ("GET", f"/media/type/{rng.choice(['audio', 'video'])}?limit=100", {})),
+        Scenario("get_media", lambda rng: ("GET", f"/media/{rng.randint(1, rows)}", {})),
+        Scenario("search", lambda rng: ("GET", f"/media/search/{rng.choice(terms)}?limit=50", {})),
+        Scenario("playlist_media", lambda rng: ("GET", f"/playlists/{rng.choice(playlist_ids)}/media", {})),
+        Scenario("stream_range", stream_range, expected=(206,)),
+        Scenario("stream_full", lambda rng: ("GET", f"/media/file/{rng.choice(audio_ids)}", {})),
+        Scenario("history_post", lambda rng: (
+            "POST", f"/history/{rng.randint(1, rows)}?position={rng.uniform(0, 300):.1f}", {}
+        ), writes=True),
+        Scenario("upload", upload, writes=True),
+    ]
+
+    # Muitos clientes ao mesmo tempo: listas, buscas e streams intercalados
+    reads = [s for s in scenarios if not s.writes]
+
+    def mixed(rng):
+        scenario = rng.choice(reads)
+        return scenario.build(rng)
+
+    scenarios.append(Scenario("mixed", mixed, expected=(200, 206)))
+    return scenarios
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Percentil pelo método do posto mais próximo"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, warmup: int, seed: int) -> dict:
+    """Executa o cenário com `concurrency` threads e devolve as estatísticas"""
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    latencies, errors, transferred = [], [], [0]
+    results_lock = threading.Lock()
+
+    def one(record: bool):
+        with rng_lock:
+            method, url, kwargs = scenario.build(rng)
+        started = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+            elapsed = time.perf_counter() - started
+            status = response.status_code
+            size = len(response.content)
+        except Exception as e:
+            elapsed, status, size = time.perf_counter() - started, repr(e), 0
+        if not record:
+            return
+        with results_lock:
+            if status in scenario.expected:
+                latencies.append(elapsed * 1000)
+                transferred[0] += size
+            else:
+                errors.append(status)
+
+    for _ in range(warmup):
+        one(False)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: one(True), range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    error_counts = {}
+    for status in errors:
+        error_counts[str(status)] = error_counts.get(str(status), 0) + 1
+    return {
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": error_counts,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 1) if wall > 0 else 0.0,
+        "bytes_per_s": round(transferred[0] / wall) if wall > 0 else 0,
+    }
+
+
+def run_all(client, scenarios, args, mode: str) -> dict:
+    results = {}
+    for scenario in scenarios:
+        result = run_scenario(client, scenario, args.requests, args.concurrency, args.warmup, args.seed)
+        results[scenario.name] = result
+        errors = f"  erros={result['errors']}" if result["errors"] else ""
+        print(
+            f"[{mode}] {scenario.name:16s} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+            f"p99={result['p99_ms']:8.2f}ms {result['throughput_rps']:8.1f} req/s{errors}"
+        )
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_uvicorn(data_dir: Path, scenarios, args) -> dict:
+    import httpx
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), DATABASE_URL="sqlite:///./media_player.db",
+               API_BASE_URL=f"http://127.0.0.1:{port}")
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", "--no-access-log"]
+    server = subprocess.Popen(command, cwd=data_dir, env=env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("uvicorn não iniciou")
+            time.sleep(0.2)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with httpx.Client(base_url=base_url, limits=limits, timeout=60) as client:
+            return run_all(client, scenarios, args, "uvicorn")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def run_inprocess(scenarios, args) -> dict:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        return run_all(client, scenarios, args, "inprocess")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "desconhecido"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks da API de mídia")
+    parser.add_argument("--size", default="10k", help="Biblioteca gerada em benchmarks/data/<tamanho>")
+    parser.add_argument("--data", type=Path, help="Diretório da biblioteca (em vez de --size)")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=200, help="Requisições medidas por cenário")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requisições simultâneas")
+    parser.add_argument("--warmup", type=int, default=10, help="Requisições de aquecimento por cenário")
+    parser.add_argument("--scenarios", help="Lista de cenários separados por vírgula (padrão: todos)")
+    parser.add_argument("--no-writes", action="store_true", help="Pular cenários que alteram a biblioteca")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Arquivo JSON (padrão: benchmarks/results/<data>-<tamanho>.json)")
+    args = parser.parse_args()
+
+    data_dir = (args.data or DATA_DIR / args.size).resolve()
+    manifest_path = data_dir / "manifest.json"
+    if not manifest_path.exists():
+        parser.error(f"Biblioteca não encontrada em {data_dir}; gere com benchmarks.generate_library")
+    manifest = json.loads(manifest_path.read_text())
+    output = (args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{data_dir.name}.json").resolve()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    scenarios = make_scenarios(manifest)
+    if args.scenarios:
+        wanted = set(args.scenarios.split(","))
+        unknown = wanted - {s.name for s in scenarios}
+        if unknown:
+            parser.error(f"Cenários desconhecidos: {', '.join(sorted(unknown))}")
+        scenarios = [s for s in scenarios if s.name in wanted]
+    if args.no_writes:
+        scenarios = [s for s in scenarios if not s.writes]
+
+    # O app usa caminhos relativos ao diretório de trabalho (banco e uploads/)
+    os.chdir(data_dir)
+    os.environ["DATABASE_URL"] = "sqlite:///./media_player.db"
+    # Todos os clientes do benchmark vêm do mesmo IP: sem limite de transmissões por cliente
+    os.environ.setdefault("STREAM_MAX_PER_CLIENT", "0")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "library": data_dir.name,
+            "rows": manifest["rows"],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+        },
+        "results": {},
+    }
+    if args.mode in ("inprocess", "both"):
+        report["results"]["inprocess"] = run_inprocess(scenarios, args)
+    if args.mode in ("uvicorn", "both"):
+        report["results"]["uvicorn"] = run_uvicorn(data_dir, scenarios, args)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Resultados gravados em {output}")
+
+
+if __name__ == "__main__":
+    main()
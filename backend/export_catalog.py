@@ -0,0 +1,53 @@
+"""
+Exporta o catálogo (mídias, playlists, itens de playlist e histórico) em
+NDJSON, lendo o banco em lotes: a memória usada não cresce com o catálogo.
+
+Os arquivos de mídia/capas não são copiados, só os registros; em outra
+instância, copie também o diretório uploads/.
+
+Uso (a partir de backend/):
+    python export_catalog.py catalogo.ndjson      (.gz comprime; - para a saída padrão)
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+
+from app import catalog
+from app.main import SessionLocal, catalog_records, history_buffer, prepare
+
+
+def export_catalog(output: str) -> Counter:
+    counts = Counter()
+
+    def counted(records):
+        for record in records:
+            counts[record["kind"]] += 1
+            yield record
+
+    db = SessionLocal()
+    try:
+        with catalog.open_file(output, "wb") as out:
+            for chunk in catalog.encode_lines(counted(catalog_records(db))):
+                out.write(chunk)
+    finally:
+        db.close()
+    del counts["header"]
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o catálogo em NDJSON")
+    parser.add_argument("output", help="Arquivo de saída (.gz para comprimir, - para a saída padrão)")
+    args = parser.parse_args()
+
+    prepare()
+    history_buffer.flush()
+    started = time.perf_counter()
+    counts = export_catalog(args.output)
+    # Resumo na saída de erro: a saída padrão pode ser o próprio catálogo
+    print(f"Exportados {dict(counts)} em {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Importa um catálogo NDJSON gerado por export_catalog.py (ou GET /catalog/export).
+
+As linhas são lidas e gravadas em lotes (uma transação por lote), com ids
+novos para mídias e playlists; itens de playlist e histórico são remapeados.
+Serve para migrar entre instâncias ou do SQLite para o PostgreSQL
+(DATABASE_URL apontando para o destino).
+
+Uso (a partir de backend/):
+    python import_catalog.py catalogo.ndjson [--batch-size 1000]   (.gz aceito; - para a entrada padrão)
+"""
+import argparse
+import sys
+import time
+
+from app import catalog
+from app.main import CATALOG_BATCH_SIZE, CatalogImporter, prepare
+
+
+def import_catalog(source: str, batch_size: int) -> dict:
+    importer = CatalogImporter(batch_size)
+    lines = []
+    with catalog.open_file(source, "rb") as f:
+        for line in f:
+            lines.append(line)
+            if len(lines) >= batch_size:
+                importer.feed_lines(lines)
+                lines = []
+    importer.feed_lines(lines)
+    return importer.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa um catálogo NDJSON")
+    parser.add_argument("source", help="Arquivo exportado (.gz aceito, - para a entrada padrão)")
+    parser.add_argument("--batch-size", type=int, default=CATALOG_BATCH_SIZE,
+                        help=f"Registros gravados por transação (padrão: {CATALOG_BATCH_SIZE})")
+    args = parser.parse_args()
+
+    prepare()
+    started = time.perf_counter()
+    try:
+        summary = import_catalog(args.source, max(1, args.batch_size))
+    except ValueError as e:
+        sys.exit(f"Catálogo inválido: {e}")
+    print(f"Importados {summary['imported']} em {time.perf_counter() - started:.2f}s")
+    if summary["skipped"]:
+        print(f"Ignorados (referências ausentes): {summary['skipped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Importação em lote de uma biblioteca de músicas/vídeos.
+
+Percorre um diretório, extrai os metadados em paralelo (pool de processos)
+e grava as mídias em transações grandes. É incremental: arquivos cujo
+tamanho e data de modificação não mudaram desde a última importação são
+ignorados (com --hash, também os que foram apenas "tocados").
+
+Uso:
+    python import_library.py /caminho/da/biblioteca [--workers 8] [--batch-size 1000] [--hash]
+
+Os arquivos são servidos a partir do local original (não são copiados para
+uploads/) e nunca são apagados pela API.
+"""
+import argparse
+import hashlib
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import insert, update
+
+from app.main import (
+    Media,
+    SessionLocal,
+    acquire_blob,
+    bump_library_version,
+    extract_audio_metadata,
+    get_mozambique_time,
+    prepare,
+    release_blob,
+    remove_stored_files,
+    save_cover_image,
+)
+from app import storage
+from app.streaming import guess_media_type
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def media_type_for(path: Path):
+    """'audio', 'video' ou None para arquivos que não são mídia"""
+    content_type = guess_media_type(path.name)
+    if content_type.startswith("audio/"):
+        return "audio"
+    if content_type.startswith("video/"):
+        return "video"
+    return None
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def inspect_file(task):
+    """Executado nos processos do pool: hash (opcional) e metadados de um arquivo"""
+    path_str, media_type, want_hash, known_hash = task
+    path = Path(path_str)
+    result = {"path": path_str, "unchanged": False}
+    try:
+        if want_hash:
+            result["content_hash"] = file_hash(path)
+            if known_hash and result["content_hash"] == known_hash:
+                result["unchanged"] = True
+                return result
+        # A capa volta em bytes e é gravada em write_batch (sob storage.blob_lock)
+        result["metadata"] = extract_audio_metadata(path, store_cover=False) if media_type == "audio" else {}
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def scan(root: Path):
+    """Arquivos de mídia sob o diretório: (caminho absoluto, tipo, stat)"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            path = Path(dirpath) / name
+            media_type = media_type_for(path)
+            if media_type:
+                yield path, media_type, path.stat()
+
+
+def write_batch(batch, existing):
+    """Grava um lote de resultados (e as capas) em uma única transação"""
+    db = SessionLocal()
+    try:
+        with storage.blob_lock():
+            counts, orphaned = _write_batch(db, batch, existing)
+    finally:
+        db.close()
+    # Capas substituídas sem outras referências, como em delete_media
+    if orphaned:
+        remove_stored_files(orphaned)
+    return counts
+
+
+def _write_batch(db, batch, existing):
+    # Sob storage.blob_lock: as capas gravadas aqui só podem ser apagadas depois do commit
+    new_rows, changed_rows, touched_rows = [], [], []
+    covers = Counter()
+    orphaned = []
+    for result, media_type, stat in batch:
+        path_str = result["path"]
+        current = existing.get(path_str)
+        if result["unchanged"]:
+            # Conteúdo igual (arquivo apenas "tocado"): atualizar só o mtime
+            touched_rows.append({"id": current["id"], "source_mtime": stat.st_mtime})
+            continue
+        metadata = result.get("metadata", {})
+        row = {
+            "filename": Path(path_str).name,
+            "title": metadata.get("title") or Path(path_str).stem,
+            "artist": metadata.get("artist"),
+            "type": media_type,
+            "duration": metadata.get("duration", 0),
+            "size": stat.st_size,
+            "path": path_str,
+            "cover": save_cover_image(metadata["cover_data"]) if metadata.get("cover_data") else None,
+            # Sem --hash o hash não é recalculado: manter o já conhecido
+            "content_hash": result.get("content_hash", current["content_hash"] if current else None),
+            "source_mtime": stat.st_mtime,
+            "status": "ready",
+        }
+        if not current or current["cover"] != row["cover"]:
+            if row["cover"]:
+                covers[row["cover"]] += 1
+            # Capa antiga trocada ou removida dos metadados
+            if current and current["cover"] and release_blob(db, current["cover"]):
+                orphaned.append(current["cover"])
+        if current:
+            row["id"] = current["id"]
+            row["updated_at"] = get_mozambique_time()
+            changed_rows.append(row)
+        else:
+            new_rows.append(row)
+
+    for cover, count in covers.items():
+        cover_path = Path(cover)
+        acquire_blob(db, cover, cover_path.stem, cover_path.stat().st_size, count)
+    if new_rows:
+        db.execute(insert(Media), new_rows)
+    if changed_rows:
+        db.execute(update(Media), changed_rows)
+    if touched_rows:
+        db.execute(update(Media), touched_rows)
+    if new_rows or changed_rows:
+        bump_library_version(db)
+    db.commit()
+    return (len(new_rows), len(changed_rows) + len(touched_rows)), orphaned
+
+
+def import_library(root: Path, workers: int, batch_size: int, use_hash: bool):
+    started = time.perf_counter()
+    root = root.resolve()
+    prepare()
+
+    # Estado atual das mídias já importadas deste diretório
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            Media.id, Media.path, Media.size, Media.source_mtime, Media.content_hash, Media.cover
+        ).filter(Media.path.startswith(os.path.join(str(root), ""), autoescape=True)).all()
+    finally:
+        db.close()
+    existing = {row.path: row._asdict() for row in rows}
+
+    tasks, pending_stat = [], {}
+    scanned = skipped = 0
+    total_bytes = 0
+    for path, media_type, stat in scan(root):
+        scanned += 1
+        path_str = str(path)
+        current = existing.get(path_str)
+        if current and current["size"] == stat.st_size and current["source_mtime"] == stat.st_mtime:
+            skipped += 1
+            continue
+        known_hash = current["content_hash"] if current and current["size"] == stat.st_size else None
+        tasks.append((path_str, media_type, use_hash, known_hash))
+        pending_stat[path_str] = (media_type, stat)
+        total_bytes += stat.st_size
+    scan_elapsed = time.perf_counter() - started
+    print(f"{scanned} arquivos encontrados em {scan_elapsed:.2f}s; {skipped} sem alterações, {len(tasks)} a processar")
+
+    inserted = updated = errors = 0
+    batch = []
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, min(64, len(tasks) // (workers * 4) or 1))
+            for result in executor.map(inspect_file, tasks, chunksize=chunksize):
+                if "error" in result:
+                    errors += 1
+                    print(f"Erro ao processar {result['path']}: {result['error']}")
+                    continue
+                media_type, stat = pending_stat[result["path"]]
+                batch.append((result, media_type, stat))
+                if len(batch) >= batch_size:
+                    new, changed = write_batch(batch, existing)
+                    inserted += new
+                    updated += changed
+                    batch = []
+                    print(f"  {inserted + updated}/{len(tasks)} gravados")
+        if batch:
+            new, changed = write_batch(batch, existing)
+            inserted += new
+            updated += changed
+
+    elapsed = time.perf_counter() - started
+    processed = len(tasks) - errors
+    print(
+        f"Concluído em {elapsed:.2f}s: {inserted} novos, {updated} atualizados, "
+        f"{skipped} ignorados, {errors} erros"
+    )
+    if elapsed > 0:
+        print(
+            f"Vazão: {scanned / elapsed:.0f} arquivos verificados/s, "
+            f"{processed / elapsed:.0f} arquivos processados/s, "
+            f"{total_bytes / elapsed / (1024 * 1024):.1f} MB/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa uma biblioteca de mídia em lote")
+    parser.add_argument("directory", type=Path, help="Diretório com as músicas/vídeos")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos para extração de metadados (padrão: núcleos da CPU)")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="Mídias gravadas por transação (padrão: 1000)")
+    parser.add_argument("--hash", action="store_true",
+                        help="Calcular SHA-256 e ignorar arquivos com conteúdo igual ao já importado")
+    args = parser.parse_args()
+
+    if not args.directory.is_dir():
+        parser.error(f"Diretório não encontrado: {args.directory}")
+    import_library(args.directory, max(1, args.workers), max(1, args.batch_size), args.hash)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Recalcula as estatísticas de reprodução (por mídia e por tipo) a partir do
+histórico bruto em playback_history.
+
+Normalmente desnecessário: as estatísticas são atualizadas a cada lote do
+histórico. Use após importar/corrigir o histórico direto no banco.
+
+Uso (a partir de backend/):
+    python rebuild_stats.py
+"""
+import time
+
+from app import play_stats
+from app.main import engine, prepare
+
+
+def main():
+    prepare()
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        count = play_stats.rebuild(conn)
+    print(f"Estatísticas recalculadas para {count} mídias em {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
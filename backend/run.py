@@ -1,12 +1,34 @@
-import uvicorn
+"""
+Servidor de produção.
+
+Prepara o ambiente uma única vez (diretórios, migrações e índice de busca),
+reenfileira as mídias pendentes e só então inicia os workers do uvicorn
+(WEB_CONCURRENCY, padrão 1), que sobem sem repetir esse trabalho.
+"""
 import os
+import time
+
+import uvicorn
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+    started = time.perf_counter()
+    from app.main import PREPARED_ENV, prepare, requeue_pending_media
+
+    prepare()
+    # Processadas pelas threads deste processo enquanto os workers atendem
+    pending = requeue_pending_media()
+    os.environ[PREPARED_ENV] = "1"
+    print(f"Ambiente preparado em {time.perf_counter() - started:.2f}s "
+          f"({pending} mídias reenfileiradas); iniciando {workers} worker(s)")
+
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=port,
+        workers=workers,
         reload=False,
         log_level="info"
     )
@@ -0,0 +1,33 @@
+"""
+O app lê DATABASE_URL e usa caminhos relativos (banco, uploads/) ao ser
+importado: cada teste que precisa de app.main roda o código num processo
+novo, dentro de um diretório temporário.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def run_app(tmp_path):
+    """Executa `code` num processo novo com o banco em tmp_path; retorna a saída padrão"""
+
+    def run(code: str, **env) -> str:
+        full_env = {key: value for key, value in os.environ.items() if key != "APP_PREPARED"}
+        full_env.update(PYTHONPATH=str(BACKEND_DIR), DATABASE_URL="sqlite:///./media_player.db")
+        full_env.update(env)
+        result = subprocess.run(
+            [sys.executable, "-c", textwrap.dedent(code)], cwd=tmp_path, env=full_env,
+            capture_output=True, text=True, timeout=120,
+        )
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    return run
@@ -0,0 +1,46 @@
+from app.history import HistoryBuffer
+
+
+def make_buffer(written, fail=lambda events: False, **options):
+    def flush_fn(events):
+        if fail(events):
+            raise ValueError("falha ao gravar")
+        written.extend(events)
+
+    # Intervalo longo: só os flush() do teste gravam
+    return HistoryBuffer(flush_fn, interval=3600, **options)
+
+
+def test_invalid_event_is_dropped_after_retries():
+    written = []
+    buffer = make_buffer(written, fail=lambda events: any(media_id < 0 for media_id, _, _ in events), max_retries=3)
+    buffer.add(1, 10.0, "t1")
+    buffer.add(-1, 0.0, "t2")
+    buffer.add(2, 20.0, "t3")
+    for _ in range(2):
+        buffer.flush()
+        assert buffer.pending() == 3 and written == []
+    # Terceira falha: evento a evento, o inválido é descartado
+    buffer.flush()
+    assert written == [(1, 10.0, "t1"), (2, 20.0, "t3")]
+    assert buffer.pending() == 0 and buffer.latest(-1) is None
+    assert buffer.stats()["dropped"] == {"failed": 1}
+
+    # Os eventos seguintes voltam a ser gravados em lote
+    buffer.add(3, 30.0, "t4")
+    buffer.flush()
+    assert written[-1] == (3, 30.0, "t4") and buffer.stats()["flushed"] == 3
+    buffer.stop()
+
+
+def test_buffer_keeps_only_the_newest_events_while_writes_fail():
+    written = []
+    buffer = make_buffer(written, fail=lambda events: True, max_retries=100, max_pending=3)
+    for i in range(5):
+        buffer.add(i, float(i), f"t{i}")
+    assert buffer.pending() == 3
+    assert buffer.latest(0) is None and buffer.latest(4) == (4.0, "t4")
+    buffer.flush()
+    buffer.add(5, 5.0, "t5")
+    assert buffer.pending() == 3
+    assert buffer.stats()["dropped"] == {"overflow": 3}
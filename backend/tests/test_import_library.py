@@ -0,0 +1,51 @@
+def test_reimport_releases_replaced_covers_and_keeps_the_hash(run_app):
+    run_app("""
+        import os
+        from pathlib import Path
+
+        import import_library
+        from app.main import Blob, Media, SessionLocal, prepare
+
+        prepare()
+        Path("lib").mkdir()
+        songs = [Path("lib/a.mp3").resolve(), Path("lib/b.mp3").resolve()]
+
+        def reimport(covers, hashes=None):
+            # Como import_library faz a cada execução: estado atual + lote de resultados
+            db = SessionLocal()
+            rows = db.query(Media.id, Media.path, Media.size, Media.source_mtime, Media.content_hash, Media.cover)
+            existing = {row.path: row._asdict() for row in rows}
+            db.close()
+            batch = []
+            for i, (song, cover) in enumerate(zip(songs, covers)):
+                song.write_bytes(b"audio" * (i + 1))
+                os.utime(song, (i + len(existing), i + len(existing)))
+                result = {"path": str(song), "unchanged": False,
+                          "metadata": {"cover_data": cover} if cover else {}}
+                if hashes:
+                    result["content_hash"] = hashes[i]
+                batch.append((result, "audio", song.stat()))
+            import_library.write_batch(batch, existing)
+            db = SessionLocal()
+            media = {Path(m.path).name: (m.cover, m.content_hash) for m in db.query(Media)}
+            blobs = {blob.path: blob.ref_count for blob in db.query(Blob)}
+            db.close()
+            return media, blobs
+
+        media, blobs = reimport([b"capa 1", b"capa 1"], hashes=["h1", "h2"])
+        cover1 = media["a.mp3"][0]
+        assert media["b.mp3"][0] == cover1 and blobs == {cover1: 2}
+
+        # Capa trocada (sem --hash): a antiga perde as duas referências e é apagada
+        media, blobs = reimport([b"capa 2", b"capa 2"])
+        cover2 = media["a.mp3"][0]
+        assert blobs == {cover2: 2} and not Path(cover1).exists() and Path(cover2).exists()
+        assert media["a.mp3"][1] == "h1" and media["b.mp3"][1] == "h2"
+
+        # Capa removida dos metadados de uma das mídias: a outra ainda usa o arquivo
+        media, blobs = reimport([None, b"capa 2"])
+        assert media["a.mp3"][0] is None and blobs == {cover2: 1} and Path(cover2).exists()
+
+        media, blobs = reimport([None, None])
+        assert blobs == {} and not Path(cover2).exists()
+    """)
@@ -0,0 +1,16 @@
+def test_maintenance_runs_without_history_traffic(run_app):
+    output = run_app("""
+        import time
+        from fastapi.testclient import TestClient
+        from app import resumable
+        from app.main import app
+
+        with TestClient(app) as client:
+            upload_id = resumable.create("big.mp4", 1024)["id"]
+            # Nenhum POST /history: a manutenção tem que rodar mesmo assim
+            deadline = time.monotonic() + 10
+            while (resumable.SESSIONS_DIR / upload_id).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            print((resumable.SESSIONS_DIR / upload_id).exists())
+    """, MAINTENANCE_INTERVAL="0.1", UPLOAD_SESSION_TTL="-1")
+    assert output.strip().endswith("False")
@@ -0,0 +1,190 @@
+import sqlite3
+
+import pytest
+
+# Esquemas reais (sqlite_master) gerados por versões anteriores às migrações
+ORIGINAL_SCHEMA = """
+CREATE TABLE media (
+    id INTEGER NOT NULL,
+    filename VARCHAR NOT NULL,
+    title VARCHAR,
+    artist VARCHAR,
+    type VARCHAR NOT NULL,
+    duration FLOAT,
+    size INTEGER,
+    path VARCHAR NOT NULL,
+    thumbnail_path VARCHAR,
+    cover VARCHAR,
+    is_favorite BOOLEAN,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_media_id ON media (id);
+CREATE TABLE playlists (
+    id INTEGER NOT NULL,
+    name VARCHAR NOT NULL,
+    description TEXT,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_playlists_id ON playlists (id);
+CREATE TABLE playlist_media (
+    id INTEGER NOT NULL,
+    playlist_id INTEGER NOT NULL,
+    media_id INTEGER NOT NULL,
+    position INTEGER,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_playlist_media_id ON playlist_media (id);
+CREATE TABLE playback_history (
+    id INTEGER NOT NULL,
+    media_id INTEGER NOT NULL,
+    position FLOAT,
+    played_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_playback_history_id ON playback_history (id);
+"""
+
+PRE_MIGRATIONS_SCHEMA = """
+CREATE TABLE media (
+    id INTEGER NOT NULL,
+    filename VARCHAR NOT NULL,
+    title VARCHAR,
+    artist VARCHAR,
+    type VARCHAR NOT NULL,
+    duration FLOAT,
+    size INTEGER,
+    path VARCHAR NOT NULL,
+    thumbnail_path VARCHAR,
+    cover VARCHAR,
+    is_favorite BOOLEAN,
+    status VARCHAR DEFAULT 'ready' NOT NULL,
+    content_hash VARCHAR,
+    source_mtime FLOAT,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_media_path ON media (path);
+CREATE INDEX ix_media_id ON media (id);
+CREATE TABLE playlists (
+    id INTEGER NOT NULL,
+    name VARCHAR NOT NULL,
+    description TEXT,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_playlists_id ON playlists (id);
+CREATE TABLE playback_history (
+    id INTEGER NOT NULL,
+    media_id INTEGER NOT NULL,
+    position FLOAT,
+    played_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_playback_history_id ON playback_history (id);
+CREATE INDEX ix_playback_history_media_id ON playback_history (media_id);
+CREATE INDEX ix_playback_history_played_at ON playback_history (played_at);
+CREATE TABLE resume_position (
+    media_id INTEGER NOT NULL,
+    position FLOAT NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (media_id)
+);
+CREATE TABLE blobs (
+    path VARCHAR NOT NULL,
+    hash VARCHAR NOT NULL,
+    size INTEGER,
+    ref_count INTEGER NOT NULL,
+    created_at DATETIME,
+    PRIMARY KEY (path)
+);
+CREATE INDEX ix_blobs_hash ON blobs (hash);
+CREATE TABLE library_state (
+    id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE playlist_media (
+    id INTEGER NOT NULL,
+    playlist_id INTEGER NOT NULL,
+    media_id INTEGER NOT NULL,
+    position FLOAT,
+    PRIMARY KEY (id),
+    FOREIGN KEY(playlist_id) REFERENCES playlists (id) ON DELETE CASCADE,
+    FOREIGN KEY(media_id) REFERENCES media (id) ON DELETE CASCADE
+);
+CREATE INDEX ix_playlist_media_playlist_position ON playlist_media (playlist_id, position, id);
+CREATE INDEX ix_playlist_media_media_id ON playlist_media (media_id);
+CREATE INDEX ix_playlist_media_id ON playlist_media (id);
+INSERT INTO library_state (id, version) VALUES (1, 7);
+"""
+
+OLD_ROWS = """
+INSERT INTO media (id, filename, title, type, duration, size, path, is_favorite, created_at, updated_at)
+VALUES (1, 'a.mp3', 'Canção', 'audio', 200, 10, 'uploads/a.mp3', 1, '2024-01-01 10:00:00', '2024-01-01 10:00:00'),
+       (2, 'b.mp4', 'Vídeo', 'video', 60, 20, 'uploads/b.mp4', 0, '2024-01-02 10:00:00', '2024-01-02 10:00:00');
+INSERT INTO playlists (id, name, created_at) VALUES (1, 'Antiga', '2024-01-03 10:00:00');
+INSERT INTO playlist_media (playlist_id, media_id, position) VALUES (1, 2, 0), (1, 1, 1);
+INSERT INTO playback_history (media_id, position, played_at)
+VALUES (1, 100, '2024-01-04 10:00:00'), (1, 180, '2024-01-04 10:01:00'), (2, 30, '2024-01-04 11:00:00');
+"""
+
+
+def describe_schema(db_path):
+    """Colunas (nome, not null, default, pk), índices e gatilhos de cada tabela do app"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'media_fts%'"
+        )]
+        schema = {}
+        for table in tables:
+            columns = {(row[1], row[3], row[4], row[5]) for row in conn.execute(f"PRAGMA table_info({table})")}
+            indexes = {row[1] for row in conn.execute(f"PRAGMA index_list({table})")
+                       if not row[1].startswith("sqlite_autoindex")}
+            schema[table] = (columns, indexes)
+        schema["triggers"] = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+        return schema
+    finally:
+        conn.close()
+
+
+PREPARE = """
+    from app.main import prepare
+    prepare()
+"""
+
+
+@pytest.mark.parametrize("old_schema", [ORIGINAL_SCHEMA, PRE_MIGRATIONS_SCHEMA], ids=["original", "pre-migrations"])
+def test_upgrading_an_old_database_matches_a_fresh_one(run_app, tmp_path, old_schema):
+    db_path = tmp_path / "media_player.db"
+    run_app(PREPARE)
+    fresh = describe_schema(db_path)
+    db_path.unlink()
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript(old_schema + OLD_ROWS)
+    conn.close()
+    output = run_app("""
+        from fastapi.testclient import TestClient
+        from app.main import app, prepare
+
+        prepare()
+        with TestClient(app) as client:
+            media = client.get("/media").json()
+            print(sorted(item["title"] for item in media))
+            print([item["media"]["id"] for item in client.get("/playlists/1/media").json()])
+            print(client.get("/media/1").json()["status"])
+            # Estatísticas preenchidas com o histórico já existente
+            print([(row["type"], row["play_count"], row["listened_seconds"]) for row in client.get("/stats/types").json()])
+    """)
+    assert output.splitlines()[-4:] == [
+        "['Canção', 'Vídeo']", "[2, 1]", "ready", "[('audio', 1, 180.0), ('video', 1, 30.0)]",
+    ]
+
+    upgraded = describe_schema(db_path)
+    assert upgraded == fresh
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+from app import play_stats
+
+
+def test_progress_posts_of_one_playback_count_once():
+    start = datetime(2026, 1, 1, 20, 0)
+    # Progresso a cada 10 s durante 100 s de uma única reprodução
+    events = [(1, float(p), start + timedelta(seconds=p)) for p in range(10, 101, 10)]
+    per_media, per_type = play_stats.aggregate(events, {1: "audio"}, {})
+    assert per_media[1][:2] == [1, 100.0]
+    assert per_type["audio"][:2] == [1, 100.0]
+
+
+def test_sessions_resume_restart_and_pause():
+    start = datetime(2026, 1, 1, 20, 0)
+    previous = {}
+    # Primeiro lote: toca até 100 s
+    play_stats.aggregate([(1, 50.0, start), (1, 100.0, start + timedelta(seconds=50))], {1: "audio"}, previous)
+    # Lote seguinte, horas depois: retoma de 100 s até 150 s (nova reprodução, +50 s)
+    later = start + timedelta(hours=3)
+    per_media, _ = play_stats.aggregate(
+        [(1, 120.0, later), (1, 150.0, later + timedelta(seconds=30)),
+         # Recomeço do início logo em seguida (nova reprodução, +5 s)
+         (1, 5.0, later + timedelta(seconds=40))],
+        {1: "audio"}, previous,
+    )
+    assert per_media[1][:2] == [2, 55.0]
+    assert previous[1] == (5.0, later + timedelta(seconds=40))
+
+
+def test_incremental_stats_match_rebuild(run_app):
+    output = run_app("""
+        from datetime import datetime, timedelta
+        from fastapi.testclient import TestClient
+        from app import play_stats
+        from app.main import MediaPlayStats, SessionLocal, TypePlayStats, app, engine, write_history_events
+
+        with TestClient(app) as client:
+            media_id = client.post("/media", json={"filename": "a.mp3", "type": "audio", "path": "a.mp3"}).json()["id"]
+            start = datetime(2026, 1, 1, 20, 0)
+            # Uma reprodução de 90 s enviada em três lotes de progresso
+            for batch in range(3):
+                write_history_events([
+                    (media_id, float(p), start + timedelta(seconds=p))
+                    for p in range(batch * 30 + 10, batch * 30 + 31, 10)
+                ])
+            # Outra reprodução no dia seguinte, do início
+            write_history_events([(media_id, 20.0, start + timedelta(days=1))])
+
+            def snapshot():
+                db = SessionLocal()
+                try:
+                    stats = db.get(MediaPlayStats, media_id)
+                    totals = db.get(TypePlayStats, "audio")
+                    return (stats.play_count, stats.listened_seconds, totals.play_count, totals.listened_seconds)
+                finally:
+                    db.close()
+
+            incremental = snapshot()
+            with engine.begin() as conn:
+                play_stats.rebuild(conn)
+            rebuilt = snapshot()
+            top = client.get("/stats/top").json()[0]
+            print(incremental, rebuilt, top["play_count"], top["listened_seconds"])
+            assert incremental == rebuilt == (2, 110.0, 2, 110.0)
+    """)
+    assert output
+
+
+def test_history_posts_across_flushes(run_app):
+    # Horário com fuso no POST e sem fuso ao ler o evento anterior do banco
+    output = run_app("""
+        from fastapi.testclient import TestClient
+        from app.main import MediaPlayStats, ResumePosition, SessionLocal, app, history_buffer
+
+        with TestClient(app) as client:
+            media_id = client.post("/media", json={"filename": "a.mp3", "type": "audio", "path": "a.mp3"}).json()["id"]
+            for position in (10, 40, 70):
+                assert client.post(f"/history/{media_id}", params={"position": position}).status_code == 200
+                history_buffer.flush()
+                assert history_buffer.pending() == 0
+
+            db = SessionLocal()
+            stats = db.get(MediaPlayStats, media_id)
+            print(len(client.get("/history").json()), db.get(ResumePosition, media_id).position,
+                  stats.play_count, stats.listened_seconds)
+            db.close()
+    """)
+    assert output.strip().splitlines()[-1] == "3 70.0 1 70.0"
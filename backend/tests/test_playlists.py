@@ -0,0 +1,42 @@
+def test_repeated_moves_into_the_same_slot_keep_the_order(run_app):
+    output = run_app("""
+        from fastapi.testclient import TestClient
+        from app.main import PlaylistMedia, SessionLocal, app
+
+        with TestClient(app) as client:
+            media_ids = [
+                client.post("/media", json={"filename": f"{i}.mp3", "type": "audio", "path": f"{i}.mp3"}).json()["id"]
+                for i in range(4)
+            ]
+            playlist_id = client.post("/playlists", json={"name": "p"}).json()["id"]
+            client.post(f"/playlists/{playlist_id}/media", json={"media_ids": media_ids})
+
+            # Posições grandes, como numa playlist longa: o espaço acaba por arredondamento
+            db = SessionLocal()
+            for entry in db.query(PlaylistMedia).filter(PlaylistMedia.playlist_id == playlist_id):
+                entry.position = entry.position * 20_000_000
+            db.commit()
+            db.close()
+
+            def order():
+                return [item["entry_id"] for item in client.get(f"/playlists/{playlist_id}/media").json()]
+
+            expected = order()
+            first = expected[0]
+            renumbered = 0
+            for _ in range(120):
+                # Sempre para o mesmo lugar: logo depois da primeira entrada
+                moved = expected[2]
+                response = client.post(f"/playlists/{playlist_id}/media/reorder",
+                                       json={"entry_ids": [moved], "after_entry_id": first})
+                assert response.status_code == 200, response.text
+                renumbered += response.json()["renumbered"]
+                expected.remove(moved)
+                expected.insert(1, moved)
+                assert order() == expected
+
+                positions = [item["position"] for item in client.get(f"/playlists/{playlist_id}/media").json()]
+                assert positions == sorted(set(positions))
+            print(renumbered)
+    """)
+    assert int(output.strip().splitlines()[-1]) >= 1
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from app import resumable
+
+
+@pytest.fixture(autouse=True)
+def session_dir(tmp_path, monkeypatch):
+    # SESSIONS_DIR e storage.TMP_DIR são relativos ao diretório de trabalho
+    monkeypatch.chdir(tmp_path)
+    resumable._hashers.clear()
+    yield
+    resumable._hashers.clear()
+
+
+def send(upload_id: str, offset: int, data: bytes):
+    writer = resumable.ChunkWriter(upload_id, offset)
+    try:
+        writer.write(data)
+    finally:
+        writer.close()
+
+
+def test_part_on_another_worker_continues_hash_from_disk():
+    data = os.urandom(300_000)
+    upload_id = resumable.create("video.mp4", len(data))["id"]
+    send(upload_id, 0, data[:100_000])
+    # A parte seguinte chega a um worker que nunca viu esta sessão
+    resumable._hashers.clear()
+    send(upload_id, 100_000, data[100_000:200_000])
+    hasher = resumable._hashers[upload_id]
+    assert hasher.valid and hasher.offset == 200_000
+    send(upload_id, 200_000, data[200_000:])
+    assert resumable._hashers[upload_id].offset == len(data)
+
+    _, tmp_path, digest = resumable.claim(upload_id)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert tmp_path.read_bytes() == data
+
+
+def test_out_of_order_parts_still_produce_the_right_digest():
+    data = os.urandom(200_000)
+    upload_id = resumable.create("video.mp4", len(data))["id"]
+    send(upload_id, 100_000, data[100_000:])
+    resumable._hashers.clear()
+    send(upload_id, 0, data[:100_000])
+    _, _, digest = resumable.claim(upload_id)
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_collect_expired_drops_hashers_of_sessions_gone_elsewhere():
+    expired = resumable.create("a.mp3", 10)["id"]
+    finished_elsewhere = resumable.create("b.mp3", 10)["id"]
+    active = resumable.create("c.mp3", 10)["id"]
+    # Outro worker finalizou esta sessão: o diretório sumiu, o hasher local ficou
+    resumable.abort(finished_elsewhere)
+    resumable._hashers[finished_elsewhere] = resumable._Hasher()
+
+    old = time.time() - resumable.SESSION_TTL - 10
+    for name in ("data", "info.json"):
+        os.utime(resumable.SESSIONS_DIR / expired / name, (old, old))
+
+    assert resumable.collect_expired() == 1
+    assert set(resumable._hashers) == {active}
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from app import search
+
+
+def test_worker_detects_index_created_by_parent(run_app):
+    # Processo principal (run.py): prepara o banco e cria o índice
+    run_app("""
+        from app.main import prepare
+        prepare()
+    """)
+    # Worker: APP_PREPARED=1, o lifespan não roda DDL mas deve achar o índice
+    output = run_app("""
+        from fastapi.testclient import TestClient
+        from app import search
+        from app.main import app
+
+        with TestClient(app) as client:
+            assert search.search_backend() == "sqlite"
+            created = client.post("/media", json={"filename": "canção.mp3", "title": "Canção do Mar", "type": "audio", "path": "x.mp3"})
+            assert created.status_code == 200, created.text
+            found = client.get("/media/search/cancao")
+            assert [m["title"] for m in found.json()] == ["Canção do Mar"]
+        print(search.search_backend())
+    """, APP_PREPARED="1")
+    assert output.strip().endswith("sqlite")
+
+
+def test_worker_without_index_falls_back_to_like(run_app):
+    output = run_app("""
+        from app.main import Base, engine
+        from app.search import detect_search_index
+        Base.metadata.create_all(engine)
+        print(detect_search_index(engine))
+    """)
+    assert output.strip() == "None"
+
+
+class CapturingSession:
+    """Guarda o SQL executado por search_media_ids (sem banco)"""
+
+    def execute(self, statement, params):
+        self.sql, self.params = str(statement), params
+        return []
+
+
+@pytest.mark.parametrize("index", list(search._PG_INDEXES))
+def test_postgres_query_uses_the_indexed_document(monkeypatch, index):
+    monkeypatch.setattr(search, "_backend", "postgresql")
+    monkeypatch.setattr(search, "_pg_index", index)
+    db = CapturingSession()
+    search.search_media_ids(db, "Canção do mar")
+    document, tsquery = search._PG_INDEXES[index]
+    ddl = search._PG_UNACCENT_DDL if index == "ix_media_search_unaccent" else search._PG_DDL
+    # A expressão do índice aparece igual na consulta (senão o GIN não é usado)
+    assert f"{index} ON media USING GIN (({document}))" in " ".join(ddl)
+    assert f"WHERE ({document}) @@ q" in db.sql
+    assert db.params["query"] == "canção:* & do:* & mar:*"
+    if index == "ix_media_search_unaccent":
+        # Documento e consulta sem acentos: "cancao" e "canção" casam com "Canção"
+        assert document.count("media_unaccent(") == 3
+        assert "media_unaccent(:query)" in tsquery
+
+
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL não definida")
+def test_postgres_search_ignores_accents(run_app):
+    output = run_app("""
+        from fastapi.testclient import TestClient
+        from app import search
+        from app.main import app, prepare
+
+        prepare()
+        with TestClient(app) as client:
+            created = client.post("/media", json={"filename": "a.mp3", "title": "Canção do Mar", "type": "audio", "path": "a.mp3"}).json()
+            try:
+                for query in ("cancao", "CANÇÃO", "mar"):
+                    found = [m["id"] for m in client.get(f"/media/search/{query}").json()]
+                    assert created["id"] in found, query
+            finally:
+                client.delete(f"/media/{created['id']}")
+        print(search._pg_index)
+    """, DATABASE_URL=os.environ["TEST_POSTGRES_URL"])
+    assert output.strip().endswith("ix_media_search_unaccent")
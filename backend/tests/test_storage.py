@@ -0,0 +1,143 @@
+def test_upload_between_delete_commit_and_unlink_keeps_the_file(run_app):
+    output = run_app("""
+        import io
+        from pathlib import Path
+
+        from fastapi.testclient import TestClient
+        import app.main as main
+        from app import storage
+
+        content = b"mesmo conteudo" * 1000
+        remove_stored_files = main.remove_stored_files
+
+        def racing_remove(paths):
+            # Upload do mesmo conteúdo depois do commit da exclusão, antes do unlink
+            tmp_path, digest, size = storage.receive_stream(io.BytesIO(content))
+            db = main.SessionLocal()
+            try:
+                racing_remove.media = main.create_uploaded_media(db, "b.mp4", "video", tmp_path, digest, size)
+            finally:
+                db.close()
+            remove_stored_files(paths)
+
+        with TestClient(main.app) as client:
+            first = client.post("/media/upload", files={"file": ("a.mp4", content, "video/mp4")}).json()
+            main.remove_stored_files = racing_remove
+            assert client.delete(f"/media/{first['id']}").status_code == 200
+            main.remove_stored_files = remove_stored_files
+
+            second = racing_remove.media
+            response = client.get(f"/media/file/{second['id']}")
+            assert response.status_code == 200, response.text
+            assert response.content == content
+
+            # Sem outras referências, a exclusão apaga o arquivo
+            path = main.SessionLocal().get(main.Media, second["id"]).path
+            assert client.delete(f"/media/{second['id']}").status_code == 200
+            print(Path(path).exists())
+    """)
+    assert output.strip().splitlines()[-1] == "False"
+
+
+def test_client_written_cover_keeps_reference_counts(run_app):
+    output = run_app("""
+        from pathlib import Path
+
+        from fastapi.testclient import TestClient
+        from app import storage
+        from app.main import Blob, SessionLocal, acquire_blob, app
+
+        def refs():
+            db = SessionLocal()
+            try:
+                return {Path(blob.path).read_bytes().decode(): blob.ref_count for blob in db.query(Blob)}
+            finally:
+                db.close()
+
+        with TestClient(app) as client:
+            # Capas já gravadas (como as extraídas dos metadados), ainda sem mídia
+            covers = {}
+            db = SessionLocal()
+            for name in ("A", "B"):
+                path, digest = storage.store_bytes(f"capa {name}".encode(), storage.COVERS_DIR, ".jpg")
+                covers[name] = path.as_posix()
+                acquire_blob(db, covers[name], digest, 6, 0)
+            db.commit()
+            db.close()
+
+            ids = {
+                name: client.post("/media", json={"filename": f"{name}.mp3", "type": "audio",
+                                                  "path": f"{name}.mp3", "cover": covers[name]}).json()["id"]
+                for name in ("A", "B")
+            }
+            assert refs() == {"capa A": 1, "capa B": 1}
+
+            # B passa a usar a capa de A: a antiga de B fica sem referência e é apagada
+            assert client.put(f"/media/{ids['B']}", json={"cover": covers["A"]}).status_code == 200
+            assert refs() == {"capa A": 2} and not Path(covers["B"]).exists()
+
+            # Excluir B não apaga a capa ainda usada por A
+            assert client.delete(f"/media/{ids['B']}").status_code == 200
+            assert refs() == {"capa A": 1} and Path(covers["A"]).exists()
+
+            assert client.delete(f"/media/{ids['A']}").status_code == 200
+            print(refs(), Path(covers["A"]).exists())
+    """)
+    assert output.strip().splitlines()[-1] == "{} False"
+
+
+def test_bulk_cover_updates_keep_reference_counts(run_app):
+    output = run_app("""
+        import time
+        from pathlib import Path
+
+        from fastapi.testclient import TestClient
+        from app import storage
+        from app.main import Blob, SessionLocal, acquire_blob, app
+
+        def refs():
+            db = SessionLocal()
+            try:
+                return {Path(blob.path).read_bytes().decode(): blob.ref_count for blob in db.query(Blob)}
+            finally:
+                db.close()
+
+        def wait_removed(path):
+            # Arquivos sem referência são apagados pela fila file-cleanup
+            deadline = time.monotonic() + 10
+            while Path(path).exists() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            return not Path(path).exists()
+
+        with TestClient(app) as client:
+            covers = {}
+            db = SessionLocal()
+            for name in ("A", "B"):
+                path, digest = storage.store_bytes(f"capa {name}".encode(), storage.COVERS_DIR, ".jpg")
+                covers[name] = path.as_posix()
+                acquire_blob(db, covers[name], digest, 6, 0)
+            db.commit()
+            db.close()
+            ids = {
+                name: client.post("/media", json={"filename": f"{name}.mp3", "type": "audio",
+                                                  "path": f"{name}.mp3", "cover": covers.get(name)}).json()["id"]
+                for name in ("A", "B", "C")
+            }
+
+            # Troca de capas no mesmo lote: o saldo é zero, nada é apagado
+            swap = [{"id": ids["A"], "cover": covers["B"]}, {"id": ids["B"], "cover": covers["A"]}]
+            assert client.post("/media/batch/update", json={"items": swap}).status_code == 200
+            assert refs() == {"capa A": 1, "capa B": 1}
+
+            # Todas com a capa A: a B fica sem referência e é apagada
+            items = [{"id": ids[name], "cover": covers["A"]} for name in ("A", "B", "C")]
+            assert client.post("/media/batch/update", json={"items": items}).status_code == 200
+            assert wait_removed(covers["B"])
+            assert refs() == {"capa A": 3}
+
+            assert client.post("/media/batch/delete", json={"ids": [ids["B"], ids["C"]]}).status_code == 200
+            assert refs() == {"capa A": 1}
+            time.sleep(0.2)
+            print(Path(covers["A"]).exists())
+    """)
+    assert output.strip().splitlines()[-1] == "True"